@@ -0,0 +1,176 @@
+"""Benchmark cases for benchmarks/run.py.
+
+Every case is a function that does its setup and returns the operation to
+time. It may also return a function giving the seconds libqalculate itself
+spends on one operation, measured natively, so that the runner can report
+the binding overhead separately.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import qalculate
+from qalculate import MathStructure as S, Number
+
+Operation = Callable[[], object]
+NativeTime = Callable[[], float]
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[], tuple[Operation, Optional[NativeTime]]]
+
+
+CASES: list[Case] = []
+
+
+def case(name: str):
+    def register(setup: Callable[[], tuple[Operation, Optional[NativeTime]]]):
+        CASES.append(Case(name, setup))
+        return setup
+
+    return register
+
+
+EXPRESSION = "5 m/s + sqrt(2) * 3 km/h"
+PRINTABLE = "2^100 + 1/3"
+
+
+def load_definitions() -> None:
+    qalculate.load_global_prefixes()
+    qalculate.load_global_units()
+    qalculate.load_global_variables()
+    qalculate.load_global_functions()
+
+
+def native_times(expression: str, to: str = "") -> tuple[float, float, float]:
+    # The fastest of a few runs, like the runner does for the wall times.
+    results = [qalculate.calculate_ex(expression, to=to) for _ in range(20)]
+    return (
+        min(result.parse_time for result in results),
+        min(result.eval_time for result in results),
+        min(result.print_time for result in results),
+    )
+
+
+@case("noop")
+def _noop():
+    # The floor for any call into the module.
+    return qalculate.get_precision, None
+
+
+@case("parse")
+def _parse():
+    return (lambda: qalculate.parse(EXPRESSION)), (lambda: native_times(EXPRESSION)[0])
+
+
+@case("calculate")
+def _calculate():
+    parsed = qalculate.parse(EXPRESSION)
+    return (lambda: qalculate.calculate(parsed)), (lambda: native_times(EXPRESSION)[1])
+
+
+@case("calculate_string")
+def _calculate_string():
+    def native() -> float:
+        parse_time, eval_time, _ = native_times(EXPRESSION)
+        return parse_time + eval_time
+
+    return (lambda: qalculate.calculate(EXPRESSION)), native
+
+
+@case("calculate_and_print")
+def _calculate_and_print():
+    return (lambda: qalculate.calculate_and_print(PRINTABLE)), (
+        lambda: sum(native_times(PRINTABLE))
+    )
+
+
+@case("print")
+def _print():
+    result = qalculate.calculate(PRINTABLE)
+    return result.print, (lambda: native_times(PRINTABLE)[2])
+
+
+@case("convert_string_target")
+def _convert_string_target():
+    value = qalculate.parse("5 ft")
+    return (lambda: qalculate.calculate(value, to="m")), (
+        lambda: native_times("5 ft", to="m")[1]
+    )
+
+
+@case("convert_target")
+def _convert_target():
+    value = qalculate.parse("5 ft")
+    meters = qalculate.target("m")
+    return (lambda: qalculate.calculate(value, to=meters)), None
+
+
+@case("converter_scalar")
+def _converter_scalar():
+    feet = qalculate.converter("ft", "m")
+    return (lambda: feet(5.0)), None
+
+
+@case("converter_1000")
+def _converter_list():
+    feet = qalculate.converter("ft", "m")
+    values = [float(i) for i in range(1000)]
+    return (lambda: feet(values)), None
+
+
+@case("number_add")
+def _number_add():
+    a, b = Number(12345), Number(0.5)
+    return (lambda: a + b), None
+
+
+@case("number_multiply")
+def _number_multiply():
+    a, b = Number(2**80), Number(3**40)
+    return (lambda: a * b), None
+
+
+@case("int_to_number")
+def _int_to_number():
+    value = 2**200 + 12345
+    return (lambda: Number(value)), None
+
+
+@case("number_to_int")
+def _number_to_int():
+    number = Number(2**200 + 12345)
+    return (lambda: int(number)), None
+
+
+@case("structure_construct")
+def _structure_construct():
+    def build() -> S:
+        return S.Addition(
+            S.Multiplication(S.Number(2), S.Number(3)),
+            S.Power(S.Number(5), S.Number(2)),
+            S.Number(7),
+        )
+
+    return build, None
+
+
+@case("structure_traverse")
+def _structure_traverse():
+    tree = qalculate.parse(" + ".join(f"{i} * x^{i}" for i in range(1, 30)))
+
+    def walk(node: S) -> int:
+        count = 1
+        for i in range(len(node)):
+            count += walk(node[i])
+        return count
+
+    return (lambda: walk(tree)), None
+
+
+@case("repr")
+def _repr():
+    parsed = qalculate.parse(EXPRESSION)
+    return (lambda: repr(parsed)), None
@@ -0,0 +1,88 @@
+"""Measures how long `import qalculate` takes in a fresh interpreter.
+
+Usage: python benchmarks/import_time.py [--runs N] [--json FILE]
+
+The module is looked up in ./build by default, like the tests.
+"""
+
+from pathlib import Path
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+def measure_once(pythonpath: str) -> tuple[float, float]:
+    """Returns (wall time, self time of the qalculate import) in seconds."""
+
+    env = dict(os.environ, PYTHONPATH=pythonpath)
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import time, sys\n"
+            "start = time.perf_counter()\n"
+            "import qalculate\n"
+            "print(time.perf_counter() - start)",
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    self_time = None
+    # Lines look like "import time:   1234 |   5678 | qalculate"
+    for line in result.stderr.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        fields = [field.strip() for field in line[len(IMPORT_TIME_PREFIX) :].split("|")]
+        if fields[2] == "qalculate":
+            self_time = int(fields[0]) / 1e6
+    if self_time is None:
+        raise RuntimeError("qalculate did not show up in -X importtime output")
+
+    return float(result.stdout), self_time
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    parser.add_argument(
+        "--pythonpath",
+        default=str(Path(__file__).parent.parent / "build"),
+        help="where to find the qalculate module",
+    )
+    args = parser.parse_args()
+
+    measure_once(args.pythonpath)  # warm up the page cache
+    samples = [measure_once(args.pythonpath) for _ in range(args.runs)]
+    wall = [sample[0] for sample in samples]
+    own = [sample[1] for sample in samples]
+
+    results = {
+        "runs": args.runs,
+        "wall_min": min(wall),
+        "wall_median": statistics.median(wall),
+        "self_min": min(own),
+        "self_median": statistics.median(own),
+    }
+    for key, value in results.items():
+        if isinstance(value, float):
+            print(f"{key:>12}: {value * 1000:8.2f} ms")
+        else:
+            print(f"{key:>12}: {value}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
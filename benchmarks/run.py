@@ -0,0 +1,155 @@
+"""Runs the benchmark cases in benchmarks/cases.py.
+
+Usage: python benchmarks/run.py [--filter TEXT] [--json FILE]
+                                [--baseline FILE] [--threshold FRACTION]
+
+Every case is timed in several batches that each run for at least
+--min-time seconds. The fastest and the median per-operation latency
+are reported, along with the throughput at the median. Some cases also
+measure the time libqalculate spends inside an operation. For those, the
+rest of the latency is reported as binding overhead.
+
+Given a --baseline written by an earlier --json, every case whose median
+latency grew by more than --threshold is reported as a regression, and the
+script exits with status 1.
+"""
+
+from pathlib import Path
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+
+def time_case(operation, min_time: float, repeat: int) -> list[float]:
+    """Returns the per-operation latency of every batch in seconds."""
+
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            operation()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        iterations *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+    samples = [elapsed / iterations]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            operation()
+        samples.append((time.perf_counter() - start) / iterations)
+    return samples
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+
+def run(cases, min_time: float, repeat: int) -> dict[str, dict[str, float]]:
+    results = {}
+    print(f"{'case':<24}{'median':>12}{'min':>12}{'ops/s':>14}{'overhead':>12}")
+    for case in cases:
+        operation, native = case.setup()
+        samples = time_case(operation, min_time, repeat)
+        median = statistics.median(samples)
+        result = {
+            "median": median,
+            "min": min(samples),
+            "throughput": 1 / median,
+        }
+        overhead = ""
+        if native is not None:
+            native_time = native()
+            result["native"] = native_time
+            # Compared against the fastest batch since native is a minimum too.
+            result["overhead"] = max(result["min"] - native_time, 0.0)
+            overhead = format_time(result["overhead"])
+        results[case.name] = result
+        print(
+            f"{case.name:<24}{format_time(median):>12}{format_time(result['min']):>12}"
+            f"{result['throughput']:>14.0f}{overhead:>12}"
+        )
+    return results
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+) -> list[str]:
+    regressions = []
+    print(f"\n{'case':<24}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["median"]
+        change = result["median"] / before - 1
+        marker = ""
+        if change > threshold:
+            regressions.append(name)
+            marker = "  REGRESSION"
+        print(
+            f"{name:<24}{format_time(before):>12}{format_time(result['median']):>12}"
+            f"{change:>+10.1%}{marker}"
+        )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="only run cases containing this")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    parser.add_argument("--min-time", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--json", type=Path, help="write the results here")
+    parser.add_argument("--baseline", type=Path, help="results to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown counted as a regression (default: 0.1)",
+    )
+    parser.add_argument(
+        "--pythonpath",
+        default=str(Path(__file__).parent.parent / "build"),
+        help="where to find the qalculate module",
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.pythonpath)
+    from cases import CASES, load_definitions
+
+    cases = [case for case in CASES if args.filter in case.name]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return
+
+    load_definitions()
+    results = run(cases, args.min_time, args.repeat)
+
+    if args.json:
+        document = {
+            "python": sys.version,
+            "platform": platform.platform(),
+            "results": results,
+        }
+        args.json.write_text(json.dumps(document, indent=2) + "\n")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Measures how expression evaluation scales with threads and processes.
+
+Usage: python benchmarks/scaling.py [--max-workers N] [--duration SECONDS]
+                                    [--mode MODE ...] [--json FILE]
+
+Every mode is run with 1, 2, 4, ... up to --max-workers workers, each
+evaluating expressions for --duration seconds:
+
+threads            threads calling calculate_and_print, which releases the GIL
+threads-options    the same inside `with qalculate.options(...)`
+threads-precision  the same inside `with qalculate.options(precision=...)`,
+                   which takes exclusive access to the calculator
+processes          a qalculate.pool.ProcessPool with that many workers
+batcher            that many asyncio tasks submitting to one Batcher
+
+For every worker count the throughput, the speedup over one worker, the
+p50 and p99 latency and the efficiency (speedup divided by the number of
+workers) are reported. An efficiency well below 1 for the threaded modes
+means the calls are serialized, by the GIL or by the shared calculator.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+EXPRESSIONS = [
+    "sqrt(2) * 3 km/h to m/s",
+    "integrate(x^2 * sin(x), 0, pi)",
+    "2^200 mod 1000007",
+    "solve(x^2 - 5x + 6 = 0, x)",
+    "10 ft + 3 m",
+    "factorial(40) / factorial(38)",
+]
+
+MODES = ["threads", "threads-options", "threads-precision", "processes", "batcher"]
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def run_threads(workers: int, duration: float, context) -> list[float]:
+    import qalculate
+
+    latencies: list[list[float]] = [[] for _ in range(workers)]
+    start_barrier = threading.Barrier(workers + 1)
+    deadline = 0.0
+
+    def worker(index: int) -> None:
+        own = latencies[index]
+        with context():
+            start_barrier.wait()
+            i = index
+            while time.perf_counter() < deadline:
+                expression = EXPRESSIONS[i % len(EXPRESSIONS)]
+                begin = time.perf_counter()
+                qalculate.calculate_and_print(expression)
+                own.append(time.perf_counter() - begin)
+                i += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    deadline = time.perf_counter() + duration
+    start_barrier.wait()
+    for thread in threads:
+        thread.join()
+    return [latency for own in latencies for latency in own]
+
+
+def run_processes(workers: int, duration: float) -> list[float]:
+    from qalculate.pool import ProcessPool
+
+    latencies = []
+    # A few expressions per worker, so that every chunk keeps all of them busy.
+    chunk = [EXPRESSIONS[i % len(EXPRESSIONS)] for i in range(4 * workers)]
+    with ProcessPool(workers=workers, preload=["units", "functions"]) as pool:
+        pool.calculate_and_print(chunk)
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            begin = time.perf_counter()
+            pool.calculate_and_print(chunk)
+            # Every expression in the chunk waits for the whole chunk.
+            latencies.extend([time.perf_counter() - begin] * len(chunk))
+    return latencies
+
+
+def run_batcher(workers: int, duration: float) -> list[float]:
+    import qalculate
+
+    async def main() -> list[float]:
+        latencies = []
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = qalculate.Batcher(executor=executor)
+            deadline = time.perf_counter() + duration
+
+            async def submitter(index: int) -> None:
+                i = index
+                while time.perf_counter() < deadline:
+                    begin = time.perf_counter()
+                    await batcher.submit(EXPRESSIONS[i % len(EXPRESSIONS)])
+                    latencies.append(time.perf_counter() - begin)
+                    i += 1
+
+            await asyncio.gather(*(submitter(i) for i in range(workers)))
+        return latencies
+
+    return asyncio.run(main())
+
+
+def measure(mode: str, workers: int, duration: float) -> list[float]:
+    import qalculate
+
+    if mode == "threads":
+        return run_threads(workers, duration, nullcontext)
+    if mode == "threads-options":
+        return run_threads(
+            workers,
+            duration,
+            lambda: qalculate.options(approximation=qalculate.ApproximationMode.EXACT),
+        )
+    if mode == "threads-precision":
+        return run_threads(workers, duration, lambda: qalculate.options(precision=20))
+    if mode == "processes":
+        return run_processes(workers, duration)
+    if mode == "batcher":
+        return run_batcher(workers, duration)
+    raise ValueError(f"unknown mode {mode!r}")
+
+
+def worker_counts(maximum: int) -> list[int]:
+    counts = []
+    count = 1
+    while count < maximum:
+        counts.append(count)
+        count *= 2
+    counts.append(maximum)
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--duration", type=float, default=2.0)
+    parser.add_argument("--mode", action="append", choices=MODES)
+    parser.add_argument("--json", type=Path, help="write the results here")
+    parser.add_argument(
+        "--pythonpath",
+        default=str(Path(__file__).parent.parent / "build"),
+        help="where to find the qalculate module",
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, args.pythonpath)
+    import qalculate
+
+    qalculate.load_global_prefixes()
+    qalculate.load_global_units()
+    qalculate.load_global_functions()
+    qalculate.load_global_variables()
+
+    results: dict[str, list[dict[str, float]]] = {}
+    for mode in args.mode or MODES:
+        print(f"{mode}:")
+        print(
+            f"{'workers':>8}{'ops/s':>12}{'speedup':>10}{'efficiency':>12}"
+            f"{'p50':>12}{'p99':>12}"
+        )
+        rows = results[mode] = []
+        for workers in worker_counts(args.max_workers):
+            latencies = sorted(measure(mode, workers, args.duration))
+            throughput = len(latencies) / args.duration
+            speedup = throughput / rows[0]["throughput"] if rows else 1.0
+            row = {
+                "workers": workers,
+                "throughput": throughput,
+                "speedup": speedup,
+                "efficiency": speedup / workers,
+                "p50": percentile(latencies, 0.50),
+                "p99": percentile(latencies, 0.99),
+            }
+            rows.append(row)
+            print(
+                f"{workers:>8}{throughput:>12.0f}{speedup:>10.2f}"
+                f"{row['efficiency']:>12.0%}{row['p50'] * 1e3:>9.3f} ms"
+                f"{row['p99'] * 1e3:>9.3f} ms"
+            )
+        print()
+
+    if args.json:
+        document = {
+            "python": sys.version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "duration": args.duration,
+            "results": results,
+        }
+        args.json.write_text(json.dumps(document, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -88,6 +88,10 @@ function(build_binary_wheel)
 
 	file(WRITE "${DISTINFO_DIR}/top_level.txt" "${T_NAME}\n")
 
+	string(APPEND ENTRY_POINTS "[console_scripts]\n")
+	string(APPEND ENTRY_POINTS "${T_NAME} = ${T_NAME}:main\n")
+	file(WRITE "${DISTINFO_DIR}/entry_points.txt" "${ENTRY_POINTS}")
+
 	set(EXTLIBNAME "${T_NAME}.${Python_SOABI}${CMAKE_SHARED_LIBRARY_SUFFIX}")
 
 	add_copy_command(
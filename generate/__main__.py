@@ -208,6 +208,7 @@ header.write(
 #include <pybind11/operators.h>
 #include <pybind11/pybind11.h>
 #include <libqalculate/qalculate.h>
+#include <typeinfo>
 #include "ref.hh"
 """
 )
@@ -300,6 +301,7 @@ def options(
     exclude: set[str] = set(),
     define_new_default=False,
     pass_by_type: dict[str, str] = {},
+    hashable=False,
 ):
     defaults_name = f"global_{pascal_to_snake(pyclass.name)}"
 
@@ -346,11 +348,42 @@ def options(
         options.keys(),
     )
 
+    # Used by frozen options (see frozen.hh). Excluded pointers still tell
+    # options apart, other excluded fields cannot be hashed generically.
+    if hashable:
+        hashed = [
+            field.name
+            for field in pyclass.underlying_type.fields.values()
+            if field.accessibility == Accessibility.PUBLIC
+            and (field.name in options or str(field.type).endswith("*"))
+        ]
+
+        with function_declaration(
+            f"size_t options_hash({pyclass.name} const &options)"
+        ):
+            impl.write("size_t seed = 0;\n")
+            for name in hashed:
+                impl.write(f"hash_option(seed, options.{name});\n")
+            impl.write("return seed;\n")
+
+        with function_declaration(
+            f"bool options_equal({pyclass.name} const &a, {pyclass.name} const &b)"
+        ):
+            for name in hashed:
+                impl.write(f"if(!option_equal(a.{name}, b.{name})) return false;\n")
+            impl.write("return true;\n")
+
 
 enums: list[str] = []
 
 
-def enum(name: str, prefix: str | None = None, writer: IndentedWriter = impl):
+def enum(
+    name: str,
+    prefix: str | None = None,
+    writer: IndentedWriter = impl,
+    *,
+    name_function: bool = False,
+):
     enums.append(name)
     classes.add_foreign(name, name)
     enum = qalculate_sources.enum(name)
@@ -375,6 +408,21 @@ def enum(name: str, prefix: str | None = None, writer: IndentedWriter = impl):
 
     typings.write(f"__members__: typing.ClassVar[dict[str, {name}]]\n")
 
+    # Lets native code (like MathStructure_repr) name variants without a
+    # round-trip through the Python enum object.
+    if name_function:
+        with function_declaration(
+            f"char const *enum_name({name} value)",
+            impl=writer,
+        ):
+            writer.write("switch(value) {\n")
+            for variant in enum.members:
+                with writer.indent(f"case {name}::{variant.name}:\n"):
+                    pyvariant = variant.name.removeprefix(prefix)
+                    writer.write(f"return {cpp_string(pyvariant)};\n")
+            writer.write("}\n")
+            writer.write("return nullptr;\n")
+
     # TODO: Generate these members for enums (pybind11-stubgen does)
     # def __eq__(self, other: typing.Any) -> bool:
     #     ...
@@ -408,7 +456,7 @@ with output_directory.writer("enums.cc") as writer:
     enum("NumberFractionFormat", "FRACTION_", writer)
     enum("StructuringMode", "STRUCTURING_", writer)
     enum("AutoPostConversion", "POST_CONVERSION_", writer)
-    enum("ComparisonType", "COMPARISON_", writer)
+    enum("ComparisonType", "COMPARISON_", writer, name_function=True)
     enum("RoundingMode", "ROUNDING_", writer)
     enum("MessageType", "MESSAGE_", writer)
     enum("AutomaticFractionFormat", "AUTOMATIC_FRACTION_", writer)
@@ -442,8 +490,9 @@ with output_directory.writer("enums.cc") as writer:
 
 impl.write('#include "wrappers.hh"\n')
 impl.write('#include "options.hh"\n')
+impl.write('#include "frozen.hh"\n')
 
-options(classes["SortOptions"])
+options(classes["SortOptions"], hashable=True)
 options(
     classes["PrintOptions"],
     exclude={
@@ -452,11 +501,17 @@ options(
         "can_display_unicode_string_arg",
         "can_display_unicode_string_function",
     },
+    hashable=True,
+)
+options(
+    classes["ParseOptions"],
+    exclude={"unended_function", "default_dataset"},
+    hashable=True,
 )
-options(classes["ParseOptions"], exclude={"unended_function", "default_dataset"})
 options(
     classes["EvaluationOptions"],
     exclude={"isolate_var", "protected_function"},
+    hashable=True,
 )
 
 
@@ -637,7 +692,7 @@ math_structure_method_whitelist = {
 math_structure_overrides: dict[str, tuple[str | None, str]] = {
     "EvaluationOptions": (
         "PEvaluationOptions",  # overriden type
-        "PEvaluationOptions(global_evaluation_options)",  # overriden default value
+        "&global_evaluation_options",  # overriden default value
     ),
     "timeval": (None, "static_cast<struct timeval*>(nullptr)"),
 }
@@ -702,6 +757,9 @@ impl.write('#include "proxies.hh"\n')
 with function_declaration(
     "void MathStructure_repr(MathStructure const *mstruct, std::string &output)"
 ):
+    impl.write("ReprDepthGuard depth_guard(output);\n")
+    with impl.indent("if(!depth_guard)\n"):
+        impl.write("return;\n")
     impl.write("switch(mstruct->type()) {\n")
     for name in structure_types:
         with impl.indent(f"case STRUCT_{name}:\n"):
@@ -714,6 +772,7 @@ with function_declaration(
         )
         impl.write("break;\n")
     impl.write("}\n")
+    impl.write("repr_maybe_flush(output);\n")
 
 with function_declaration(
     f"{MATH_STRUCTURE_CLASS}& add_math_structure_proxies({MATH_STRUCTURE_CLASS}& class_)"
@@ -862,11 +921,26 @@ for pyclass in classes:
 
     pyclass.write_types(typings, classes, apply_implicit_casts=False)
 
-with function_declaration("void add_builtin_functions(pybind11::module_ &m)"):
-    for pyclass in builtin_function_classes:
-        impl.write("(void)")
-        pyclass.write_pyclass_expression(impl, "m")
-        impl.write(";\n")
+# There are a lot of these and few are ever looked at, so they are only
+# registered once accessed (see lazy.cc).
+header.write(
+    "struct BuiltinFunctionClass {\n"
+    "  char const *name;\n"
+    "  std::type_info const &type;\n"
+    "  void (*add)(pybind11::module_ &m);\n"
+    "};\n"
+)
+header.write(f"extern BuiltinFunctionClass const builtin_function_classes[{len(builtin_function_classes)}];\n")
+impl.indent(f"BuiltinFunctionClass const builtin_function_classes[{len(builtin_function_classes)}] = {{\n")
+for pyclass in builtin_function_classes:
+    impl.indent(
+        f"{{{cpp_string(pyclass.name)}, typeid({pyclass.name}), [](pybind11::module_ &m) {{\n"
+    )
+    impl.write("(void)")
+    pyclass.write_pyclass_expression(impl, "m")
+    impl.write(";\n")
+    impl.dedent("}},\n")
+impl.dedent("};\n")
 
 
 header.close()
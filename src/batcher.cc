@@ -0,0 +1,164 @@
+#include "batcher.hh"
+
+#include <algorithm>
+#include <pybind11/stl.h>
+#include <stdexcept>
+#include <utility>
+
+#include "calculation.hh"
+#include "context.hh"
+
+namespace {
+
+size_t bucket(size_t value) {
+  size_t bound = 1;
+  while (bound < value)
+    bound <<= 1;
+  return bound;
+}
+
+} // namespace
+
+Batcher::Batcher(size_t max_batch_size, double window,
+                 std::optional<PEvaluationOptions> eval_options,
+                 std::optional<PrintOptions> print_options, py::object executor)
+    : max_batch_size(max_batch_size), window(window),
+      eval_options(std::move(eval_options)),
+      print_options(std::move(print_options)), executor(std::move(executor)),
+      timer(py::none()) {}
+
+size_t Batcher::pending() const {
+  size_t result = 0;
+  for (auto const &batch : batches)
+    result += batch.expressions.size();
+  return result;
+}
+
+py::object Batcher::submit(py::object self, std::string expression) {
+  auto &batcher = self.cast<Batcher &>();
+  py::object loop = py::module_::import("asyncio").attr("get_running_loop")();
+  if ((batcher.in_flight || !batcher.batches.empty()) && !batcher.loop.is(loop))
+    throw std::runtime_error("Batcher is already in use by another event loop");
+  batcher.loop = loop;
+
+  py::object overrides = current_options_overrides();
+  auto batch = std::find_if(batcher.batches.begin(), batcher.batches.end(),
+                            [&overrides](PendingBatch const &b) {
+                              return b.overrides.is(overrides);
+                            });
+  if (batch == batcher.batches.end()) {
+    batcher.batches.push_back(
+        {overrides,
+         py::module_::import("contextvars").attr("copy_context")(),
+         {},
+         {}});
+    batch = batcher.batches.end() - 1;
+  }
+
+  py::object future = loop.attr("create_future")();
+  batch->expressions.push_back(std::move(expression));
+  batch->futures.append(future);
+  bool full = batch->expressions.size() >= batcher.max_batch_size;
+  ++batcher.queue_depths[bucket(batcher.pending())];
+
+  if (full)
+    flush(self);
+  else if (!batcher.in_flight && batcher.timer.is_none())
+    batcher.timer =
+        loop.attr("call_later")(batcher.window, py::cpp_function([self]() {
+                                  self.cast<Batcher &>().timer = py::none();
+                                  flush(self);
+                                }));
+  return future;
+}
+
+void Batcher::flush(py::object self) {
+  auto &batcher = self.cast<Batcher &>();
+  if (batcher.in_flight || batcher.batches.empty())
+    return;
+  if (!batcher.timer.is_none()) {
+    batcher.timer.attr("cancel")();
+    batcher.timer = py::none();
+  }
+
+  PendingBatch batch = std::move(batcher.batches.front());
+  batcher.batches.erase(batcher.batches.begin());
+  ++batcher.batch_sizes[bucket(batch.expressions.size())];
+  batcher.in_flight = true;
+
+  py::cpp_function run([self, expressions = std::move(batch.expressions)]() {
+    auto const &batcher = self.cast<Batcher const &>();
+    return calculate_batch(expressions,
+                           batcher.eval_options ? *batcher.eval_options
+                                                : global_evaluation_options,
+                           batcher.print_options ? *batcher.print_options
+                                                 : global_print_options);
+  });
+  py::list futures = batch.futures;
+  try {
+    // run_in_executor does not carry the context over by itself.
+    batcher.loop
+        .attr("run_in_executor")(batcher.executor, batch.context.attr("run"),
+                                 run)
+        .attr("add_done_callback")(py::cpp_function(
+            [self, futures](py::object done) { finish(self, futures, done); }));
+  } catch (...) {
+    batcher.in_flight = false;
+    throw;
+  }
+}
+
+void Batcher::finish(py::object self, py::list futures, py::object done) {
+  auto &batcher = self.cast<Batcher &>();
+  batcher.in_flight = false;
+
+  if (done.attr("cancelled")().cast<bool>()) {
+    for (auto future : futures)
+      future.attr("cancel")();
+  } else if (py::object error = done.attr("exception")(); !error.is_none()) {
+    for (auto future : futures)
+      if (!future.attr("done")().cast<bool>())
+        future.attr("set_exception")(error);
+  } else {
+    py::list results = done.attr("result")();
+    for (size_t i = 0; i < futures.size(); ++i)
+      if (!futures[i].attr("done")().cast<bool>())
+        futures[i].attr("set_result")(results[i]);
+  }
+
+  // Whatever was submitted while the batch ran has waited long enough.
+  flush(self);
+}
+
+void add_batcher(py::module_ &m) {
+  py::class_<Batcher>(m, "Batcher")
+      .def(py::init([](size_t max_batch_size, double window,
+                       PEvaluationOptions const &eval_options,
+                       PrintOptions const &print_options, py::object executor) {
+             if (max_batch_size == 0)
+               throw py::value_error("max_batch_size must be positive");
+             if (window < 0)
+               throw py::value_error("window must not be negative");
+             // Only the global objects pick up context overrides.
+             std::optional<PEvaluationOptions> own_eval;
+             if (&eval_options != &global_evaluation_options)
+               own_eval = eval_options;
+             std::optional<PrintOptions> own_print;
+             if (&print_options != &global_print_options)
+               own_print = print_options;
+             return std::make_unique<Batcher>(
+                 max_batch_size, window, std::move(own_eval),
+                 std::move(own_print), std::move(executor));
+           }),
+           py::arg("max_batch_size") = 64, py::arg("window") = 0.001,
+           py::arg("eval_options") = &global_evaluation_options,
+           py::arg("print_options") = &global_print_options,
+           py::arg("executor") = py::none())
+      .def("submit", &Batcher::submit, py::arg("expression"))
+      .def("flush", &Batcher::flush)
+      .def_readonly("max_batch_size", &Batcher::max_batch_size)
+      .def_readonly("window", &Batcher::window)
+      .def_property_readonly("pending", &Batcher::pending)
+      .def_readonly("queue_depth_histogram", &Batcher::queue_depths)
+      .def_readonly("batch_size_histogram", &Batcher::batch_sizes);
+}
@@ -0,0 +1,60 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <map>
+#include <optional>
+#include <string>
+#include <vector>
+
+#include "wrappers.hh"
+
+// Coalesces expressions submitted from asyncio tasks into batches that are
+// evaluated with a single calculate_batch call in an executor. At most one
+// batch per batcher is in flight, expressions submitted meanwhile are sent
+// together once it finishes. Expressions are only batched with others submitted
+// under the same `with qalculate.options(...)` block, and are evaluated in a
+// copy of the context they were submitted from.
+class Batcher {
+public:
+  // Options left empty follow the global ones, and with them the overrides
+  // of the context the expressions were submitted from.
+  Batcher(size_t max_batch_size, double window,
+          std::optional<PEvaluationOptions> eval_options,
+          std::optional<PrintOptions> print_options, py::object executor);
+
+  static py::object submit(py::object self, std::string expression);
+  static void flush(py::object self);
+
+  size_t max_batch_size;
+  double window;
+  std::optional<PEvaluationOptions> eval_options;
+  std::optional<PrintOptions> print_options;
+  py::object executor;
+
+  // Keyed by the upper bound of power of two sized buckets.
+  std::map<size_t, size_t> queue_depths;
+  std::map<size_t, size_t> batch_sizes;
+
+  size_t pending() const;
+
+private:
+  struct PendingBatch {
+    // Options overrides the expressions were submitted under.
+    py::object overrides;
+    py::object context;
+    std::vector<std::string> expressions;
+    py::list futures;
+  };
+
+  // Oldest first.
+  std::vector<PendingBatch> batches;
+  // Loop the pending futures belong to.
+  py::object loop;
+  py::object timer;
+  bool in_flight = false;
+
+  static void finish(py::object self, py::list futures, py::object done);
+};
+
+void add_batcher(py::module_ &m);
@@ -0,0 +1,116 @@
+#include "calculation.hh"
+
+#include <chrono>
+#include <optional>
+#include <utility>
+
+#include "context.hh"
+#include "definitions.hh"
+#include "messages.hh"
+#include "stats.hh"
+
+namespace {
+
+CallStats &calculate_ex_stats = call_stats("calculate_ex");
+CallStats &calculate_batch_stats = call_stats("calculate_batch");
+
+// The messages collected per call are not queued, but still counted.
+void record_messages(CalculationResult const &result) {
+  for (auto const &message : result.messages)
+    StatsTimer::add_message(message);
+}
+
+// Messages are collected with libqalculate's temporary message stack, so only
+// those raised by this calculation end up in the result and none are left in
+// the global queue. The stack is shared by all threads, so this must be called
+// with exclusive access to the calculator, and with the context options
+// already applied.
+CalculationResult evaluate(std::string const &expression,
+                           PEvaluationOptions const &eval_options,
+                           PrintOptions const &print_options,
+                           Conversion const &to) {
+  using Clock = std::chrono::steady_clock;
+  auto seconds = [](Clock::duration duration) {
+    return std::chrono::duration<double>(duration).count();
+  };
+
+  CalculationResult output;
+  CALCULATOR->beginTemporaryStopMessages();
+
+  auto start = Clock::now();
+  MathStructure parsed =
+      CALCULATOR->parse(expression, eval_options.parse_options);
+  auto parse_end = Clock::now();
+  MathStructure result = calculate_to(parsed, eval_options, to);
+  auto eval_end = Clock::now();
+  MathStructure formatted(result);
+  formatted.format(print_options);
+  output.text = formatted.print(print_options);
+  auto print_end = Clock::now();
+
+  CALCULATOR->endTemporaryStopMessages(false, &output.messages);
+  output.result = MathStructureRef::adopt(result);
+  output.parse_time = seconds(parse_end - start);
+  output.eval_time = seconds(eval_end - parse_end);
+  output.print_time = seconds(print_end - eval_end);
+  return output;
+}
+
+} // namespace
+
+CalculationResult calculate_ex(std::string const &expression,
+                               PEvaluationOptions const &options,
+                               PrintOptions const &base_print_options,
+                               Conversion const &to) {
+  StatsTimer timer(calculate_ex_stats, expression);
+  load_definitions_for_expression(expression);
+  MessageGuard messages;
+
+  std::optional<PEvaluationOptions> context_options;
+  auto const &eval_options =
+      context_evaluation_options(options, context_options);
+  std::optional<PrintOptions> context_print;
+  auto const &print_options =
+      context_print_options(base_print_options, context_print);
+  timer.set_options(eval_options);
+  ContextPrecision precision;
+
+  std::optional<CalculationResult> result;
+  {
+    ContextGilRelease _gil(precision, CalculatorAccess::EXCLUSIVE);
+    result.emplace(evaluate(expression, eval_options, print_options, to));
+  }
+  record_messages(*result);
+  return std::move(*result);
+}
+
+std::vector<CalculationResult>
+calculate_batch(std::vector<std::string> const &expressions,
+                PEvaluationOptions const &options,
+                PrintOptions const &base_print_options) {
+  StatsTimer timer(calculate_batch_stats);
+  for (auto const &expression : expressions)
+    load_definitions_for_expression(expression);
+  MessageGuard messages;
+
+  std::optional<PEvaluationOptions> context_options;
+  auto const &eval_options =
+      context_evaluation_options(options, context_options);
+  std::optional<PrintOptions> context_print;
+  auto const &print_options =
+      context_print_options(base_print_options, context_print);
+  timer.set_options(eval_options);
+  ContextPrecision precision;
+
+  std::vector<CalculationResult> results;
+  results.reserve(expressions.size());
+  {
+    ContextGilRelease _gil(precision, CalculatorAccess::EXCLUSIVE);
+    for (auto const &expression : expressions)
+      results.push_back(
+          evaluate(expression, eval_options, print_options, Conversion()));
+  }
+  for (auto const &result : results)
+    record_messages(result);
+  return results;
+}
@@ -0,0 +1,35 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <libqalculate/qalculate.h>
+#include <string>
+#include <vector>
+
+#include "conversion.hh"
+#include "ref.hh"
+#include "wrappers.hh"
+
+struct CalculationResult {
+  MathStructureRef result;
+  std::string text;
+  std::vector<CalculatorMessage> messages;
+  double parse_time;
+  double eval_time;
+  double print_time;
+};
+
+// Both collect the messages of every expression with libqalculate's global
+// temporary message stack, so they need exclusive access to the calculator
+// and are serialized with all other calculations. Throughput comes from
+// making one call per expression (or batch) instead of two, not from
+// running them concurrently, use a ProcessPool for that.
+CalculationResult calculate_ex(std::string const &expression,
+                               PEvaluationOptions const &options,
+                               PrintOptions const &print_options,
+                               Conversion const &to);
+// Evaluates all expressions with a single GIL release.
+std::vector<CalculationResult>
+calculate_batch(std::vector<std::string> const &expressions,
+                PEvaluationOptions const &options,
+                PrintOptions const &print_options);
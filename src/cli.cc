@@ -0,0 +1,520 @@
+#include "cli.hh"
+
+#include <algorithm>
+#include <cerrno>
+#include <chrono>
+#include <cstdio>
+#include <cstring>
+#include <fcntl.h>
+#include <libqalculate/qalculate.h>
+#include <memory>
+#include <optional>
+#include <pybind11/stl.h>
+#include <string>
+#include <string_view>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <system_error>
+#include <thread>
+#include <unistd.h>
+#include <vector>
+
+#include "context.hh"
+#include "definitions.hh"
+#include "options.hh"
+#include "pool.hh"
+
+using namespace pybind11::literals;
+
+namespace {
+
+// Lines are evaluated and written in blocks of at most this many, so output
+// starts early and memory use does not grow with the input.
+constexpr size_t BLOCK_SIZE = 4096;
+
+class LineReader {
+public:
+  virtual ~LineReader() = default;
+  // Strips the line terminator, returns false at the end of the input.
+  virtual bool next(std::string_view &line) = 0;
+  // Whether next() can return without waiting for more input.
+  virtual bool buffered() const = 0;
+};
+
+// Regular files are mapped into memory and split in place.
+class MappedReader final : public LineReader {
+  char const *data = nullptr;
+  size_t size = 0;
+  size_t position = 0;
+
+public:
+  MappedReader(int fd, size_t size) : size(size) {
+    if (size == 0)
+      return;
+    void *mapping = mmap(nullptr, size, PROT_READ, MAP_PRIVATE, fd, 0);
+    if (mapping == MAP_FAILED)
+      throw std::system_error(errno, std::generic_category(), "mmap");
+    madvise(mapping, size, MADV_SEQUENTIAL);
+    data = static_cast<char const *>(mapping);
+  }
+  ~MappedReader() {
+    if (data)
+      munmap(const_cast<char *>(data), size);
+  }
+
+  bool next(std::string_view &line) override {
+    if (position >= size)
+      return false;
+    auto start = data + position;
+    auto end =
+        static_cast<char const *>(std::memchr(start, '\n', size - position));
+    size_t length = end ? end - start : size - position;
+    position += length + 1;
+    line = std::string_view(start, length);
+    return true;
+  }
+  bool buffered() const override { return true; }
+};
+
+// Pipes and terminals are read incrementally.
+class StreamReader final : public LineReader {
+  int fd;
+  std::string buffer;
+  size_t position = 0;
+  bool eof = false;
+
+public:
+  explicit StreamReader(int fd) : fd(fd) {}
+
+  bool next(std::string_view &line) override {
+    while (true) {
+      auto newline = buffer.find('\n', position);
+      if (newline != std::string::npos || (eof && position < buffer.size())) {
+        size_t end = newline == std::string::npos ? buffer.size() : newline;
+        line = std::string_view(buffer).substr(position, end - position);
+        position = end + 1;
+        return true;
+      }
+      if (eof)
+        return false;
+
+      buffer.erase(0, position);
+      position = 0;
+      char chunk[65536];
+      ssize_t count;
+      {
+        py::gil_scoped_release _gil;
+        do
+          count = ::read(fd, chunk, sizeof chunk);
+        while (count < 0 && errno == EINTR);
+      }
+      if (count < 0)
+        throw std::system_error(errno, std::generic_category(), "read");
+      if (count == 0)
+        eof = true;
+      buffer.append(chunk, count);
+    }
+  }
+  bool buffered() const override {
+    return buffer.find('\n', position) != std::string::npos;
+  }
+};
+
+struct Input {
+  std::string name;
+  int fd;
+  std::unique_ptr<LineReader> reader;
+
+  ~Input() {
+    if (fd > STDIN_FILENO)
+      ::close(fd);
+  }
+};
+
+std::unique_ptr<Input> open_input(std::string const &name) {
+  auto input = std::make_unique<Input>();
+  input->name = name == "-" ? "<stdin>" : name;
+  input->fd =
+      name == "-" ? STDIN_FILENO : ::open(name.c_str(), O_RDONLY | O_CLOEXEC);
+  if (input->fd < 0)
+    throw std::system_error(errno, std::generic_category(), name);
+  struct stat info;
+  if (fstat(input->fd, &info) == 0 && S_ISREG(info.st_mode))
+    input->reader = std::make_unique<MappedReader>(input->fd, info.st_size);
+  else
+    input->reader = std::make_unique<StreamReader>(input->fd);
+  return input;
+}
+
+// Arguments given without --batch are evaluated as expressions.
+class ArgumentReader final : public LineReader {
+  std::vector<std::string> const &arguments;
+  size_t position = 0;
+
+public:
+  explicit ArgumentReader(std::vector<std::string> const &arguments)
+      : arguments(arguments) {}
+
+  bool next(std::string_view &line) override {
+    if (position >= arguments.size())
+      return false;
+    line = arguments[position++];
+    return true;
+  }
+  bool buffered() const override { return true; }
+};
+
+char const *message_type_name(MessageType type) {
+  switch (type) {
+  case MESSAGE_INFORMATION:
+    return "information";
+  case MESSAGE_WARNING:
+    return "warning";
+  case MESSAGE_ERROR:
+    return "error";
+  }
+  return "unknown";
+}
+
+void append_json_string(std::string &out, std::string_view value) {
+  out.push_back('"');
+  for (char c : value) {
+    switch (c) {
+    case '"':
+      out += "\\\"";
+      break;
+    case '\\':
+      out += "\\\\";
+      break;
+    case '\n':
+      out += "\\n";
+      break;
+    case '\r':
+      out += "\\r";
+      break;
+    case '\t':
+      out += "\\t";
+      break;
+    default:
+      if (static_cast<unsigned char>(c) < 0x20) {
+        char escaped[7];
+        std::snprintf(escaped, sizeof escaped, "\\u%04x", c);
+        out += escaped;
+      } else
+        out.push_back(c);
+    }
+  }
+  out.push_back('"');
+}
+
+void append_csv_field(std::string &out, std::string_view value) {
+  if (value.find_first_of(",\"\r\n") == std::string_view::npos) {
+    out.append(value);
+    return;
+  }
+  out.push_back('"');
+  for (char c : value) {
+    if (c == '"')
+      out.push_back('"');
+    out.push_back(c);
+  }
+  out.push_back('"');
+}
+
+enum class Format { TEXT, JSONL, CSV };
+
+struct Line {
+  std::string_view source;
+  size_t number;
+  std::string expression;
+};
+
+class Writer {
+  FILE *out;
+  Format format;
+  std::string buffer;
+
+public:
+  size_t errors = 0;
+
+  Writer(FILE *out, Format format) : out(out), format(format) {
+    if (format == Format::CSV)
+      buffer = "source,line,expression,result,error\n";
+  }
+
+  void write(Line const &line, PoolResult const &result) {
+    bool failed = false;
+    for (auto const &[type, text] : result.messages)
+      failed |= type == MESSAGE_ERROR;
+    errors += failed;
+
+    switch (format) {
+    case Format::TEXT:
+      for (auto const &[type, text] : result.messages)
+        if (type != MESSAGE_INFORMATION)
+          std::fprintf(stderr, "%.*s:%zu: %s: %s\n",
+                       static_cast<int>(line.source.size()), line.source.data(),
+                       line.number, message_type_name(type), text.c_str());
+      buffer += result.text;
+      buffer.push_back('\n');
+      break;
+    case Format::JSONL: {
+      buffer += "{\"source\":";
+      append_json_string(buffer, line.source);
+      buffer += ",\"line\":" + std::to_string(line.number);
+      buffer += ",\"expression\":";
+      append_json_string(buffer, line.expression);
+      buffer += ",\"result\":";
+      append_json_string(buffer, result.text);
+      buffer += ",\"messages\":[";
+      bool first = true;
+      for (auto const &[type, text] : result.messages) {
+        if (!first)
+          buffer.push_back(',');
+        first = false;
+        buffer += "{\"type\":\"";
+        buffer += message_type_name(type);
+        buffer += "\",\"text\":";
+        append_json_string(buffer, text);
+        buffer.push_back('}');
+      }
+      buffer += "]}\n";
+      break;
+    }
+    case Format::CSV: {
+      std::string error;
+      for (auto const &[type, text] : result.messages) {
+        if (type != MESSAGE_ERROR)
+          continue;
+        if (!error.empty())
+          error += "; ";
+        error += text;
+      }
+      append_csv_field(buffer, line.source);
+      buffer += "," + std::to_string(line.number) + ",";
+      append_csv_field(buffer, line.expression);
+      buffer.push_back(',');
+      append_csv_field(buffer, result.text);
+      buffer.push_back(',');
+      append_csv_field(buffer, error);
+      buffer.push_back('\n');
+      break;
+    }
+    }
+  }
+
+  void flush() {
+    std::fwrite(buffer.data(), 1, buffer.size(), out);
+    std::fflush(out);
+    buffer.clear();
+  }
+};
+
+class PrecisionOverride {
+  int previous;
+
+public:
+  explicit PrecisionOverride(std::optional<int> precision)
+      : previous(CALCULATOR->getPrecision()) {
+    if (precision)
+      CALCULATOR->setPrecision(*precision);
+  }
+  ~PrecisionOverride() { CALCULATOR->setPrecision(previous); }
+};
+
+// Mirrors what the pool workers do, for --workers 0. Other threads may be
+// calculating as well, so the precision is only swapped in with exclusive
+// access to the calculator, which the temporary message stack needs too.
+std::vector<PoolResult> evaluate_here(std::vector<Line> const &lines,
+                                      std::optional<double> timeout,
+                                      std::optional<int> precision) {
+  for (auto const &line : lines)
+    load_definitions_for_expression(line.expression);
+
+  int msecs = timeout ? static_cast<int>(*timeout * 1000) : -1;
+  std::vector<PoolResult> results;
+  std::vector<CalculatorMessage> messages;
+  CalculatorGilRelease _gil(CalculatorAccess::EXCLUSIVE);
+  PrecisionOverride _precision(precision);
+  for (auto const &line : lines) {
+    auto &result = results.emplace_back();
+    CALCULATOR->beginTemporaryStopMessages();
+    result.text = CALCULATOR->calculateAndPrint(line.expression, msecs,
+                                                global_evaluation_options,
+                                                global_print_options);
+    messages.clear();
+    CALCULATOR->endTemporaryStopMessages(false, &messages);
+    for (auto const &message : messages)
+      result.messages.emplace_back(message.type(), message.message());
+  }
+  return results;
+}
+
+py::object make_parser() {
+  auto argparse = py::module_::import("argparse");
+  auto builtins = py::module_::import("builtins");
+  py::object parser = argparse.attr("ArgumentParser")(
+      "prog"_a = "qalculate",
+      "description"_a = "Evaluate expressions with libqalculate.");
+  auto add = parser.attr("add_argument");
+  add("inputs", "nargs"_a = "*", "metavar"_a = "EXPRESSION",
+      "help"_a = "expressions to evaluate, or input files with --batch "
+                 "(- for standard input)");
+  add("-b", "--batch", "action"_a = "store_true",
+      "help"_a = "read expressions line by line from files or standard input");
+  add("-j", "--workers", "type"_a = builtins.attr("int"),
+      "help"_a = "number of worker processes, 0 evaluates in this process "
+                 "(default: the number of CPUs with --batch, otherwise 0)");
+  add("-f", "--format", "choices"_a = py::make_tuple("text", "jsonl", "csv"),
+      "default"_a = "text", "help"_a = "output format (default: text)");
+  add("-o", "--output", "default"_a = "-",
+      "help"_a = "file to write results to (default: standard output)");
+  add("-p", "--precision", "type"_a = builtins.attr("int"),
+      "help"_a = "number of significant digits");
+  add("-t", "--timeout", "type"_a = builtins.attr("float"), "default"_a = 10.0,
+      "help"_a = "seconds allowed per expression, 0 for no limit "
+                 "(default: 10)");
+  add("-q", "--quiet", "action"_a = "store_true",
+      "help"_a = "do not print a summary to standard error");
+  return parser;
+}
+
+int run(py::object args) {
+  auto inputs = args.attr("inputs").cast<std::vector<std::string>>();
+  bool batch = args.attr("batch").cast<bool>();
+  bool quiet = args.attr("quiet").cast<bool>();
+  auto format_name = args.attr("format").cast<std::string>();
+  auto output = args.attr("output").cast<std::string>();
+  auto precision = args.attr("precision").cast<std::optional<int>>();
+  auto workers = args.attr("workers").cast<std::optional<int>>();
+  std::optional<double> timeout = args.attr("timeout").cast<double>();
+  if (*timeout <= 0)
+    timeout.reset();
+
+  Format format = format_name == "jsonl" ? Format::JSONL
+                  : format_name == "csv" ? Format::CSV
+                                         : Format::TEXT;
+  if (workers && *workers < 0)
+    throw py::value_error("--workers must not be negative");
+  size_t worker_count =
+      workers ? *workers
+              : (batch ? std::max(std::thread::hardware_concurrency(), 1u) : 0);
+  if (!batch && inputs.empty()) {
+    std::fprintf(stderr, "qalculate: no expressions given\n");
+    return 2;
+  }
+  if (batch && inputs.empty())
+    inputs.push_back("-");
+
+  std::vector<std::unique_ptr<Input>> files;
+  if (batch) {
+    for (auto const &name : inputs) {
+      try {
+        files.push_back(open_input(name));
+      } catch (std::system_error const &error) {
+        std::fprintf(stderr, "qalculate: %s\n", error.what());
+        return 2;
+      }
+    }
+  }
+
+  FILE *out = stdout;
+  if (output != "-" && !(out = std::fopen(output.c_str(), "w"))) {
+    std::fprintf(stderr, "qalculate: %s: %s\n", output.c_str(),
+                 std::strerror(errno));
+    return 2;
+  }
+  std::unique_ptr<FILE, int (*)(FILE *)> out_guard(
+      out == stdout ? nullptr : out, &std::fclose);
+  // Python may have buffered output of its own.
+  py::module_::import("sys").attr("stdout").attr("flush")();
+  py::module_::import("sys").attr("stderr").attr("flush")();
+
+  // Forked workers inherit everything loaded here, while expressions
+  // evaluated in this process load what they need when lazy loading is on.
+  if (worker_count > 0 || !lazy_loading_enabled())
+    for (auto &group : definition_groups)
+      load_definition_group(group);
+  std::optional<ProcessPool> pool;
+  if (worker_count > 0)
+    pool.emplace(worker_count, std::vector<DefinitionGroup *>{}, timeout,
+                 global_evaluation_options, global_print_options, precision);
+
+  Writer writer(out, format);
+  size_t total = 0;
+  auto start = std::chrono::steady_clock::now();
+
+  auto process = [&](std::string_view source, LineReader &reader) {
+    size_t number = 0;
+    std::string_view text;
+    std::vector<Line> block;
+    std::vector<std::string> expressions;
+    bool more = true;
+    while (more) {
+      block.clear();
+      while (block.size() < BLOCK_SIZE &&
+             (block.empty() || reader.buffered()) &&
+             (more = reader.next(text))) {
+        ++number;
+        if (!text.empty() && text.back() == '\r')
+          text.remove_suffix(1);
+        if (text.find_first_not_of(" \t") == std::string_view::npos)
+          continue;
+        block.push_back({source, number, std::string(text)});
+      }
+      if (block.empty())
+        continue;
+
+      std::vector<PoolResult> results;
+      if (pool) {
+        expressions.clear();
+        for (auto const &line : block)
+          expressions.push_back(line.expression);
+        results = pool->map(expressions);
+      } else {
+        results = evaluate_here(block, timeout, precision);
+        if (PyErr_CheckSignals() != 0)
+          throw py::error_already_set();
+      }
+      for (size_t i = 0; i < block.size(); ++i)
+        writer.write(block[i], results[i]);
+      writer.flush();
+      total += block.size();
+    }
+  };
+
+  if (batch) {
+    for (auto &file : files)
+      process(file->name, *file->reader);
+  } else {
+    ArgumentReader reader(inputs);
+    process("<argument>", reader);
+  }
+  if (pool)
+    pool->close();
+
+  double seconds =
+      std::chrono::duration<double>(std::chrono::steady_clock::now() - start)
+          .count();
+  if (batch && !quiet)
+    std::fprintf(stderr,
+                 "qalculate: %zu expressions in %.3f s (%.1f/s), %zu errors, "
+                 "%zu workers\n",
+                 total, seconds, seconds > 0 ? total / seconds : 0.0,
+                 writer.errors, worker_count);
+  return writer.errors ? 1 : 0;
+}
+
+} // namespace
+
+void add_cli(py::module_ &m) {
+  m.def(
+      "main",
+      [](std::optional<std::vector<std::string>> argv) {
+        py::object parser = make_parser();
+        py::object args = argv ? parser.attr("parse_args")(*argv)
+                               : parser.attr("parse_args")();
+        return run(args);
+      },
+      py::arg("argv") = std::nullopt);
+}
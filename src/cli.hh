@@ -0,0 +1,6 @@
+#pragma once
+
+#include "pybind.hh"
+
+// qalculate.main(), the entry point of the qalculate console script.
+void add_cli(py::module_ &m);
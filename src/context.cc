@@ -0,0 +1,272 @@
+#include "context.hh"
+
+#include <condition_variable>
+#include <mutex>
+#include <pybind11/stl.h>
+#include <string>
+#include <vector>
+
+#include "options.hh"
+
+namespace {
+
+// Holds a tuple (precision or None, evaluation, print, parse) of override
+// dicts, or None. Leaked on purpose, it has to outlive the module.
+PyObject *options_var;
+
+enum OverrideIndex { PRECISION, EVALUATION, PRINT, PARSE };
+
+// A readers-writer lock around the calculator. Calculations that release the
+// GIL share it, while exclusive holders may change the calculator's state
+// or collect its messages without other calculations interfering. Waiting
+// exclusive holders keep new shared ones from starting. Always taken without
+// the GIL, which shared holders do not need to give it up again, and never
+// held while waiting for the GIL, which a fork() in another thread may hold.
+std::mutex calculator_mutex;
+// Replaced in a forked child, where threads that were waiting on it are gone.
+std::condition_variable *calculator_released = new std::condition_variable();
+size_t shared_holders = 0;
+size_t exclusive_waiting = 0;
+bool exclusive_held = false;
+
+void lock_calculator(CalculatorAccess access) {
+  std::unique_lock lock(calculator_mutex);
+  if (access == CalculatorAccess::SHARED) {
+    calculator_released->wait(
+        lock, [] { return !exclusive_held && exclusive_waiting == 0; });
+    ++shared_holders;
+    return;
+  }
+  ++exclusive_waiting;
+  calculator_released->wait(
+      lock, [] { return !exclusive_held && shared_holders == 0; });
+  --exclusive_waiting;
+  exclusive_held = true;
+}
+
+void unlock_calculator(CalculatorAccess access) {
+  std::lock_guard lock(calculator_mutex);
+  if (access == CalculatorAccess::SHARED)
+    --shared_holders;
+  else
+    exclusive_held = false;
+  calculator_released->notify_all();
+}
+
+py::object current_overrides() {
+  PyObject *value;
+  if (PyContextVar_Get(options_var, nullptr, &value) < 0)
+    throw py::error_already_set();
+  return py::reinterpret_steal<py::object>(value);
+}
+
+template <typename T>
+T apply_overrides(T const &options, py::handle overrides) {
+  py::object copy = py::cast(T(options));
+  for (auto [key, value] : overrides.cast<py::dict>())
+    py::setattr(copy, key, value);
+  return copy.cast<T>();
+}
+
+bool is_property_of(py::type type, std::string const &name) {
+  auto builtins = py::module_::import("builtins");
+  return py::hasattr(type, name.c_str()) &&
+         py::isinstance(type.attr(name.c_str()), builtins.attr("property"));
+}
+
+class OptionsContext {
+  std::optional<int> precision;
+  py::dict evaluation, print, parse;
+  std::vector<py::object> tokens;
+
+public:
+  OptionsContext(py::kwargs const &overrides) {
+    for (auto [key, value] : overrides) {
+      auto name = key.cast<std::string>();
+      if (name == "precision") {
+        precision = value.cast<int>();
+        continue;
+      }
+
+      py::dict *target = nullptr;
+      for (auto [type, dict] :
+           {std::pair{py::type::of<PEvaluationOptions>(), &evaluation},
+            std::pair{py::type::of<PrintOptions>(), &print},
+            std::pair{py::type::of<ParseOptions>(), &parse}}) {
+        if (!is_property_of(type, name))
+          continue;
+        if (target)
+          throw py::type_error(
+              "option '" + name +
+              "' exists in more than one options class, pass explicit "
+              "options instead");
+        target = dict;
+      }
+      if (!target)
+        throw py::type_error("unknown option '" + name + "'");
+      (*target)[key] = value;
+    }
+  }
+
+  // Overrides of enclosing contexts stay in effect unless replaced.
+  void enter() {
+    py::object outer = current_overrides();
+    py::object outer_precision = py::none();
+    py::dict merged[3];
+    if (!outer.is_none()) {
+      auto tuple = outer.cast<py::tuple>();
+      outer_precision = tuple[PRECISION];
+      for (int i = 0; i < 3; ++i)
+        merged[i] = tuple[EVALUATION + i].attr("copy")();
+    }
+    for (auto [dict, own] :
+         {std::pair{&merged[0], &evaluation}, std::pair{&merged[1], &print},
+          std::pair{&merged[2], &parse}})
+      for (auto [key, value] : *own)
+        (*dict)[key] = value;
+
+    py::object value =
+        py::make_tuple(precision ? py::cast(*precision) : outer_precision,
+                       merged[0], merged[1], merged[2]);
+    PyObject *token = PyContextVar_Set(options_var, value.ptr());
+    if (!token)
+      throw py::error_already_set();
+    tokens.push_back(py::reinterpret_steal<py::object>(token));
+  }
+
+  void exit() {
+    if (tokens.empty())
+      throw py::value_error("options context was not entered");
+    if (PyContextVar_Reset(options_var, tokens.back().ptr()) < 0)
+      throw py::error_already_set();
+    tokens.pop_back();
+  }
+};
+
+} // namespace
+
+py::object current_options_overrides() { return current_overrides(); }
+
+PEvaluationOptions const &
+context_evaluation_options(PEvaluationOptions const &options,
+                           std::optional<PEvaluationOptions> &storage) {
+  if (&options != &global_evaluation_options)
+    return options;
+  py::object overrides = current_overrides();
+  if (overrides.is_none())
+    return options;
+
+  auto tuple = overrides.cast<py::tuple>();
+  storage = apply_overrides(options, tuple[EVALUATION]);
+  storage->parse_options =
+      apply_overrides(storage->parse_options, tuple[PARSE]);
+  return *storage;
+}
+
+PrintOptions const &
+context_print_options(PrintOptions const &options,
+                      std::optional<PrintOptions> &storage) {
+  if (&options != &global_print_options)
+    return options;
+  py::object overrides = current_overrides();
+  if (overrides.is_none())
+    return options;
+
+  storage = apply_overrides(options, overrides.cast<py::tuple>()[PRINT]);
+  return *storage;
+}
+
+ParseOptions const &
+context_parse_options(ParseOptions const &options,
+                      std::optional<ParseOptions> &storage) {
+  if (&options != &global_parse_options)
+    return options;
+  py::object overrides = current_overrides();
+  if (overrides.is_none())
+    return options;
+
+  storage = apply_overrides(options, overrides.cast<py::tuple>()[PARSE]);
+  return *storage;
+}
+
+ContextPrecision::ContextPrecision() {
+  py::object overrides = current_overrides();
+  if (overrides.is_none())
+    return;
+  py::object precision = overrides.cast<py::tuple>()[PRECISION];
+  if (precision.is_none())
+    return;
+
+  value = precision.cast<int>();
+}
+
+ContextGilRelease::ContextGilRelease(ContextPrecision const &precision,
+                                     CalculatorAccess access) {
+  if (StatsTimer::recording())
+    start = std::chrono::steady_clock::now();
+  release.emplace(precision.value ? CalculatorAccess::EXCLUSIVE : access);
+  if (precision.value) {
+    previous_precision = CALCULATOR->getPrecision();
+    CALCULATOR->setPrecision(*precision.value);
+  }
+}
+
+ContextGilRelease::~ContextGilRelease() {
+  if (previous_precision)
+    CALCULATOR->setPrecision(*previous_precision);
+  release.reset();
+  if (StatsTimer::recording())
+    StatsTimer::add_gil_released_time(
+        std::chrono::duration<double>(std::chrono::steady_clock::now() - start)
+            .count());
+}
+
+CalculatorGilRelease::CalculatorGilRelease(CalculatorAccess access)
+    : access(access) {
+  release.emplace();
+  lock_calculator(access);
+}
+
+CalculatorGilRelease::~CalculatorGilRelease() {
+  unlock_calculator(access);
+  release.reset();
+}
+
+void prepare_calculator_fork() {
+  lock_calculator(CalculatorAccess::EXCLUSIVE);
+  // Kept locked until after the fork, so that the child does not inherit it
+  // locked by a thread that is gone.
+  calculator_mutex.lock();
+}
+
+void finish_calculator_fork(bool child) {
+  if (child) {
+    calculator_released = new std::condition_variable();
+    shared_holders = 0;
+    exclusive_waiting = 0;
+  }
+  calculator_mutex.unlock();
+  unlock_calculator(CalculatorAccess::EXCLUSIVE);
+}
+
+void add_options_context(py::module_ &m) {
+  options_var = py::module_::import("contextvars")
+                    .attr("ContextVar")("qalculate.options",
+                                        py::arg("default") = py::none())
+                    .release()
+                    .ptr();
+
+  py::class_<OptionsContext>(m, "OptionsContext")
+      .def("__enter__",
+           [](py::object self) {
+             self.cast<OptionsContext &>().enter();
+             return self;
+           })
+      .def("__exit__", [](OptionsContext &self, py::args) { self.exit(); });
+
+  m.def(
+      "options", [](py::kwargs overrides) { return OptionsContext(overrides); },
+      "Override options for calls made in the current context.\n\n"
+      "Calls with an overridden precision get exclusive access to the "
+      "calculator, so they are serialized with all other calculations.");
+}
@@ -0,0 +1,85 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <chrono>
+#include <libqalculate/qalculate.h>
+#include <optional>
+
+#include "stats.hh"
+#include "wrappers.hh"
+
+// Overrides set with `with qalculate.options(...)` live in a ContextVar, so
+// every thread and asyncio task sees its own. They replace the global options
+// for calls that did not get explicit ones, the globals themselves are never
+// modified.
+
+// Return options unless they are the global ones and overrides are active,
+// in which case an adjusted copy is put in storage and returned instead.
+PEvaluationOptions const &
+context_evaluation_options(PEvaluationOptions const &options,
+                           std::optional<PEvaluationOptions> &storage);
+PrintOptions const &context_print_options(PrintOptions const &options,
+                                          std::optional<PrintOptions> &storage);
+ParseOptions const &context_parse_options(ParseOptions const &options,
+                                          std::optional<ParseOptions> &storage);
+
+// The overrides active in the current context. The same object is returned
+// for every call made within one `with qalculate.options(...)` block, None
+// outside of any.
+py::object current_options_overrides();
+
+enum class CalculatorAccess { SHARED, EXCLUSIVE };
+
+// Releases the GIL around a call into the calculator. Shared calls run
+// concurrently, an exclusive call waits until no other call holds either and
+// keeps new ones from starting, which is needed to collect only its own
+// messages. Calls that keep the GIL are not covered.
+class CalculatorGilRelease {
+  CalculatorAccess access;
+  std::optional<py::gil_scoped_release> release;
+
+public:
+  explicit CalculatorGilRelease(
+      CalculatorAccess access = CalculatorAccess::SHARED);
+  ~CalculatorGilRelease();
+
+  CalculatorGilRelease(CalculatorGilRelease const &) = delete;
+  CalculatorGilRelease &operator=(CalculatorGilRelease const &) = delete;
+};
+
+// Called around fork(). Takes exclusive access to the calculator, so that it
+// can be reset while no calculation is running.
+void prepare_calculator_fork();
+void finish_calculator_fork(bool child);
+
+// The precision override of the current context, if any. Precision is a
+// property of the calculator rather than of the options, so it is only
+// swapped in by ContextGilRelease.
+struct ContextPrecision {
+  std::optional<int> value;
+
+  ContextPrecision();
+};
+
+// Releases the GIL and takes the calculator lock, the time until the GIL is
+// reacquired is counted towards qalculate.stats(). An overridden precision is
+// swapped in with exclusive access to the calculator, so such calls are
+// serialized with each other and with all other calculations, though not with
+// Python code.
+class ContextGilRelease {
+  std::optional<CalculatorGilRelease> release;
+  std::optional<int> previous_precision;
+  std::chrono::steady_clock::time_point start;
+
+public:
+  explicit ContextGilRelease(
+      ContextPrecision const &precision,
+      CalculatorAccess access = CalculatorAccess::SHARED);
+  ~ContextGilRelease();
+
+  ContextGilRelease(ContextGilRelease const &) = delete;
+  ContextGilRelease &operator=(ContextGilRelease const &) = delete;
+};
+
+void add_options_context(py::module_ &m);
@@ -0,0 +1,261 @@
+#include "conversion.hh"
+
+#include <algorithm>
+#include <cstdio>
+#include <mutex>
+#include <optional>
+#include <tuple>
+#include <unordered_map>
+#include <vector>
+
+#include "context.hh"
+#include "definitions.hh"
+#include "messages.hh"
+#include "options.hh"
+
+namespace {
+
+// Both caches are dropped once they reach their limit, and whenever the set
+// of units changes since that may change what a name resolves to.
+constexpr size_t MAX_TARGETS = 256;
+constexpr size_t MAX_BEST_UNITS = 4096;
+
+using UnitPower = std::tuple<Unit *, Prefix *, long>;
+
+// Collects the units of a product of numbers and integer powers of units,
+// returns false for anything else.
+bool collect_units(MathStructure const &value, std::vector<UnitPower> &units) {
+  auto add = [&](MathStructure const &factor) {
+    if (factor.isNumber())
+      return true;
+    if (factor.isUnit()) {
+      units.emplace_back(factor.unit(), factor.prefix(), 1);
+      return true;
+    }
+    if (factor.isPower() && factor[0].isUnit() && factor[1].isNumber() &&
+        factor[1].number().isInteger()) {
+      units.emplace_back(factor[0].unit(), factor[0].prefix(),
+                         factor[1].number().lintValue());
+      return true;
+    }
+    return false;
+  };
+
+  units.clear();
+  if (value.isMultiplication()) {
+    for (size_t i = 0; i < value.size(); ++i)
+      if (!add(value[i]))
+        return false;
+  } else if (!add(value))
+    return false;
+  std::sort(units.begin(), units.end());
+  return true;
+}
+
+std::shared_ptr<Unit> registered_unit(Unit *unit) {
+  return std::shared_ptr<Unit>(unit, [](Unit *) {});
+}
+
+std::shared_ptr<Unit> make_unit(std::vector<UnitPower> const &units) {
+  if (units.size() == 1) {
+    auto [unit, prefix, exponent] = units.front();
+    if (!prefix && exponent == 1)
+      return registered_unit(unit);
+  }
+  auto composite =
+      std::make_shared<CompositeUnit>("", "temporary_composite_convert");
+  for (auto [unit, prefix, exponent] : units)
+    composite->add(unit, exponent, prefix);
+  return composite;
+}
+
+std::unordered_map<std::string, std::shared_ptr<ConversionTarget::Data const>> &
+target_cache() {
+  static std::unordered_map<std::string,
+                            std::shared_ptr<ConversionTarget::Data const>>
+      cache;
+  return cache;
+}
+size_t target_cache_units = 0;
+
+// Maps the units of a value to the unit it converts to in an automatic
+// conversion mode, null if it stays as it is. Used without the GIL.
+std::mutex best_unit_mutex;
+std::unordered_map<std::string, std::shared_ptr<Unit>> best_units;
+size_t best_units_units = 0;
+
+MathStructure convert_to_optimal(MathStructure const &value,
+                                 EvaluationOptions const &options, bool si) {
+  std::vector<UnitPower> units;
+  if (!collect_units(value, units))
+    return CALCULATOR->convertToOptimalUnit(value, options, si);
+  if (units.empty())
+    return value;
+
+  std::string key(si ? "S" : "O");
+  for (auto [unit, prefix, exponent] : units) {
+    char part[64];
+    std::snprintf(part, sizeof part, "%p:%p:%ld;", static_cast<void *>(unit),
+                  static_cast<void *>(prefix), exponent);
+    key += part;
+  }
+
+  std::shared_ptr<Unit> best;
+  {
+    std::lock_guard lock(best_unit_mutex);
+    if (best_units_units != CALCULATOR->units.size()) {
+      best_units.clear();
+      best_units_units = CALCULATOR->units.size();
+    }
+    auto it = best_units.find(key);
+    if (it != best_units.end()) {
+      if (!it->second)
+        return value;
+      best = it->second;
+    }
+  }
+  if (best)
+    return CALCULATOR->convert(value, best.get(), options);
+
+  MathStructure converted =
+      CALCULATOR->convertToOptimalUnit(value, options, si);
+  std::vector<UnitPower> converted_units;
+  if (collect_units(converted, converted_units) && !converted_units.empty()) {
+    if (converted_units != units)
+      best = make_unit(converted_units);
+    std::lock_guard lock(best_unit_mutex);
+    if (best_units.size() >= MAX_BEST_UNITS)
+      best_units.clear();
+    best_units.emplace(std::move(key), std::move(best));
+  }
+  return converted;
+}
+
+} // namespace
+
+ConversionTarget::ConversionTarget(std::string const &text)
+    : data(resolve(text)) {}
+
+std::shared_ptr<ConversionTarget::Data const>
+ConversionTarget::resolve(std::string const &text) {
+  auto &cache = target_cache();
+  if (target_cache_units != CALCULATOR->units.size()) {
+    cache.clear();
+    target_cache_units = CALCULATOR->units.size();
+  }
+  if (auto it = cache.find(text); it != cache.end())
+    return it->second;
+
+  auto data = std::make_shared<Data>();
+  data->text = text;
+  if (text == "optimal")
+    data->kind = Kind::OPTIMAL;
+  else if (text == "si")
+    data->kind = Kind::OPTIMAL_SI;
+  else if (text == "base")
+    data->kind = Kind::BASE;
+  else {
+    load_definitions_for_expression(text);
+    MessageGuard messages;
+    auto composite = std::make_shared<CompositeUnit>(
+        "", "temporary_composite_convert", "", text);
+    int exponent;
+    Prefix *prefix;
+    if (composite->countUnits() == 0)
+      data->kind = Kind::EXPRESSION;
+    else {
+      data->kind = Kind::UNIT;
+      Unit *single = composite->get(1, &exponent, &prefix);
+      if (composite->countUnits() == 1 && exponent == 1 && !prefix)
+        data->unit = registered_unit(single);
+      else
+        data->unit = std::move(composite);
+    }
+    // Loading more units changes the size and drops the cache, do not keep
+    // a target that was resolved before them.
+    if (target_cache_units != CALCULATOR->units.size()) {
+      cache.clear();
+      target_cache_units = CALCULATOR->units.size();
+    }
+  }
+
+  if (cache.size() >= MAX_TARGETS)
+    cache.clear();
+  cache.emplace(text, data);
+  return data;
+}
+
+MathStructure ConversionTarget::unit_structure() const {
+  auto *unit = data->unit.get();
+  if (unit->subtype() == SUBTYPE_COMPOSITE_UNIT)
+    return static_cast<CompositeUnit *>(unit)->generateMathStructure();
+  return MathStructure(unit);
+}
+
+MathStructure
+ConversionTarget::convert(MathStructure const &value,
+                          EvaluationOptions const &options) const {
+  switch (data->kind) {
+  case Kind::EXPRESSION:
+    return CALCULATOR->convert(value, data->text, options);
+  case Kind::UNIT:
+    return CALCULATOR->convert(value, data->unit.get(), options);
+  case Kind::OPTIMAL:
+    return convert_to_optimal(value, options, false);
+  case Kind::OPTIMAL_SI:
+    return convert_to_optimal(value, options, true);
+  case Kind::BASE:
+    return CALCULATOR->convertToBaseUnits(value, options);
+  }
+  return value;
+}
+
+MathStructure calculate_to(MathStructure const &value,
+                           EvaluationOptions const &options,
+                           Conversion const &to) {
+  if (auto text = std::get_if<std::string>(&to))
+    return CALCULATOR->calculate(value, options, *text);
+  auto const &target = std::get<ConversionTarget>(to);
+  if (target.kind() == ConversionTarget::Kind::EXPRESSION)
+    return CALCULATOR->calculate(value, options, target.text());
+
+  // The target replaces the automatic conversion.
+  EvaluationOptions unconverted(options);
+  unconverted.auto_post_conversion = POST_CONVERSION_NONE;
+  return target.convert(CALCULATOR->calculate(value, unconverted), options);
+}
+
+void add_conversion(py::module_ &m) {
+  py::class_<ConversionTarget>(m, "ConversionTarget")
+      .def(py::init<std::string const &>(), py::arg("to"))
+      .def_property_readonly("text", &ConversionTarget::text)
+      .def_property_readonly("resolved",
+                             [](ConversionTarget const &self) {
+                               return self.kind() !=
+                                      ConversionTarget::Kind::EXPRESSION;
+                             })
+      .def(
+          "convert",
+          [](ConversionTarget const &self, MathStructure const &value,
+             PEvaluationOptions const &options) {
+            MessageGuard messages;
+            std::optional<PEvaluationOptions> context_options;
+            auto const &eval_options =
+                context_evaluation_options(options, context_options);
+            ContextPrecision precision;
+            MathStructure result;
+            {
+              ContextGilRelease _gil(precision);
+              result = self.convert(value, eval_options);
+            }
+            return MathStructureRef::adopt(result);
+          },
+          py::arg("value"), py::arg("options") = &global_evaluation_options)
+      .def("__repr__", [](ConversionTarget const &self) {
+        return "<ConversionTarget " + self.text() + ">";
+      });
+
+  m.def(
+      "target", [](std::string const &to) { return ConversionTarget(to); },
+      py::arg("to"));
+}
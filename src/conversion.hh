@@ -0,0 +1,52 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <libqalculate/qalculate.h>
+#include <memory>
+#include <string>
+#include <variant>
+
+// A `to` argument resolved once, see qalculate.target().
+class ConversionTarget {
+public:
+  enum class Kind {
+    // Not something that could be resolved in advance, passed to
+    // Calculator::calculate as is.
+    EXPRESSION,
+    UNIT,
+    OPTIMAL,
+    OPTIMAL_SI,
+    BASE,
+  };
+
+  struct Data {
+    std::string text;
+    Kind kind;
+    // Owns temporary composite units, registered ones are not deleted.
+    std::shared_ptr<Unit> unit;
+  };
+
+  explicit ConversionTarget(std::string const &text);
+
+  std::string const &text() const { return data->text; }
+  Kind kind() const { return data->kind; }
+  // The product of units a UNIT target converts to.
+  MathStructure unit_structure() const;
+  MathStructure convert(MathStructure const &value,
+                        EvaluationOptions const &options) const;
+
+private:
+  std::shared_ptr<Data const> data;
+
+  static std::shared_ptr<Data const> resolve(std::string const &text);
+};
+
+// Accepted anywhere a `to` string is.
+using Conversion = std::variant<std::string, ConversionTarget>;
+
+MathStructure calculate_to(MathStructure const &value,
+                           EvaluationOptions const &options,
+                           Conversion const &to);
+
+void add_conversion(py::module_ &m);
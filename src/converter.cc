@@ -0,0 +1,183 @@
+#include "converter.hh"
+
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <stdexcept>
+#include <vector>
+
+#include "definitions.hh"
+#include "messages.hh"
+
+EvaluationOptions conversion_options() {
+  EvaluationOptions options;
+  options.approximation = APPROXIMATION_TRY_EXACT;
+  options.auto_post_conversion = POST_CONVERSION_NONE;
+  return options;
+}
+
+namespace {
+
+// Whether a * x + b matches every sample, with some leeway for samples that
+// libqalculate could only compute approximately.
+bool is_affine(Number const &a, Number const &b,
+               std::vector<std::pair<Number, Number>> const &samples) {
+  for (auto const &[x, y] : samples) {
+    Number expected(a);
+    if (!expected.multiply(x) || !expected.add(b))
+      return false;
+    if (y.isApproximate() || expected.isApproximate()
+            ? !expected.equalsApproximately(y, CALCULATOR->getPrecision())
+            : !expected.equals(y))
+      return false;
+  }
+  return true;
+}
+
+} // namespace
+
+bool is_ndarray(py::handle values) {
+  // Only an array if numpy has been imported, which also keeps it optional.
+  auto modules = py::module_::import("sys").attr("modules");
+  if (!modules.contains("numpy"))
+    return false;
+  return py::isinstance(values, modules["numpy"].attr("ndarray"));
+}
+
+UnitConverter::UnitConverter(std::string const &from, std::string const &to,
+                             bool exact)
+    : UnitConverter(from, ConversionTarget(to), exact) {}
+
+UnitConverter::UnitConverter(std::string const &from,
+                             ConversionTarget const &to, bool exact)
+    : from_text(from), to_text(to.text()), exact(exact), target(to) {
+  load_definitions_for_expression(from);
+  MessageGuard messages;
+  if (target.kind() != ConversionTarget::Kind::UNIT)
+    throw py::value_error("\"" + to_text + "\" is not a unit");
+  from_unit = CALCULATOR->parse(from);
+  to_unit = target.unit_structure();
+  if (from_unit.containsType(STRUCT_UNIT) <= 0)
+    throw py::value_error("\"" + from + "\" is not a unit");
+
+  // Two samples determine the line, the third checks it. Zero is avoided
+  // since a zero quantity may lose its unit.
+  std::vector<std::pair<Number, Number>> samples;
+  for (long x : {1, 2, 10})
+    samples.emplace_back(Number(x, 1), convert_slow(Number(x, 1)));
+  Number a(samples[1].second);
+  Number b(samples[0].second);
+  if (!a.subtract(samples[0].second) || !b.subtract(a))
+    return;
+  if (!is_affine(a, b, samples))
+    return;
+  factor = a;
+  offset = b;
+  float_factor = a.floatValue();
+  float_offset = b.floatValue();
+}
+
+Number UnitConverter::convert_slow(Number const &value) const {
+  auto options = conversion_options();
+  MathStructure quantity(value);
+  quantity.multiply(from_unit);
+  MathStructure result =
+      target.convert(CALCULATOR->calculate(quantity, options), options);
+  result.divide(to_unit);
+  result.eval(options);
+  if (!result.isNumber())
+    throw py::value_error("cannot convert \"" + from_text + "\" to \"" +
+                          to_text + "\"");
+  return result.number();
+}
+
+Number UnitConverter::convert(Number const &value) const {
+  if (!factor)
+    return convert_slow(value);
+  Number result(value);
+  result.multiply(*factor);
+  result.add(*offset);
+  return result;
+}
+
+double UnitConverter::convert_float(double value) const {
+  if (factor)
+    return value * float_factor + float_offset;
+  Number number;
+  number.setFloat(value);
+  return convert_slow(number).floatValue();
+}
+
+void UnitConverter::convert_floats(double const *in, double *out,
+                                   size_t size) const {
+  if (factor) {
+    py::gil_scoped_release _gil;
+    for (size_t i = 0; i < size; ++i)
+      out[i] = in[i] * float_factor + float_offset;
+  } else {
+    for (size_t i = 0; i < size; ++i)
+      out[i] = convert_float(in[i]);
+  }
+}
+
+py::object UnitConverter::call(py::object values) const {
+  MessageGuard messages;
+  bool number_input = py::isinstance<Number>(values);
+  if (number_input || py::isinstance<py::int_>(values) ||
+      py::isinstance<py::float_>(values)) {
+    if (exact || number_input)
+      return py::cast(convert(values.cast<Number>()));
+    return py::float_(convert_float(values.cast<double>()));
+  }
+
+  if (!exact && is_ndarray(values)) {
+    using Array =
+        py::array_t<double, py::array::c_style | py::array::forcecast>;
+    auto input = Array::ensure(values);
+    if (!input)
+      throw py::type_error("expected an array of numbers");
+    Array output(input.request().shape);
+    convert_floats(input.data(), output.mutable_data(), input.size());
+    return output;
+  }
+
+  py::list output;
+  if (exact) {
+    for (auto value : values)
+      output.append(convert(value.cast<Number>()));
+    return output;
+  }
+  std::vector<double> buffer;
+  for (auto value : values)
+    buffer.push_back(value.cast<double>());
+  convert_floats(buffer.data(), buffer.data(), buffer.size());
+  for (double value : buffer)
+    output.append(value);
+  return output;
+}
+
+void add_converter(py::module_ &m) {
+  py::class_<UnitConverter>(m, "UnitConverter")
+      .def(py::init<std::string const &, std::string const &, bool>(),
+           py::arg("from_unit"), py::arg("to_unit"), py::kw_only{},
+           py::arg("exact") = false)
+      .def_readonly("from_unit", &UnitConverter::from_text)
+      .def_readonly("to_unit", &UnitConverter::to_text)
+      .def_readonly("exact", &UnitConverter::exact)
+      .def_property_readonly(
+          "linear",
+          [](UnitConverter const &self) { return self.factor.has_value(); })
+      .def_readonly("factor", &UnitConverter::factor)
+      .def_readonly("offset", &UnitConverter::offset)
+      .def("__call__", &UnitConverter::call, py::arg("values"))
+      .def("__repr__", [](UnitConverter const &self) {
+        return "<UnitConverter " + self.from_text + " to " + self.to_text + ">";
+      });
+
+  m.def(
+      "converter",
+      [](std::string const &from, std::string const &to, bool exact) {
+        return UnitConverter(from, to, exact);
+      },
+      py::arg("from_unit"), py::arg("to_unit"), py::kw_only{},
+      py::arg("exact") = false);
+}
@@ -0,0 +1,47 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <libqalculate/qalculate.h>
+#include <optional>
+#include <string>
+
+#include "conversion.hh"
+
+// Converts plain numbers between two units. Linear and affine conversions are
+// reduced to a factor and an offset once, anything else goes through
+// libqalculate for every value.
+class UnitConverter {
+public:
+  UnitConverter(std::string const &from, std::string const &to, bool exact);
+  UnitConverter(std::string const &from, ConversionTarget const &to,
+                bool exact);
+
+  std::string from_text;
+  std::string to_text;
+  bool exact;
+  // Set when value * factor + offset gives the conversion.
+  std::optional<Number> factor;
+  std::optional<Number> offset;
+
+  Number convert(Number const &value) const;
+  double convert_float(double value) const;
+  // in and out may be the same buffer.
+  void convert_floats(double const *in, double *out, size_t size) const;
+  py::object call(py::object values) const;
+
+private:
+  MathStructure from_unit;
+  MathStructure to_unit;
+  ConversionTarget target;
+  double float_factor = 0;
+  double float_offset = 0;
+
+  Number convert_slow(Number const &value) const;
+};
+
+// Exact where possible and without automatic unit conversion.
+EvaluationOptions conversion_options();
+bool is_ndarray(py::handle values);
+
+void add_converter(py::module_ &m);
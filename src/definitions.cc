@@ -0,0 +1,176 @@
+#include "definitions.hh"
+
+#include <cctype>
+#include <cstdint>
+#include <fstream>
+#include <iterator>
+#include <libqalculate/qalculate.h>
+#include <stdexcept>
+#include <string>
+#include <unordered_map>
+
+DefinitionGroup *find_definition_group(std::string_view name) {
+  for (auto &group : definition_groups)
+    if (name == group.name)
+      return &group;
+  return nullptr;
+}
+
+void load_definition_group(DefinitionGroup &group) {
+  if (group.loaded)
+    return;
+  if (!(*CALCULATOR.*group.load)())
+    throw std::runtime_error("qalculate failed to load something");
+  group.loaded = true;
+}
+
+namespace {
+
+// Longest prefix name ("micro") in bytes, prefixes are tried to be stripped
+// from identifiers up to this length.
+constexpr size_t MAX_PREFIX_LENGTH = 5;
+
+bool lazy_loading = false;
+// Name to mask of definition_groups indices.
+std::unordered_map<std::string, uint32_t> name_index;
+bool name_index_built = false;
+
+void index_names(std::string_view value, bool is_list, uint32_t bit) {
+  while (!value.empty()) {
+    size_t end = is_list ? value.find(',') : std::string_view::npos;
+    std::string_view name = value.substr(0, end);
+    value = end == std::string_view::npos ? std::string_view()
+                                          : value.substr(end + 1);
+    // Lists look like "ar:m,r:meter" where the part before ':' are flags.
+    if (is_list) {
+      size_t colon = name.find(':');
+      if (colon != std::string_view::npos)
+        name.remove_prefix(colon + 1);
+    }
+    while (!name.empty() && std::isspace((unsigned char)name.front()))
+      name.remove_prefix(1);
+    while (!name.empty() && std::isspace((unsigned char)name.back()))
+      name.remove_suffix(1);
+    if (!name.empty())
+      name_index[std::string(name)] |= bit;
+  }
+}
+
+// Only looks at the text of name elements, which is enough to tell which
+// file a name comes from without building any of the items.
+void index_file(std::string const &path, uint32_t bit) {
+  std::ifstream in(path, std::ios::binary);
+  std::string text(std::istreambuf_iterator<char>(in),
+                   std::istreambuf_iterator<char>{});
+
+  size_t position = 0;
+  while ((position = text.find('<', position)) != std::string::npos) {
+    ++position;
+    size_t tag_end = text.find_first_of(" >", position);
+    if (tag_end == std::string::npos)
+      break;
+    std::string_view tag(text.data() + position, tag_end - position);
+    if (tag != "names" && tag != "name" && tag != "abbreviation" &&
+        tag != "singular" && tag != "plural")
+      continue;
+
+    size_t start = text.find('>', tag_end);
+    size_t end = text.find('<', start);
+    if (start == std::string::npos || end == std::string::npos)
+      break;
+    ++start;
+    index_names(std::string_view(text.data() + start, end - start),
+                tag == "names", bit);
+    position = end;
+  }
+}
+
+void build_name_index() {
+  if (name_index_built)
+    return;
+  std::string directory = getGlobalDefinitionsDir();
+  for (size_t i = 0; i < std::size(definition_groups); ++i)
+    index_file(buildPath(directory, definition_groups[i].file_name), 1 << i);
+  name_index_built = true;
+}
+
+bool is_identifier_byte(unsigned char c) {
+  return std::isalnum(c) || c == '_' || c >= 0x80;
+}
+
+} // namespace
+
+bool lazy_loading_enabled() { return lazy_loading; }
+
+void set_lazy_loading(bool enabled) {
+  if (enabled)
+    build_name_index();
+  lazy_loading = enabled;
+}
+
+bool load_definitions_for_name(std::string_view name) {
+  if (!lazy_loading)
+    return false;
+  auto it = name_index.find(std::string(name));
+  if (it == name_index.end())
+    return false;
+
+  // Definitions are parsed while loading, where names of groups that are not
+  // loaded yet would not reach this function, so everything a group may
+  // depend on is loaded before it.
+  size_t last = 0;
+  for (size_t i = 0; i < std::size(definition_groups); ++i)
+    if (it->second & (1 << i))
+      last = i;
+
+  bool loaded_any = false;
+  for (size_t i = 0; i <= last; ++i) {
+    auto &group = definition_groups[i];
+    if (group.loaded)
+      continue;
+    load_definition_group(group);
+    loaded_any = true;
+  }
+  return loaded_any;
+}
+
+bool load_definitions_for_expression(std::string_view expression) {
+  if (!lazy_loading)
+    return false;
+
+  bool loaded_any = false;
+  size_t i = 0;
+  while (i < expression.size()) {
+    if (!is_identifier_byte(expression[i]) ||
+        std::isdigit((unsigned char)expression[i])) {
+      ++i;
+      continue;
+    }
+    size_t start = i;
+    while (i < expression.size() && is_identifier_byte(expression[i]))
+      ++i;
+    std::string_view word = expression.substr(start, i - start);
+
+    // Names are tried as they are, then without trailing digits ("m2") and
+    // finally without what could be a prefix ("km").
+    std::string_view trimmed = word;
+    while (!trimmed.empty() && std::isdigit((unsigned char)trimmed.back()))
+      trimmed.remove_suffix(1);
+    if (name_index.count(std::string(word))) {
+      loaded_any |= load_definitions_for_name(word);
+      continue;
+    }
+    for (size_t skip = 0; skip < trimmed.size() && skip <= MAX_PREFIX_LENGTH;
+         ++skip) {
+      // Do not split UTF-8 sequences.
+      if (((unsigned char)trimmed[skip] & 0xC0) == 0x80)
+        continue;
+      std::string_view candidate = trimmed.substr(skip);
+      if (name_index.count(std::string(candidate))) {
+        loaded_any |= load_definitions_for_name(candidate);
+        break;
+      }
+    }
+  }
+  return loaded_any;
+}
@@ -0,0 +1,49 @@
+#pragma once
+
+#include <libqalculate/Calculator.h>
+#include <string_view>
+
+struct DefinitionGroup {
+  // Suffix of the load_global_* function, also used by ProcessPool(preload=)
+  char const *name;
+  bool (Calculator::*load)();
+  // Writes every loaded item of the group as a definitions file, null if the
+  // items are saved together with another group's.
+  int (Calculator::*save)(char const *file_name, bool save_global);
+  // Global definitions file, scanned for names when lazy loading.
+  char const *file_name;
+  bool loaded;
+};
+
+// In the order libqalculate's loadGlobalDefinitions() loads them in, items
+// may refer to those of the groups before theirs.
+inline DefinitionGroup definition_groups[] = {
+    {"prefixes", &Calculator::loadGlobalPrefixes, &Calculator::savePrefixes,
+     "prefixes.xml", false},
+    // Currencies are units.
+    {"currencies", &Calculator::loadGlobalCurrencies, nullptr, "currencies.xml",
+     false},
+    {"units", &Calculator::loadGlobalUnits, &Calculator::saveUnits, "units.xml",
+     false},
+    {"functions", &Calculator::loadGlobalFunctions, &Calculator::saveFunctions,
+     "functions.xml", false},
+    {"dataSets", &Calculator::loadGlobalDataSets, &Calculator::saveDataSets,
+     "datasets.xml", false},
+    {"variables", &Calculator::loadGlobalVariables, &Calculator::saveVariables,
+     "variables.xml", false},
+};
+
+DefinitionGroup *find_definition_group(std::string_view name);
+
+// Loads the group unless it has been loaded already, throws on failure.
+void load_definition_group(DefinitionGroup &group);
+
+// When lazy loading is enabled an index of the names in the global
+// definition files is built, and the groups a name belongs to are loaded the
+// first time it fails to resolve, together with the groups before them.
+bool lazy_loading_enabled();
+void set_lazy_loading(bool enabled);
+
+// Return whether anything was loaded.
+bool load_definitions_for_name(std::string_view name);
+bool load_definitions_for_expression(std::string_view expression);
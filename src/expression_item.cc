@@ -1,13 +1,22 @@
+#include "context.hh"
+#include "definitions.hh"
 #include "expression_items.hh"
 #include "generated.hh"
+#include "messages.hh"
 #include "options.hh"
 #include "pybind.hh"
+#include "stats.hh"
 #include "wrappers.hh"
 
+#include <array>
 #include <libqalculate/ExpressionItem.h>
 #include <limits>
+#include <optional>
 #include <pybind11/functional.h>
 #include <pybind11/stl.h>
+#include <string>
+#include <unordered_map>
+#include <vector>
 
 py::class_<ExpressionName> add_expression_name(py::module_ &m) {
   return add_auto_expression_name(m)
@@ -37,6 +46,43 @@ public:
   size_t size() const { return _parent->countNames(); }
 };
 
+void expression_item_repr(ExpressionItem const *item, std::string &output) {
+  if (!item) {
+    output += "None";
+    return;
+  }
+
+  output += "<";
+  switch (item->type()) {
+  case TYPE_VARIABLE:
+    output += item->subtype() == SUBTYPE_UNKNOWN_VARIABLE ? "UnknownVariable"
+                                                          : "Variable";
+    break;
+  case TYPE_FUNCTION:
+    output += "MathFunction";
+    break;
+  case TYPE_UNIT:
+    output += "Unit";
+    break;
+  default:
+    output += "ExpressionItem";
+    break;
+  }
+  output += " '";
+  output += item->name();
+  output += "'>";
+}
+
+namespace {
+
+std::string expression_item_repr_string(ExpressionItem const *item) {
+  std::string output;
+  expression_item_repr(item, output);
+  return output;
+}
+
+} // namespace
+
 template <typename Ret, typename... Args>
 std::pair<Ret (*)(Args..., void *), void *>
 make_function_pointer_pair(std::function<Ret(Args...)> const &function) {
@@ -70,18 +116,110 @@ make_function_pointer_pair(std::function<Ret(Args...)> const &function) {
       py::arg("can_display_unicode_string") =                                  \
           static_cast<std::function<bool(char const *)>>(nullptr))
 
+// Changes whenever an item list grows, shrinks or is reallocated. Items
+// replaced in place are not noticed, cached items are checked on use too.
+using LoadedItemsStamp = std::array<std::pair<size_t, void const *>, 4>;
+
+LoadedItemsStamp loaded_items_stamp() {
+  auto list = [](auto const &items) {
+    return std::pair<size_t, void const *>(items.size(), items.data());
+  };
+  return {list(CALCULATOR->prefixes), list(CALCULATOR->units),
+          list(CALCULATOR->variables), list(CALCULATOR->functions)};
+}
+
+// Name lookups are cached per item type, names that were not found are not.
+// Cached items are referenced, so they stay valid after being removed.
+template <typename T> struct ExpressionItemCache {
+  static inline std::unordered_map<std::string, QalcRef<T>> items;
+  static inline LoadedItemsStamp stamp{};
+};
+
+template <typename T, typename Lookup>
+T *find_expression_item(std::string_view name, Lookup lookup) {
+  auto &cache = ExpressionItemCache<T>::items;
+  auto &stamp = ExpressionItemCache<T>::stamp;
+  auto check_stamp = [&] {
+    if (stamp != loaded_items_stamp()) {
+      cache.clear();
+      stamp = loaded_items_stamp();
+    }
+  };
+
+  check_stamp();
+  std::string key(name);
+  if (auto it = cache.find(key); it != cache.end()) {
+    // Deactivated or renamed since, which does not change the lists.
+    if (it->second->isActive() && it->second->hasName(key))
+      return it->second.get();
+    cache.erase(it);
+  }
+
+  T *item = lookup(key);
+  if (!item && load_definitions_for_name(name)) {
+    item = lookup(key);
+    check_stamp();
+  }
+  if (item)
+    cache.emplace(std::move(key), QalcRef<T>(item));
+  return item;
+}
+
 #define DEF_EXPRESSION_ITEM_GETTER(fun, type)                                  \
   def_static(                                                                  \
       "get",                                                                   \
       [](std::string_view name) -> QalcRef<type> {                             \
         /* TODO: How useful is the second argument? */                         \
-        auto ptr = (fun)(std::string(name));                                   \
+        auto ptr = find_expression_item<type>(                                 \
+            name, [](std::string const &name) { return (fun)(name); });        \
         if (!ptr)                                                              \
           throw py::key_error(#type " with name " + std::string(name) +        \
                               " does not exist");                              \
         return QalcRef(ptr);                                                   \
       },                                                                       \
-      py::arg("name"), py::pos_only{})
+      py::arg("name"), py::pos_only{})                                         \
+      .def_static(                                                             \
+          "get_many",                                                          \
+          [](std::vector<std::string> const &names) {                          \
+            std::vector<std::optional<QalcRef<type>>> result;                  \
+            result.reserve(names.size());                                      \
+            for (auto const &name : names) {                                   \
+              auto ptr = find_expression_item<type>(                           \
+                  name, [](std::string const &name) { return (fun)(name); });  \
+              if (ptr)                                                         \
+                result.emplace_back(QalcRef(ptr));                             \
+              else                                                             \
+                result.emplace_back();                                         \
+            }                                                                  \
+            return result;                                                     \
+          },                                                                   \
+          py::arg("names"), py::pos_only{})
+
+// Iterates over one of the calculator's item lists by index, so items added
+// during iteration do not invalidate it.
+template <typename T> class LoadedItems {
+  std::vector<T *> Calculator::*items;
+  size_t index = 0;
+
+public:
+  explicit LoadedItems(std::vector<T *> Calculator::*items) : items(items) {}
+
+  QalcRef<T> next() {
+    auto const &list = CALCULATOR->*items;
+    if (index >= list.size())
+      throw py::stop_iteration();
+    return QalcRef<T>(list[index++]);
+  }
+};
+
+template <typename T, typename Class>
+void def_loaded_items(Class &cls, char const *iterator_name,
+                      std::vector<T *> Calculator::*items) {
+  py::class_<LoadedItems<T>>(cls, iterator_name)
+      .def("__iter__", [](py::object self) { return self; })
+      .def("__next__", &LoadedItems<T>::next);
+  cls.def_static("loaded", [items] { return LoadedItems<T>(items); });
+}
 
 qalc_class_<ExpressionItem> add_expression_item(py::module_ &m) {
   py::class_<ExpressionNamesProxy>(m, "_ExpressionNames")
@@ -98,6 +236,8 @@ qalc_class_<ExpressionItem> add_expression_item(py::module_ &m) {
 
       .DEF_EXPRESSION_ITEM_GETTER(CALCULATOR->getExpressionItem, ExpressionItem)
 
+      .def("__repr__", expression_item_repr_string, py::is_operator{})
+
       // NOTE: While this function does accept extra arguments in libqalculate
       //       I think it can be replaced by the "findName" function instead.
       //       Therefore this can just be a property while findName can be used
@@ -146,8 +286,16 @@ qalc_class_<ExpressionItem> add_expression_item(py::module_ &m) {
               static_cast<std::function<bool(char const *)>>(nullptr));
 }
 
+namespace {
+
+CallStats &function_calculate_stats = call_stats("MathFunction.calculate");
+
+} // namespace
+
 qalc_class_<MathFunction> add_math_function(py::module_ &m) {
-  return qalc_class_<MathFunction, ExpressionItem>(m, "MathFunction")
+  auto cls = qalc_class_<MathFunction, ExpressionItem>(m, "MathFunction");
+  def_loaded_items(cls, "_Loaded", &Calculator::functions);
+  return cls
       .def(py::init([](MathStructureFunctionProxy mstruct) {
              return QalcRef<MathFunction>(mstruct.function());
            }),
@@ -165,14 +313,34 @@ qalc_class_<MathFunction> add_math_function(py::module_ &m) {
               vargs.addChild_nocopy(marg);
             }
 
-            return MathStructureRef::construct(
-                self.calculate(vargs, (EvaluationOptions const &)options));
+            StatsTimer timer(function_calculate_stats);
+            MessageGuard messages;
+            std::optional<PEvaluationOptions> context_options;
+            auto const &eval_options =
+                context_evaluation_options(options, context_options);
+            ContextPrecision precision;
+            MathStructure result;
+            {
+              ContextGilRelease _gil(precision);
+              result = self.calculate(vargs, eval_options);
+            }
+            return MathStructureRef::adopt(result);
           },
-          py::arg("options") = global_evaluation_options)
+          py::arg("options") = &global_evaluation_options)
       .def("calculate", [](MathFunction &self, MathStructureVectorProxy &vargs,
                            PEvaluationOptions const &options) {
-        return MathStructureRef::construct(self.calculate(
-            (MathStructure &)vargs, (EvaluationOptions const &)options));
+        StatsTimer timer(function_calculate_stats);
+        MessageGuard messages;
+        std::optional<PEvaluationOptions> context_options;
+        auto const &eval_options =
+            context_evaluation_options(options, context_options);
+        ContextPrecision precision;
+        MathStructure result;
+        {
+          ContextGilRelease _gil(precision);
+          result = self.calculate((MathStructure &)vargs, eval_options);
+        }
+        return MathStructureRef::adopt(result);
       });
 }
 
@@ -190,8 +358,9 @@ py::class_<PAssumptions> &add_assumptions(py::module_ &m) {
 }
 
 qalc_class_<Variable> add_variable(py::module_ &m) {
-  return qalc_class_<Variable, ExpressionItem>(m, "Variable")
-      .DEF_EXPRESSION_ITEM_GETTER(CALCULATOR->getVariable, Variable)
+  auto cls = qalc_class_<Variable, ExpressionItem>(m, "Variable");
+  def_loaded_items(cls, "_Loaded", &Calculator::variables);
+  return cls.DEF_EXPRESSION_ITEM_GETTER(CALCULATOR->getVariable, Variable)
       .def_property_readonly("is_known", &Variable::isKnown);
 }
 
@@ -208,34 +377,44 @@ qalc_class_<UnknownVariable> add_unknown_variable(py::module_ &m) {
 }
 
 qalc_class_<Unit> add_unit(py::module_ &m) {
+  auto cls = qalc_class_<Unit, ExpressionItem>(m, "Unit");
+  def_loaded_items(cls, "_Loaded", &Calculator::units);
   return init_auto_unit(
-      qalc_class_<Unit, ExpressionItem>(m, "Unit")
-          .DEF_EXPRESSION_ITEM_GETTER(CALCULATOR->getUnit, Unit)
-
-          .def_property_readonly_static(
-              "DEGREE",
-              [](py::handle) { return QalcRef(CALCULATOR->getDegUnit()); })
-
-          .def_property_readonly_static(
-              "GRADIAN",
-              [](py::handle) { return QalcRef(CALCULATOR->getGraUnit()); })
-
-          .def_property_readonly_static(
-              "RADIAN",
-              [](py::handle) { return QalcRef(CALCULATOR->getRadUnit()); })
-
-          .def_property_readonly(
-              "is_si", [](Unit const &self) { return self.isSIUnit(); })
-          .def_property(
-              "system", [](Unit const &self) { return self.system(); },
-              [](Unit &self, std::string_view system) {
-                // The docsting for setSystem says that setting to "SI"
-                // case-insensitively is equivalent to setAsSIUnit().
-                // But the implementation is missing a check for this single
-                // case...
-                if (system == "sI")
-                  self.setAsSIUnit();
-                else
-                  self.setSystem(std::string(system));
-              }));
+             cls.DEF_EXPRESSION_ITEM_GETTER(CALCULATOR->getUnit, Unit)
+
+                 .def_property_readonly_static("DEGREE",
+                                               [](py::handle) {
+                                                 return QalcRef(
+                                                     CALCULATOR->getDegUnit());
+                                               })
+
+                 .def_property_readonly_static("GRADIAN",
+                                               [](py::handle) {
+                                                 return QalcRef(
+                                                     CALCULATOR->getGraUnit());
+                                               })
+
+                 .def_property_readonly_static("RADIAN",
+                                               [](py::handle) {
+                                                 return QalcRef(
+                                                     CALCULATOR->getRadUnit());
+                                               })
+
+                 .def_property_readonly(
+                     "is_si", [](Unit const &self) { return self.isSIUnit(); })
+                 .def_property(
+                     "system", [](Unit const &self) { return self.system(); },
+                     [](Unit &self, std::string_view system) {
+                       // The docsting for setSystem says that setting to "SI"
+                       // case-insensitively is equivalent to setAsSIUnit().
+                       // But the implementation is missing a check for this
+                       // single case...
+                       if (system == "sI")
+                         self.setAsSIUnit();
+                       else
+                         self.setSystem(std::string(system));
+                     }))
+      // Replaces the generated repr, to match the one MathStructure.Unit
+      // embeds.
+      .def("__repr__", expression_item_repr_string, py::is_operator{});
 }
@@ -0,0 +1,75 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <cstddef>
+#include <functional>
+#include <string>
+#include <type_traits>
+
+// options_hash and options_equal are generated for every options struct,
+// these handle a single field of one.
+
+template <typename T> void hash_option(size_t &seed, T const &value) {
+  size_t hash;
+  if constexpr (std::is_enum_v<T>)
+    hash = std::hash<std::underlying_type_t<T>>{}(
+        static_cast<std::underlying_type_t<T>>(value));
+  else if constexpr (std::is_class_v<T> && !std::is_same_v<T, std::string>)
+    hash = options_hash(value);
+  else
+    hash = std::hash<T>{}(value);
+  seed ^= hash + 0x9e3779b97f4a7c15 + (seed << 6) + (seed >> 2);
+}
+
+template <typename T> bool option_equal(T const &a, T const &b) {
+  if constexpr (std::is_class_v<T> && !std::is_same_v<T, std::string>)
+    return options_equal(a, b);
+  else
+    return a == b;
+}
+
+// Immutable copy of an options struct. Entry points take options by
+// reference so these are never copied again, and the hash is computed once
+// for use as a cache key.
+template <typename T> class Frozen final : public T {
+public:
+  size_t hash;
+
+  explicit Frozen(T const &options) : T(options), hash(options_hash(options)) {}
+};
+
+template <typename T>
+py::class_<Frozen<T>, T> add_frozen_options(py::module_ &m, py::class_<T> &cls,
+                                           char const *name) {
+  cls.def("freeze", [](T const &self) { return Frozen<T>(self); });
+
+  auto refuse = [](py::handle, py::str attribute, py::args) {
+    throw py::attribute_error("cannot modify attribute '" +
+                              attribute.cast<std::string>() +
+                              "' of frozen options");
+  };
+
+  return py::class_<Frozen<T>, T>(m, name)
+      .def("freeze", [](py::object self) { return self; })
+      .def("replace",
+           [](Frozen<T> const &self, py::kwargs changes) {
+             py::object copy = py::cast(T(self));
+             for (auto [key, value] : changes)
+               py::setattr(copy, key, value);
+             return Frozen<T>(copy.cast<T const &>());
+           })
+      .def("__setattr__", refuse)
+      .def("__delattr__", refuse)
+      .def("__hash__", [](Frozen<T> const &self) { return self.hash; })
+      // Only frozen options compare equal, mutable ones are not hashable so
+      // equality with them would break the hash invariant.
+      .def("__eq__",
+           [](Frozen<T> const &self, Frozen<T> const &other) {
+             return options_equal(self, other);
+           })
+      .def("__eq__", [](Frozen<T> const &, py::handle) -> py::object {
+        return py::reinterpret_borrow<py::object>(
+            py::handle(Py_NotImplemented));
+      });
+}
@@ -0,0 +1,86 @@
+#include "lazy.hh"
+
+#include <iterator>
+#include <string>
+#include <string_view>
+#include <typeindex>
+#include <unordered_map>
+
+#include "generated.hh"
+
+namespace {
+
+constexpr size_t CLASS_COUNT = std::size(builtin_function_classes);
+
+// The module outlives every use of these, so a borrowed handle is enough.
+py::handle lazy_module;
+bool registered[CLASS_COUNT];
+
+py::object builtin_function_class(size_t index) {
+  auto const &cls = builtin_function_classes[index];
+  if (!registered[index]) {
+    auto m = py::reinterpret_borrow<py::module_>(lazy_module);
+    cls.add(m);
+    registered[index] = true;
+  }
+  return lazy_module.attr(cls.name);
+}
+
+} // namespace
+
+namespace {
+
+void const *most_derived_item(ExpressionItem const *src,
+                              std::type_info const *&type) {
+  if (!src) {
+    type = nullptr;
+    return src;
+  }
+  type = &typeid(*src);
+
+  static std::unordered_map<std::type_index, size_t> const indices = [] {
+    std::unordered_map<std::type_index, size_t> result;
+    for (size_t i = 0; i < CLASS_COUNT; ++i)
+      result.emplace(builtin_function_classes[i].type, i);
+    return result;
+  }();
+  // Instances must get their most derived class from the start, otherwise
+  // isinstance checks would depend on whether the class was accessed before.
+  auto it = indices.find(*type);
+  if (it != indices.end() && lazy_module)
+    builtin_function_class(it->second);
+  return dynamic_cast<void const *>(src);
+}
+
+} // namespace
+
+void const *PYBIND11_NAMESPACE::polymorphic_type_hook<ExpressionItem>::get(
+    ExpressionItem const *src, std::type_info const *&type) {
+  return most_derived_item(src, type);
+}
+
+void const *PYBIND11_NAMESPACE::polymorphic_type_hook<MathFunction>::get(
+    MathFunction const *src, std::type_info const *&type) {
+  return most_derived_item(src, type);
+}
+
+void add_lazy_builtin_functions(py::module_ &m) {
+  lazy_module = m;
+
+  m.def("__getattr__", [](std::string_view name) -> py::object {
+    for (size_t i = 0; i < CLASS_COUNT; ++i)
+      if (name == builtin_function_classes[i].name)
+        return builtin_function_class(i);
+    throw py::attribute_error("module 'qalculate' has no attribute '" +
+                              std::string(name) + "'");
+  });
+
+  m.def("__dir__", []() {
+    py::list names(lazy_module.attr("__dict__"));
+    for (size_t i = 0; i < CLASS_COUNT; ++i)
+      if (!registered[i])
+        names.append(builtin_function_classes[i].name);
+    names.sort();
+    return names;
+  });
+}
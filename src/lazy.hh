@@ -0,0 +1,7 @@
+#pragma once
+
+#include "pybind.hh"
+
+// Makes the builtin function classes available through a module __getattr__
+// instead of registering all of them at import.
+void add_lazy_builtin_functions(py::module_ &m);
@@ -0,0 +1,454 @@
+#include "matrix.hh"
+
+#include <algorithm>
+#include <cmath>
+#include <libqalculate/qalculate.h>
+#include <limits>
+#include <optional>
+#include <pybind11/gil.h>
+#include <vector>
+
+#include "context.hh"
+
+namespace {
+
+// A vector that isn't a matrix is treated as a single row (or column,
+// depending on which side of the multiplication it is on), like numpy does.
+struct MatrixShape {
+  size_t rows;
+  size_t columns;
+  bool is_vector;
+};
+
+MatrixShape matrix_shape(MathStructure const &m, bool vector_as_column) {
+  if (!m.isVector())
+    throw py::type_error("matrix operations require a vector or a matrix");
+  if (m.isMatrix())
+    return {m.rows(), m.columns(), false};
+  if (vector_as_column)
+    return {m.size(), 1, true};
+  return {1, m.size(), true};
+}
+
+MathStructure const &matrix_element(MathStructure const &m,
+                                    MatrixShape const &shape, size_t row,
+                                    size_t column) {
+  if (shape.is_vector)
+    return m[shape.rows == 1 ? column : row];
+  return m[row][column];
+}
+
+void require_square(MathStructure const &m) {
+  if (!m.isMatrix() || m.rows() != m.columns())
+    throw py::value_error("operation requires a square matrix");
+}
+
+// Dense row-major matrix used by the floating point fast path.
+struct DoubleMatrix {
+  size_t rows;
+  size_t columns;
+  std::vector<double> data;
+
+  double &at(size_t row, size_t column) { return data[row * columns + column]; }
+};
+
+// Only used when doubles hold as many digits as the calculator's precision;
+// results would be silently less precise than requested otherwise.
+std::optional<DoubleMatrix> as_double_matrix(MathStructure const &m,
+                                             MatrixShape const &shape) {
+  if (CALCULATOR->getPrecision() > std::numeric_limits<double>::digits10)
+    return std::nullopt;
+
+  DoubleMatrix result{shape.rows, shape.columns, {}};
+  result.data.reserve(shape.rows * shape.columns);
+  for (size_t i = 0; i < shape.rows; ++i)
+    for (size_t j = 0; j < shape.columns; ++j) {
+      auto &element = matrix_element(m, shape, i, j);
+      if (!element.isNumber())
+        return std::nullopt;
+      auto &number = element.number();
+      if (!number.isReal() || !number.isFloatingPoint() || number.isInterval())
+        return std::nullopt;
+      result.data.push_back(number.floatValue());
+    }
+  return result;
+}
+
+MathStructure number_structure(double value) {
+  Number number;
+  number.setFloat(value);
+  return MathStructure(number);
+}
+
+MathStructure to_structure(DoubleMatrix &m, bool as_vector) {
+  MathStructure result;
+  result.clearVector();
+  if (as_vector) {
+    for (double value : m.data)
+      result.addChild(number_structure(value));
+    return result;
+  }
+
+  for (size_t i = 0; i < m.rows; ++i) {
+    MathStructure row;
+    row.clearVector();
+    for (size_t j = 0; j < m.columns; ++j)
+      row.addChild(number_structure(m.at(i, j)));
+    result.addChild(row);
+  }
+  return result;
+}
+
+// Gauss-Jordan elimination with partial pivoting, reducing `m` to the
+// identity while applying the same row operations to `rhs`. Returns the
+// determinant of `m` (zero when it is singular).
+double gauss_jordan(DoubleMatrix &m, DoubleMatrix &rhs) {
+  size_t n = m.rows;
+  double det = 1;
+  for (size_t col = 0; col < n; ++col) {
+    size_t pivot = col;
+    for (size_t row = col + 1; row < n; ++row)
+      if (std::abs(m.at(row, col)) > std::abs(m.at(pivot, col)))
+        pivot = row;
+    if (m.at(pivot, col) == 0)
+      return 0;
+
+    if (pivot != col) {
+      for (size_t j = 0; j < n; ++j)
+        std::swap(m.at(col, j), m.at(pivot, j));
+      for (size_t j = 0; j < rhs.columns; ++j)
+        std::swap(rhs.at(col, j), rhs.at(pivot, j));
+      det = -det;
+    }
+
+    double p = m.at(col, col);
+    det *= p;
+    for (size_t j = 0; j < n; ++j)
+      m.at(col, j) /= p;
+    for (size_t j = 0; j < rhs.columns; ++j)
+      rhs.at(col, j) /= p;
+
+    for (size_t row = 0; row < n; ++row) {
+      if (row == col)
+        continue;
+      double factor = m.at(row, col);
+      if (factor == 0)
+        continue;
+      for (size_t j = 0; j < n; ++j)
+        m.at(row, j) -= factor * m.at(col, j);
+      for (size_t j = 0; j < rhs.columns; ++j)
+        rhs.at(row, j) -= factor * rhs.at(col, j);
+    }
+  }
+  return det;
+}
+
+DoubleMatrix identity(size_t n) {
+  DoubleMatrix result{n, n, std::vector<double>(n * n)};
+  for (size_t i = 0; i < n; ++i)
+    result.at(i, i) = 1;
+  return result;
+}
+
+MathStructure multiply_exact(MathStructure const &a, MatrixShape const &as,
+                             MathStructure const &b, MatrixShape const &bs,
+                             EvaluationOptions const &options) {
+  auto element = [&](size_t i, size_t j) {
+    MathStructure sum;
+    for (size_t k = 0; k < as.columns; ++k) {
+      MathStructure term(matrix_element(a, as, i, k));
+      term.multiply(matrix_element(b, bs, k, j));
+      if (k == 0)
+        sum = term;
+      else
+        sum.add(term, true);
+    }
+    sum.eval(options);
+    return sum;
+  };
+
+  MathStructure result;
+  result.clearVector();
+  if (as.is_vector || bs.is_vector) {
+    for (size_t i = 0; i < as.rows; ++i)
+      for (size_t j = 0; j < bs.columns; ++j)
+        result.addChild(element(i, j));
+    return result;
+  }
+
+  for (size_t i = 0; i < as.rows; ++i) {
+    MathStructure row;
+    row.clearVector();
+    for (size_t j = 0; j < bs.columns; ++j)
+      row.addChild(element(i, j));
+    result.addChild(row);
+  }
+  return result;
+}
+
+size_t vector_depth(MathStructure const *m) {
+  size_t depth = 0;
+  while (m->isVector()) {
+    ++depth;
+    if (m->size() == 0)
+      break;
+    m = &(*m)[0];
+  }
+  return depth;
+}
+
+// Broadcasting follows numpy: the shallower operand is matched against the
+// innermost vectors of the deeper one, and vectors of length one are
+// stretched to fit.
+std::optional<MathStructure> apply_elementwise(MathStructure const &a,
+                                               size_t a_depth,
+                                               MathStructure const &b,
+                                               size_t b_depth,
+                                               ElementwiseOperation operation,
+                                               EvaluationOptions const &options) {
+  if (a_depth == 0 && b_depth == 0)
+    return apply_scalar_operation(a, b, operation, options);
+
+  MathStructure result;
+  result.clearVector();
+  if (a_depth > b_depth) {
+    for (size_t i = 0; i < a.size(); ++i) {
+      auto element =
+          apply_elementwise(a[i], a_depth - 1, b, b_depth, operation, options);
+      if (!element)
+        return std::nullopt;
+      result.addChild(*element);
+    }
+  } else if (b_depth > a_depth) {
+    for (size_t i = 0; i < b.size(); ++i) {
+      auto element =
+          apply_elementwise(a, a_depth, b[i], b_depth - 1, operation, options);
+      if (!element)
+        return std::nullopt;
+      result.addChild(*element);
+    }
+  } else {
+    size_t size = std::max(a.size(), b.size());
+    if ((a.size() != size && a.size() != 1) ||
+        (b.size() != size && b.size() != 1))
+      return std::nullopt;
+    for (size_t i = 0; i < size; ++i) {
+      auto element = apply_elementwise(a[a.size() == 1 ? 0 : i], a_depth - 1,
+                                       b[b.size() == 1 ? 0 : i], b_depth - 1,
+                                       operation, options);
+      if (!element)
+        return std::nullopt;
+      result.addChild(*element);
+    }
+  }
+  return result;
+}
+
+} // namespace
+
+static bool apply_number_operation(Number &a, Number const &b,
+                                   ElementwiseOperation operation) {
+  switch (operation) {
+  case ElementwiseOperation::ADD:
+    return a.add(b);
+  case ElementwiseOperation::SUBTRACT:
+    return a.subtract(b);
+  case ElementwiseOperation::MULTIPLY:
+    return a.multiply(b);
+  case ElementwiseOperation::DIVIDE:
+    return a.divide(b);
+  case ElementwiseOperation::RAISE:
+    return a.raise(b);
+  }
+  return false;
+}
+
+// Number arithmetic knows nothing about the evaluation options, so its result
+// is only used if it did not become approximate, complex or an interval when
+// the operands were not. Evaluation takes care of the options otherwise.
+static bool number_result_allowed(Number const &result, Number const &a,
+                                  Number const &b) {
+  if (result.isApproximate() && !a.isApproximate() && !b.isApproximate())
+    return false;
+  if (result.isComplex() && !a.isComplex() && !b.isComplex())
+    return false;
+  if (result.isInterval() && !a.isInterval() && !b.isInterval())
+    return false;
+  return true;
+}
+
+MathStructure apply_scalar_operation(MathStructure const &a,
+                                     MathStructure const &b,
+                                     ElementwiseOperation operation,
+                                     EvaluationOptions const &options) {
+  if (a.isNumber() && b.isNumber()) {
+    Number result(a.number());
+    if (apply_number_operation(result, b.number(), operation) &&
+        number_result_allowed(result, a.number(), b.number()))
+      return MathStructure(result);
+  }
+
+  MathStructure result(a);
+  switch (operation) {
+  case ElementwiseOperation::ADD:
+    result.add(b);
+    break;
+  case ElementwiseOperation::SUBTRACT:
+    result.subtract(b);
+    break;
+  case ElementwiseOperation::MULTIPLY:
+    result.multiply(b);
+    break;
+  case ElementwiseOperation::DIVIDE:
+    result.divide(b);
+    break;
+  case ElementwiseOperation::RAISE:
+    result.raise(b);
+    break;
+  }
+  result.eval(options);
+  return result;
+}
+
+MathStructureRef elementwise(MathStructure const &a, MathStructure const &b,
+                             ElementwiseOperation operation,
+                             PEvaluationOptions const &options) {
+  std::optional<MathStructure> result;
+  {
+    CalculatorGilRelease _gil;
+    result = apply_elementwise(a, vector_depth(&a), b, vector_depth(&b),
+                               operation, options);
+  }
+  if (!result)
+    throw py::value_error("operands could not be broadcast together");
+  return MathStructureRef::construct(*result);
+}
+
+MathStructureRef matrix_multiply(MathStructure const &a, MathStructure const &b,
+                                 PEvaluationOptions const &options) {
+  auto as = matrix_shape(a, false);
+  auto bs = matrix_shape(b, true);
+  if (as.columns != bs.rows)
+    throw py::value_error("matrix dimensions do not match: " +
+                          std::to_string(as.rows) + "x" +
+                          std::to_string(as.columns) + " @ " +
+                          std::to_string(bs.rows) + "x" +
+                          std::to_string(bs.columns));
+
+  MathStructure result;
+  {
+    CalculatorGilRelease _gil;
+    auto da = as_double_matrix(a, as);
+    auto db = da ? as_double_matrix(b, bs) : std::nullopt;
+    if (da && db) {
+      DoubleMatrix product{as.rows, bs.columns,
+                           std::vector<double>(as.rows * bs.columns)};
+      for (size_t i = 0; i < as.rows; ++i)
+        for (size_t k = 0; k < as.columns; ++k) {
+          double lhs = da->at(i, k);
+          for (size_t j = 0; j < bs.columns; ++j)
+            product.at(i, j) += lhs * db->at(k, j);
+        }
+      result = to_structure(product, as.is_vector || bs.is_vector);
+    } else
+      result = multiply_exact(a, as, b, bs, options);
+  }
+  // The dot product of two vectors is a scalar, as in numpy.
+  if (as.is_vector && bs.is_vector) {
+    MathStructure scalar(result[0]);
+    return MathStructureRef::construct(scalar);
+  }
+  return MathStructureRef::construct(result);
+}
+
+MathStructureRef matrix_transpose(MathStructure const &matrix) {
+  auto result = MathStructureRef::construct(matrix);
+  if (!result->isMatrix() || !result->transposeMatrix())
+    throw py::value_error("only matrices can be transposed");
+  return result;
+}
+
+MathStructureRef matrix_determinant(MathStructure const &matrix,
+                                    PEvaluationOptions const &options) {
+  require_square(matrix);
+
+  MathStructure result;
+  {
+    CalculatorGilRelease _gil;
+    if (auto m = as_double_matrix(matrix, matrix_shape(matrix, false))) {
+      DoubleMatrix rhs{m->rows, 0, {}};
+      result = number_structure(gauss_jordan(*m, rhs));
+    } else
+      matrix.determinant(result, options);
+  }
+  return MathStructureRef::construct(result);
+}
+
+MathStructureRef matrix_inverse(MathStructure const &matrix,
+                                PEvaluationOptions const &options) {
+  require_square(matrix);
+
+  MathStructure result;
+  bool ok;
+  {
+    CalculatorGilRelease _gil;
+    if (auto m = as_double_matrix(matrix, matrix_shape(matrix, false))) {
+      auto inverse = identity(m->rows);
+      ok = gauss_jordan(*m, inverse) != 0;
+      if (ok)
+        result = to_structure(inverse, false);
+    } else {
+      result = matrix;
+      ok = result.invertMatrix(options);
+    }
+  }
+  if (!ok)
+    throw py::value_error("matrix is not invertible");
+  return MathStructureRef::construct(result);
+}
+
+MathStructureRef matrix_adjugate(MathStructure const &matrix,
+                                 PEvaluationOptions const &options) {
+  require_square(matrix);
+
+  auto result = MathStructureRef::construct(matrix);
+  bool ok;
+  {
+    CalculatorGilRelease _gil;
+    ok = result->adjointMatrix(options);
+  }
+  if (!ok)
+    throw py::value_error("failed to calculate the adjugate matrix");
+  return result;
+}
+
+MathStructureRef matrix_solve(MathStructure const &a, MathStructure const &b,
+                              PEvaluationOptions const &options) {
+  require_square(a);
+  auto bs = matrix_shape(b, true);
+  if (bs.rows != a.rows())
+    throw py::value_error("right hand side has " + std::to_string(bs.rows) +
+                          " rows, expected " + std::to_string(a.rows()));
+
+  MathStructure result;
+  bool ok = true;
+  {
+    CalculatorGilRelease _gil;
+    auto da = as_double_matrix(a, matrix_shape(a, false));
+    auto db = da ? as_double_matrix(b, bs) : std::nullopt;
+    if (da && db) {
+      ok = gauss_jordan(*da, *db) != 0;
+      if (ok)
+        result = to_structure(*db, bs.is_vector);
+    } else {
+      MathStructure inverse(a);
+      ok = inverse.invertMatrix(options);
+      if (ok)
+        result = multiply_exact(inverse, matrix_shape(inverse, false), b, bs,
+                                options);
+    }
+  }
+  if (!ok)
+    throw py::value_error("matrix is singular");
+  return MathStructureRef::construct(result);
+}
@@ -0,0 +1,33 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <libqalculate/MathStructure.h>
+
+#include "ref.hh"
+#include "wrappers.hh"
+
+MathStructureRef matrix_multiply(MathStructure const &a, MathStructure const &b,
+                                 PEvaluationOptions const &options);
+MathStructureRef matrix_transpose(MathStructure const &matrix);
+MathStructureRef matrix_determinant(MathStructure const &matrix,
+                                    PEvaluationOptions const &options);
+MathStructureRef matrix_inverse(MathStructure const &matrix,
+                                PEvaluationOptions const &options);
+MathStructureRef matrix_adjugate(MathStructure const &matrix,
+                                 PEvaluationOptions const &options);
+MathStructureRef matrix_solve(MathStructure const &a, MathStructure const &b,
+                              PEvaluationOptions const &options);
+
+enum class ElementwiseOperation { ADD, SUBTRACT, MULTIPLY, DIVIDE, RAISE };
+
+MathStructureRef elementwise(MathStructure const &a, MathStructure const &b,
+                             ElementwiseOperation operation,
+                             PEvaluationOptions const &options);
+
+// Applies a single operation to two scalars, using Number arithmetic when
+// both are numbers and evaluating the small expression otherwise.
+MathStructure apply_scalar_operation(MathStructure const &a,
+                                     MathStructure const &b,
+                                     ElementwiseOperation operation,
+                                     EvaluationOptions const &options);
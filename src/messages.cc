@@ -0,0 +1,87 @@
+#include "messages.hh"
+
+#include <deque>
+#include <libqalculate/qalculate.h>
+
+#include "context.hh"
+#include "stats.hh"
+
+namespace {
+
+// Messages moved out of the calculator's queue while enforcing the limit,
+// they are older than anything still in there.
+std::deque<CalculatorMessage> queued_messages;
+
+// libqalculate does not expose the size of its queue, so messages have to be
+// moved out to be counted.
+size_t move_messages() {
+  size_t count = 0;
+  while (CalculatorMessage *message = CALCULATOR->message()) {
+    queued_messages.emplace_back(std::move(*message));
+    CALCULATOR->nextMessage();
+    ++count;
+  }
+  return count;
+}
+
+void enforce_message_limit() {
+  if (message_queue_limit == std::numeric_limits<size_t>::max())
+    return;
+
+  move_messages();
+  while (queued_messages.size() > message_queue_limit) {
+    ++dropped_messages[queued_messages.front().type()];
+    queued_messages.pop_front();
+  }
+}
+
+} // namespace
+
+// The temporary message stack is shared by all threads and calculate_ex
+// pushes its own frame with exclusive access, which must not end up with a
+// frame of another call on top.
+MessageGuard::MessageGuard() : enabled(messages_enabled) {
+  if (!enabled) {
+    CalculatorGilRelease _lock(CalculatorAccess::EXCLUSIVE);
+    CALCULATOR->beginTemporaryStopMessages();
+  }
+}
+
+MessageGuard::~MessageGuard() {
+  if (enabled) {
+    if (StatsTimer::recording()) {
+      size_t count = move_messages();
+      for (auto it = queued_messages.end() - count; it != queued_messages.end();
+           ++it)
+        StatsTimer::add_message(*it);
+    }
+    enforce_message_limit();
+    return;
+  }
+  std::vector<CalculatorMessage> discarded;
+  {
+    CalculatorGilRelease _lock(CalculatorAccess::EXCLUSIVE);
+    CALCULATOR->endTemporaryStopMessages(false, &discarded);
+  }
+  for (auto const &message : discarded) {
+    StatsTimer::add_message(message);
+    ++dropped_messages[message.type()];
+  }
+}
+
+std::vector<CalculatorMessage> take_messages() {
+  std::vector<CalculatorMessage> messages(
+      std::make_move_iterator(queued_messages.begin()),
+      std::make_move_iterator(queued_messages.end()));
+  queued_messages.clear();
+  while (CalculatorMessage *msg = CALCULATOR->message()) {
+    messages.emplace_back(std::move(*msg));
+    CALCULATOR->nextMessage();
+  }
+  return messages;
+}
+
+void clear_messages() {
+  queued_messages.clear();
+  CALCULATOR->clearMessages();
+}
@@ -0,0 +1,27 @@
+#pragma once
+
+#include <libqalculate/Calculator.h>
+#include <limits>
+#include <map>
+#include <vector>
+
+// Limit on the number of queued messages, the oldest ones are dropped first.
+inline size_t message_queue_limit = std::numeric_limits<size_t>::max();
+inline bool messages_enabled = true;
+inline std::map<MessageType, size_t> dropped_messages;
+
+// Put around calls into libqalculate that may raise messages. Discards them
+// if messages are disabled and trims the queue to the limit afterwards.
+class MessageGuard {
+  bool enabled;
+
+public:
+  MessageGuard();
+  ~MessageGuard();
+
+  MessageGuard(MessageGuard const &) = delete;
+  MessageGuard &operator=(MessageGuard const &) = delete;
+};
+
+std::vector<CalculatorMessage> take_messages();
+void clear_messages();
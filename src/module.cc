@@ -1,6 +1,9 @@
 #include <cassert>
 #include <complex>
 #include <libqalculate/qalculate.h>
+#include <limits>
+#include <optional>
+#include <pthread.h>
 
 #include "pybind.hh"
 
@@ -12,22 +15,56 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/pytypes.h>
 #include <pybind11/stl.h>
+#include <pybind11/stl/filesystem.h>
 #include <string_view>
 
+#include "batcher.hh"
+#include "calculation.hh"
+#include "cli.hh"
+#include "context.hh"
+#include "conversion.hh"
+#include "converter.hh"
+#include "definitions.hh"
 #include "expression_items.hh"
+#include "frozen.hh"
 #include "generated.hh"
+#include "lazy.hh"
+#include "messages.hh"
+#include "names.hh"
 #include "number.hh"
 #include "options.hh"
+#include "pool.hh"
 #include "proxies.hh"
+#include "quantity.hh"
 #include "ref.hh"
+#include "snapshot.hh"
+#include "sparse.hh"
+#include "stats.hh"
 #include "wrappers.hh"
 
+namespace {
+
+CallStats &parse_stats = call_stats("parse");
+CallStats &calculate_stats = call_stats("calculate");
+CallStats &calculate_and_print_stats = call_stats("calculate_and_print");
+CallStats &print_stats = call_stats("print");
+
+} // namespace
+
 MathStructureRef calculate(MathStructure const &mstruct,
-                           PEvaluationOptions const &options, std::string to) {
+                           PEvaluationOptions const &options,
+                           Conversion const &to) {
+  StatsTimer timer(calculate_stats, &mstruct);
+  MessageGuard messages;
+  std::optional<PEvaluationOptions> context_options;
+  auto const &eval_options =
+      context_evaluation_options(options, context_options);
+  timer.set_options(eval_options);
+  ContextPrecision precision;
   MathStructure result;
   {
-    py::gil_scoped_release _gil;
-    result = CALCULATOR->calculate(mstruct, options, to);
+    ContextGilRelease _gil(precision);
+    result = calculate_to(mstruct, eval_options, to);
   }
   return MathStructureRef::adopt(result);
 }
@@ -44,6 +81,22 @@ PYBIND11_MODULE(qalculate, m) {
 
   new Calculator();
 
+  // The calculation thread does not survive fork(), so stop it beforehand and
+  // let libqalculate start a new one on demand in both processes. It may only
+  // be stopped while idle, calculations running with the GIL released are
+  // waited for first. Messages queued in the parent are not the child's to
+  // report.
+  pthread_atfork(
+      [] {
+        prepare_calculator_fork();
+        CALCULATOR->terminateThreads();
+      },
+      [] { finish_calculator_fork(false); },
+      [] {
+        finish_calculator_fork(true);
+        clear_messages();
+      });
+
   // TODO: Properties somewhere?
   m.def("get_precision", []() { return CALCULATOR->getPrecision(); });
   m.def("set_precision",
@@ -67,17 +120,52 @@ PYBIND11_MODULE(qalculate, m) {
     DEF_COMPARISON_HELPER("might_be_not_equal", COMPARISON_MIGHT_BE_NOT_EQUAL);
   // clang-format on
 
-  add_auto_sort_options(m);
-  add_auto_print_options(m);
-  add_auto_parse_options(m);
+  auto sort_options = add_auto_sort_options(m);
+  auto print_options = add_auto_print_options(m);
+  auto parse_options = add_auto_parse_options(m);
   // FIXME: isolate_var is not part of the autogenerated constructor
-  add_auto_evaluation_options(m).def_property(
+  auto evaluation_options = add_auto_evaluation_options(m).def_property(
       "isolate_var", &PEvaluationOptions::get_isolate_var,
       &PEvaluationOptions::set_isolate_var);
 
+  // Nested options are handed out frozen as well, a reference into the
+  // frozen object would allow modifying it.
+  add_frozen_options(m, sort_options, "FrozenSortOptions");
+  add_frozen_options(m, parse_options, "FrozenParseOptions");
+  add_frozen_options(m, print_options, "FrozenPrintOptions")
+      .def_property_readonly("sort_options",
+                             [](Frozen<PrintOptions> const &self) {
+                               return Frozen<SortOptions>(self.sort_options);
+                             });
+  add_frozen_options(m, evaluation_options, "FrozenEvaluationOptions")
+      .def_property_readonly("parse_options",
+                             [](Frozen<PEvaluationOptions> const &self) {
+                               return Frozen<ParseOptions>(self.parse_options);
+                             });
+
   repr_print_options.use_unicode_signs = UNICODE_SIGNS_WITHOUT_EXPONENTS;
   repr_print_options.interval_display = INTERVAL_DISPLAY_MIDPOINT;
 
+  m.def("get_repr_limits", []() {
+    auto to_optional = [](size_t limit) -> std::optional<size_t> {
+      if (limit == std::numeric_limits<size_t>::max())
+        return std::nullopt;
+      return limit;
+    };
+    return std::make_tuple(to_optional(repr_limits.max_depth),
+                           to_optional(repr_limits.max_width));
+  });
+  m.def(
+      "set_repr_limits",
+      [](std::optional<size_t> max_depth, std::optional<size_t> max_width) {
+        repr_limits.max_depth =
+            max_depth.value_or(std::numeric_limits<size_t>::max());
+        repr_limits.max_width =
+            max_width.value_or(std::numeric_limits<size_t>::max());
+      },
+      py::arg("max_depth") = static_cast<std::optional<size_t>>(std::nullopt),
+      py::arg("max_width") = static_cast<std::optional<size_t>>(std::nullopt));
+
   auto number = init_auto_number(
       py::class_<Number>(m, "Number")
           .def(py::init<>())
@@ -113,7 +201,10 @@ PYBIND11_MODULE(qalculate, m) {
           .def(
               "print",
               [](Number const &self, PrintOptions const *options) {
-                return self.print(options ? *options : global_print_options);
+                std::optional<PrintOptions> context_options;
+                return self.print(context_print_options(
+                    options ? *options : global_print_options,
+                    context_options));
               },
               py::arg("options") = static_cast<PrintOptions *>(nullptr),
               py::pos_only{}, py::is_operator{})
@@ -155,7 +246,7 @@ PYBIND11_MODULE(qalculate, m) {
                       py::return_value_policy::reference_internal);
   add_unknown_variable(m);
   add_math_function(m);
-  add_builtin_functions(m);
+  add_lazy_builtin_functions(m);
   add_unit(m);
 
   py::implicitly_convertible<py::int_, MathStructure>();
@@ -200,6 +291,11 @@ PYBIND11_MODULE(qalculate, m) {
                         NEW_PROXY_CONVERSION(py_check<MathFunction>,
                                              QalcRef<MathFunction>,
                                              MathStructureFunctionProxy);
+                        // Sparse matrices are only densified when they
+                        // are passed somewhere that needs a MathStructure.
+                        if (py_check<SparseMatrix>(args[0].ptr()))
+                          return MathStructureRef::construct(
+                              args[0].cast<SparseMatrix const &>().to_dense());
                         throw py::type_error(
                             py::str(py::type::of(args[0])).cast<std::string>() +
                             " cannot be cast to a MathStructure");
@@ -223,7 +319,12 @@ PYBIND11_MODULE(qalculate, m) {
               .def(
                   "print",
                   [](MathStructure &s, PrintOptions const &options) {
-                    return s.print(options);
+                    StatsTimer timer(print_stats, &s);
+                    std::optional<PrintOptions> context_options;
+                    auto const &print_options =
+                        context_print_options(options, context_options);
+                    timer.set_options(print_options);
+                    return s.print(print_options);
                   },
                   py::arg("options") = &global_print_options)
 
@@ -245,6 +346,9 @@ PYBIND11_MODULE(qalculate, m) {
     return structure.number();
   }));
 
+  add_sparse_matrix(math_structure_cls);
+  py::implicitly_convertible<SparseMatrix, MathStructure>();
+
   py::implicitly_convertible<Variable, MathStructureVariableProxy>();
   py::implicitly_convertible<Variable, MathStructure>();
   py::implicitly_convertible<UnknownVariable, MathStructure>();
@@ -264,8 +368,20 @@ PYBIND11_MODULE(qalculate, m) {
   m.def(
       "parse",
       [](std::string_view s, ParseOptions const *options) {
-        return MathStructureRef::adopt(CALCULATOR->parse(
-            std::string(s), options ? *options : global_parse_options));
+        StatsTimer timer(parse_stats, s);
+        load_definitions_for_expression(s);
+        MessageGuard messages;
+        std::optional<ParseOptions> context_options;
+        auto const &parse_options = context_parse_options(
+            options ? *options : global_parse_options, context_options);
+        timer.set_options(parse_options);
+        ContextPrecision precision;
+        MathStructure result;
+        {
+          ContextGilRelease _gil(precision);
+          result = CALCULATOR->parse(std::string(s), parse_options);
+        }
+        return MathStructureRef::adopt(result);
       },
       py::arg("value"), py::pos_only{},
       py::arg("options") = static_cast<ParseOptions *>(nullptr));
@@ -273,9 +389,24 @@ PYBIND11_MODULE(qalculate, m) {
   m.def(
       "calculate",
       [](std::string expression, PEvaluationOptions const &options,
-         std::string to) {
-        return calculate(CALCULATOR->parse(expression, options.parse_options),
-                         options, to);
+         Conversion const &to) {
+        StatsTimer timer(calculate_stats, expression);
+        load_definitions_for_expression(expression);
+        MessageGuard messages;
+        std::optional<PEvaluationOptions> context_options;
+        auto const &eval_options =
+            context_evaluation_options(options, context_options);
+        timer.set_options(eval_options);
+        ContextPrecision precision;
+        MathStructure result;
+        {
+          // Parsed with the same precision, so not through calculate().
+          ContextGilRelease _gil(precision);
+          result = calculate_to(
+              CALCULATOR->parse(expression, eval_options.parse_options),
+              eval_options, to);
+        }
+        return MathStructureRef::adopt(result);
       },
       py::arg("expression"), py::arg("options") = &global_evaluation_options,
       py::arg("to") = "");
@@ -284,9 +415,20 @@ PYBIND11_MODULE(qalculate, m) {
       "calculate_and_print",
       [](std::string expression, PEvaluationOptions const &eval_options,
          PrintOptions const &print_options) {
-        py::gil_scoped_release _gil;
+        StatsTimer timer(calculate_and_print_stats, expression);
+        load_definitions_for_expression(expression);
+        MessageGuard messages;
+        std::optional<PEvaluationOptions> context_eval;
+        std::optional<PrintOptions> context_print;
+        auto const &effective_eval =
+            context_evaluation_options(eval_options, context_eval);
+        auto const &effective_print =
+            context_print_options(print_options, context_print);
+        timer.set_options(effective_eval);
+        ContextPrecision precision;
+        ContextGilRelease _gil(precision);
         std::string result = CALCULATOR->calculateAndPrint(
-            expression, -1, eval_options, print_options);
+            expression, -1, effective_eval, effective_print);
         assert(!CALCULATOR->aborted());
         return result;
       },
@@ -298,31 +440,73 @@ PYBIND11_MODULE(qalculate, m) {
       .def_property_readonly("text", &CalculatorMessage::c_message)
       .def_property_readonly("type", &CalculatorMessage::type);
 
-  m.def("take_messages", []() {
-    std::vector<CalculatorMessage> messages;
-    while (true) {
-      CalculatorMessage *msg = CALCULATOR->message();
-      if (!msg)
-        return messages;
-      messages.emplace_back(std::move(*msg));
-      CALCULATOR->nextMessage();
-    }
+  py::class_<CalculationResult>(m, "CalculationResult")
+      .def_property_readonly(
+          "result", [](CalculationResult const &self) { return self.result; })
+      .def_readonly("text", &CalculationResult::text)
+      .def_readonly("messages", &CalculationResult::messages)
+      .def_readonly("parse_time", &CalculationResult::parse_time)
+      .def_readonly("eval_time", &CalculationResult::eval_time)
+      .def_readonly("print_time", &CalculationResult::print_time)
+      .def("__repr__", [](CalculationResult const &self) {
+        return "<CalculationResult " + self.text + ", " +
+               std::to_string(self.messages.size()) + " messages>";
+      });
+
+  m.def("calculate_ex", &calculate_ex, py::arg("expression"),
+        py::arg("eval_options") = &global_evaluation_options,
+        py::arg("print_options") = &global_print_options, py::arg("to") = "",
+        "Calculate and print an expression, returning the result together "
+        "with its messages and timings.\n\n"
+        "Collecting the messages takes exclusive access to the calculator, "
+        "so calls are serialized with all other calculations.");
+  m.def("calculate_batch", &calculate_batch, py::arg("expressions"),
+        py::arg("eval_options") = &global_evaluation_options,
+        py::arg("print_options") = &global_print_options,
+        "Like calculate_ex, for several expressions at once.\n\n"
+        "The whole batch runs with exclusive access to the calculator.");
+
+  m.def("take_messages", &take_messages);
+
+  m.def("get_message_queue_limit", []() -> std::optional<size_t> {
+    if (message_queue_limit == std::numeric_limits<size_t>::max())
+      return std::nullopt;
+    return message_queue_limit;
   });
+  m.def(
+      "set_message_queue_limit",
+      [](std::optional<size_t> limit) {
+        message_queue_limit =
+            limit.value_or(std::numeric_limits<size_t>::max());
+      },
+      py::arg("limit"));
+  m.def("get_messages_enabled", []() { return messages_enabled; });
+  m.def(
+      "set_messages_enabled", [](bool enabled) { messages_enabled = enabled; },
+      py::arg("enabled"));
+  m.def(
+      "get_dropped_messages",
+      [](bool reset) {
+        auto result = dropped_messages;
+        if (reset)
+          dropped_messages.clear();
+        return result;
+      },
+      py::kw_only{}, py::arg("reset") = false);
 
-  auto loaders =
-      std::initializer_list<std::pair<char const *, bool (Calculator::*)()>>{
-          {"load_global_prefixes", &Calculator::loadGlobalPrefixes},
-          {"load_global_currencies", &Calculator::loadGlobalCurrencies},
-          {"load_global_units", &Calculator::loadGlobalUnits},
-          {"load_global_variables", &Calculator::loadGlobalVariables},
-          {"load_global_functions", &Calculator::loadGlobalFunctions},
-          {"load_global_dataSets", &Calculator::loadGlobalDataSets},
-      };
-  for (auto loader : loaders)
-    m.def(loader.first, [loader] {
-      if (!(*CALCULATOR.*loader.second)())
-        throw std::runtime_error("qalculate failed to load something");
+  for (auto &group : definition_groups) {
+    std::string name = std::string("load_global_") + group.name;
+    m.def(name.c_str(), [&group, &stats = call_stats(name)] {
+      StatsTimer timer(stats);
+      load_definition_group(group);
     });
+  }
+
+  m.def("get_lazy_loading", &lazy_loading_enabled);
+  m.def("set_lazy_loading", &set_lazy_loading, py::arg("enabled"));
+
+  m.def("save_snapshot", &save_snapshot, py::arg("path"));
+  m.def("load_snapshot", &load_snapshot, py::arg("path"));
 
 #define MAKE_GLOBAL_OPTION_FUNCTIONS(type, name)                               \
   m.def("set_global_" #name "_options",                                        \
@@ -334,4 +518,14 @@ PYBIND11_MODULE(qalculate, m) {
   MAKE_GLOBAL_OPTION_FUNCTIONS(PEvaluationOptions, evaluation);
   MAKE_GLOBAL_OPTION_FUNCTIONS(PrintOptions, print);
   MAKE_GLOBAL_OPTION_FUNCTIONS(SortOptions, sort);
+
+  add_options_context(m);
+  add_stats(m);
+  add_batcher(m);
+  add_conversion(m);
+  add_converter(m);
+  add_quantity_array(m);
+  add_name_index(m);
+  add_pool(m);
+  add_cli(m);
 }
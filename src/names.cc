@@ -0,0 +1,356 @@
+#include "names.hh"
+
+#include <algorithm>
+#include <array>
+#include <cstdint>
+#include <libqalculate/qalculate.h>
+#include <optional>
+#include <pybind11/stl.h>
+#include <string>
+#include <string_view>
+#include <tuple>
+#include <type_traits>
+#include <unordered_map>
+#include <vector>
+
+#include "ref.hh"
+
+namespace {
+
+enum class NameKind : uint8_t { UNIT, VARIABLE, FUNCTION, PREFIX };
+constexpr size_t KIND_COUNT = 4;
+constexpr char const *KIND_NAMES[KIND_COUNT] = {"unit", "variable", "function",
+                                                "prefix"};
+
+std::string fold(std::string_view name) {
+  std::string folded(name);
+  for (char &c : folded)
+    if (c >= 'A' && c <= 'Z')
+      c += 'a' - 'A';
+  return folded;
+}
+
+// Padded so that the start and end of a name get trigrams of their own.
+template <typename F> void for_each_trigram(std::string_view folded, F f) {
+  std::string padded = "\x02" + std::string(folded) + "\x03";
+  for (size_t i = 0; i + 3 <= padded.size(); ++i)
+    f(static_cast<uint32_t>(static_cast<uint8_t>(padded[i])) << 16 |
+      static_cast<uint32_t>(static_cast<uint8_t>(padded[i + 1])) << 8 |
+      static_cast<uint8_t>(padded[i + 2]));
+}
+
+// Optimal string alignment distance, or limit + 1 once it exceeds limit.
+size_t edit_distance(std::string_view a, std::string_view b, size_t limit) {
+  if ((a.size() > b.size() ? a.size() - b.size() : b.size() - a.size()) > limit)
+    return limit + 1;
+  std::vector<size_t> before(b.size() + 1), previous(b.size() + 1),
+      current(b.size() + 1);
+  for (size_t j = 0; j <= b.size(); ++j)
+    previous[j] = j;
+  for (size_t i = 1; i <= a.size(); ++i) {
+    current[0] = i;
+    size_t row_minimum = i;
+    for (size_t j = 1; j <= b.size(); ++j) {
+      size_t cost = a[i - 1] == b[j - 1] ? 0 : 1;
+      current[j] = std::min(
+          {previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost});
+      if (i > 1 && j > 1 && a[i - 1] == b[j - 2] && a[i - 2] == b[j - 1])
+        current[j] = std::min(current[j], before[j - 2] + 1);
+      row_minimum = std::min(row_minimum, current[j]);
+    }
+    if (row_minimum > limit)
+      return limit + 1;
+    std::swap(before, previous);
+    std::swap(previous, current);
+  }
+  return std::min(previous[b.size()], limit + 1);
+}
+
+struct Match {
+  uint32_t entry;
+  size_t distance;
+};
+
+class NameIndex {
+  struct Entry {
+    std::string name;
+    std::string folded;
+    ExpressionItem *item;
+    Prefix *prefix;
+    NameKind kind;
+  };
+
+  std::vector<Entry> entries;
+  // Entry indices ordered by folded name, for prefix searches.
+  std::vector<uint32_t> sorted;
+  std::unordered_map<uint32_t, std::vector<uint32_t>> trigrams;
+  // The items of each of the calculator's lists that have been indexed,
+  // and the storage of the list when they were.
+  std::array<std::vector<void const *>, KIND_COUNT> indexed;
+  std::array<void const *, KIND_COUNT> indexed_data{};
+  // Keeps indexed items alive after they are removed from the calculator.
+  std::vector<QalcRef<ExpressionItem>> references;
+  std::vector<uint16_t> hits;
+
+  void add(std::string const &name, ExpressionItem *item, Prefix *prefix,
+           NameKind kind) {
+    if (name.empty())
+      return;
+    auto index = static_cast<uint32_t>(entries.size());
+    auto &entry =
+        entries.emplace_back(Entry{name, fold(name), item, prefix, kind});
+    for_each_trigram(entry.folded, [&](uint32_t trigram) {
+      auto &postings = trigrams[trigram];
+      if (postings.empty() || postings.back() != index)
+        postings.push_back(index);
+    });
+  }
+
+  void add_item(ExpressionItem *item, NameKind kind) {
+    references.emplace_back(item);
+    for (size_t i = 1; i <= item->countNames(); ++i)
+      add(item->getName(i).name, item, nullptr, kind);
+  }
+
+  void add_prefix(Prefix *prefix) {
+    std::string names[] = {prefix->shortName(false), prefix->longName(false),
+                           prefix->unicodeName(false)};
+    for (size_t i = 0; i < 3; ++i)
+      if (std::find(names, names + i, names[i]) == names + i)
+        add(names[i], nullptr, prefix, NameKind::PREFIX);
+  }
+
+  // Whether the items indexed from a list are still at its start. Only
+  // compared when the list changed size or storage, items replaced in place
+  // are not noticed, but stay valid since they are referenced.
+  template <typename T>
+  bool still_indexed(std::vector<T *> const &items, NameKind kind) const {
+    auto const &seen = indexed[static_cast<size_t>(kind)];
+    if (items.size() == seen.size() &&
+        items.data() == indexed_data[static_cast<size_t>(kind)])
+      return true;
+    return items.size() >= seen.size() &&
+           std::equal(seen.begin(), seen.end(), items.begin());
+  }
+
+  template <typename T>
+  void add_new(std::vector<T *> const &items, NameKind kind) {
+    auto &seen = indexed[static_cast<size_t>(kind)];
+    indexed_data[static_cast<size_t>(kind)] = items.data();
+    for (size_t i = seen.size(); i < items.size(); ++i) {
+      if constexpr (std::is_same_v<T, Prefix>)
+        add_prefix(items[i]);
+      else
+        add_item(items[i], kind);
+      seen.push_back(items[i]);
+    }
+  }
+
+public:
+  // Indexes items added since the last call. Items are appended to the
+  // calculator's lists, so anything else means something was removed and
+  // the index is rebuilt.
+  void update() {
+    if (!still_indexed(CALCULATOR->units, NameKind::UNIT) ||
+        !still_indexed(CALCULATOR->variables, NameKind::VARIABLE) ||
+        !still_indexed(CALCULATOR->functions, NameKind::FUNCTION) ||
+        !still_indexed(CALCULATOR->prefixes, NameKind::PREFIX)) {
+      entries.clear();
+      sorted.clear();
+      trigrams.clear();
+      references.clear();
+      for (auto &seen : indexed)
+        seen.clear();
+    }
+
+    size_t old_size = entries.size();
+    add_new(CALCULATOR->units, NameKind::UNIT);
+    add_new(CALCULATOR->variables, NameKind::VARIABLE);
+    add_new(CALCULATOR->functions, NameKind::FUNCTION);
+    add_new(CALCULATOR->prefixes, NameKind::PREFIX);
+    if (entries.size() == old_size)
+      return;
+
+    auto by_name = [this](uint32_t a, uint32_t b) {
+      return entries[a].folded < entries[b].folded;
+    };
+    for (size_t i = old_size; i < entries.size(); ++i)
+      sorted.push_back(static_cast<uint32_t>(i));
+    std::sort(sorted.begin() + old_size, sorted.end(), by_name);
+    std::inplace_merge(sorted.begin(), sorted.begin() + old_size, sorted.end(),
+                       by_name);
+  }
+
+  bool accepts(Entry const &entry, unsigned kinds) const {
+    if (!(kinds & 1u << static_cast<unsigned>(entry.kind)))
+      return false;
+    return !entry.item || entry.item->isActive();
+  }
+
+  std::vector<Match> complete(std::string_view prefix, unsigned kinds,
+                              size_t limit) {
+    std::string folded = fold(prefix);
+    auto begin = std::lower_bound(sorted.begin(), sorted.end(), folded,
+                                  [this](uint32_t entry, std::string const &s) {
+                                    return entries[entry].folded < s;
+                                  });
+    std::vector<Match> matches;
+    for (auto it = begin; it != sorted.end(); ++it) {
+      auto const &entry = entries[*it];
+      if (entry.folded.compare(0, folded.size(), folded) != 0)
+        break;
+      if (accepts(entry, kinds))
+        matches.push_back({*it, 0});
+    }
+
+    // Names matching the case of the prefix and shorter names first.
+    auto key = [&](Match const &match) {
+      auto const &name = entries[match.entry].name;
+      return std::make_tuple(name.compare(0, prefix.size(), prefix) != 0,
+                             name.size(), std::string_view(name));
+    };
+    size_t count = std::min(limit, matches.size());
+    std::partial_sort(
+        matches.begin(), matches.begin() + count, matches.end(),
+        [&](Match const &a, Match const &b) { return key(a) < key(b); });
+    matches.resize(count);
+    return matches;
+  }
+
+  std::vector<Match> suggest(std::string_view text, unsigned kinds,
+                             size_t limit, size_t max_distance) {
+    std::string folded = fold(text);
+    std::vector<uint32_t> candidates;
+
+    // An edit destroys at most 3 trigrams, a transposition (a single edit for
+    // the OSA distance) up to 4. So a name within max_distance edits shares
+    // all but 4 * max_distance of the text's trigrams, when that leaves none
+    // every name is a candidate.
+    std::vector<uint32_t> text_trigrams;
+    for_each_trigram(folded, [&](uint32_t trigram) {
+      if (std::find(text_trigrams.begin(), text_trigrams.end(), trigram) ==
+          text_trigrams.end())
+        text_trigrams.push_back(trigram);
+    });
+    if (text_trigrams.size() > 4 * max_distance) {
+      size_t required = text_trigrams.size() - 4 * max_distance;
+      hits.assign(entries.size(), 0);
+      for (uint32_t trigram : text_trigrams) {
+        auto it = trigrams.find(trigram);
+        if (it == trigrams.end())
+          continue;
+        for (uint32_t entry : it->second)
+          if (++hits[entry] == required)
+            candidates.push_back(entry);
+      }
+    } else {
+      for (uint32_t entry = 0; entry < entries.size(); ++entry)
+        candidates.push_back(entry);
+    }
+
+    std::vector<Match> matches;
+    for (uint32_t candidate : candidates) {
+      auto const &entry = entries[candidate];
+      if (!accepts(entry, kinds))
+        continue;
+      size_t distance = edit_distance(folded, entry.folded, max_distance);
+      if (distance <= max_distance)
+        matches.push_back({candidate, distance});
+    }
+
+    auto key = [&](Match const &match) {
+      auto const &name = entries[match.entry].name;
+      return std::make_tuple(match.distance, name != text, name.size(),
+                             std::string_view(name));
+    };
+    size_t count = std::min(limit, matches.size());
+    std::partial_sort(
+        matches.begin(), matches.begin() + count, matches.end(),
+        [&](Match const &a, Match const &b) { return key(a) < key(b); });
+    matches.resize(count);
+    return matches;
+  }
+
+  py::object completion(Match const &match) const;
+};
+
+NameIndex &name_index() {
+  static NameIndex index;
+  return index;
+}
+
+struct Completion {
+  std::string name;
+  char const *kind;
+  std::optional<QalcRef<ExpressionItem>> item;
+  size_t distance;
+};
+
+unsigned parse_kinds(std::optional<std::vector<std::string>> const &kinds) {
+  if (!kinds)
+    return (1u << KIND_COUNT) - 1;
+  unsigned mask = 0;
+  for (auto const &kind : *kinds) {
+    auto it = std::find_if(std::begin(KIND_NAMES), std::end(KIND_NAMES),
+                           [&](char const *name) { return kind == name; });
+    if (it == std::end(KIND_NAMES))
+      throw py::value_error("unknown kind \"" + kind +
+                            "\", expected unit, variable, function or prefix");
+    mask |= 1u << (it - std::begin(KIND_NAMES));
+  }
+  return mask;
+}
+
+} // namespace
+
+py::object NameIndex::completion(Match const &match) const {
+  auto const &entry = entries[match.entry];
+  Completion result{entry.name, KIND_NAMES[static_cast<size_t>(entry.kind)],
+                    std::nullopt, match.distance};
+  if (entry.item)
+    result.item = QalcRef<ExpressionItem>(entry.item);
+  return py::cast(std::move(result));
+}
+
+void add_name_index(py::module_ &m) {
+  py::class_<Completion>(m, "Completion")
+      .def_readonly("name", &Completion::name)
+      .def_readonly("kind", &Completion::kind)
+      .def_readonly("item", &Completion::item)
+      .def_readonly("distance", &Completion::distance)
+      .def("__repr__", [](Completion const &self) {
+        return "<Completion " + self.name + " (" + self.kind + ")>";
+      });
+
+  m.def(
+      "complete",
+      [](std::string_view prefix,
+         std::optional<std::vector<std::string>> const &kinds, size_t limit) {
+        unsigned mask = parse_kinds(kinds);
+        auto &index = name_index();
+        index.update();
+        py::list result;
+        for (auto const &match : index.complete(prefix, mask, limit))
+          result.append(index.completion(match));
+        return result;
+      },
+      py::arg("prefix"), py::kw_only{},
+      py::arg("kinds") = std::optional<std::vector<std::string>>(),
+      py::arg("limit") = 10);
+
+  m.def(
+      "suggest",
+      [](std::string_view name, size_t max_distance,
+         std::optional<std::vector<std::string>> const &kinds, size_t limit) {
+        unsigned mask = parse_kinds(kinds);
+        auto &index = name_index();
+        index.update();
+        py::list result;
+        for (auto const &match : index.suggest(name, mask, limit, max_distance))
+          result.append(index.completion(match));
+        return result;
+      },
+      py::arg("name"), py::kw_only{}, py::arg("max_distance") = 2,
+      py::arg("kinds") = std::optional<std::vector<std::string>>(),
+      py::arg("limit") = 10);
+}
@@ -0,0 +1,7 @@
+#pragma once
+
+#include "pybind.hh"
+
+// qalculate.complete() and qalculate.suggest(), backed by an index over the
+// names of every loaded unit, variable, function and prefix.
+void add_name_index(py::module_ &m);
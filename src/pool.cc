@@ -0,0 +1,550 @@
+#include "pool.hh"
+
+#include <algorithm>
+#include <cerrno>
+#include <csignal>
+#include <cstdint>
+#include <cstring>
+#include <libqalculate/qalculate.h>
+#include <poll.h>
+#include <pthread.h>
+#include <pybind11/stl.h>
+#include <stdexcept>
+#include <string_view>
+#include <sys/wait.h>
+#include <system_error>
+#include <thread>
+#include <time.h>
+#include <unistd.h>
+
+#include "options.hh"
+
+// Wire format, in native byte order since both ends run the same binary:
+//   handshake: u8 status (1 if the preloaded definitions loaded successfully)
+//   request:   u32 count, count * (u32 length, bytes)
+//   response:  one record per expression, sent as soon as it is finished
+//              u32 length, bytes, u32 message count,
+//              message count * (u8 type, u32 length, bytes)
+
+namespace {
+
+// Expressions are grouped so that one chunk takes about this long.
+constexpr double CHUNK_TARGET_SECONDS = 0.02;
+constexpr size_t MAX_CHUNK_SIZE = 1024;
+// Extra time given to a worker past the libqalculate timeout before it is
+// considered hung.
+constexpr double HANG_GRACE_SECONDS = 1.0;
+// How often the parent wakes up to check for signals and hung workers.
+constexpr int POLL_INTERVAL_MS = 100;
+
+void put_u32(std::string &out, uint32_t value) {
+  out.append(reinterpret_cast<char const *>(&value), sizeof value);
+}
+
+void put_string(std::string &out, std::string_view value) {
+  put_u32(out, value.size());
+  out.append(value);
+}
+
+class Reader {
+  std::string_view data;
+
+public:
+  size_t position = 0;
+
+  Reader(std::string_view data) : data(data) {}
+
+  bool u8(uint8_t &value) {
+    if (data.size() - position < 1)
+      return false;
+    value = data[position++];
+    return true;
+  }
+
+  bool u32(uint32_t &value) {
+    if (data.size() - position < sizeof value)
+      return false;
+    std::memcpy(&value, data.data() + position, sizeof value);
+    position += sizeof value;
+    return true;
+  }
+
+  bool string(std::string &value) {
+    uint32_t length;
+    if (!u32(length) || data.size() - position < length)
+      return false;
+    value.assign(data.data() + position, length);
+    position += length;
+    return true;
+  }
+};
+
+// Returns false if the record in buffer is not complete yet.
+bool take_result(std::string &buffer, PoolResult &result) {
+  Reader reader(buffer);
+  uint32_t count;
+  if (!reader.string(result.text) || !reader.u32(count))
+    return false;
+  result.messages.clear();
+  for (uint32_t i = 0; i < count; ++i) {
+    uint8_t type;
+    std::string text;
+    if (!reader.u8(type) || !reader.string(text))
+      return false;
+    result.messages.emplace_back(static_cast<MessageType>(type),
+                                 std::move(text));
+  }
+  buffer.erase(0, reader.position);
+  return true;
+}
+
+bool read_all(int fd, void *data, size_t size) {
+  auto p = static_cast<char *>(data);
+  while (size) {
+    ssize_t n = read(fd, p, size);
+    if (n < 0 && errno == EINTR)
+      continue;
+    if (n <= 0)
+      return false;
+    p += n;
+    size -= n;
+  }
+  return true;
+}
+
+bool write_all(int fd, void const *data, size_t size) {
+  auto p = static_cast<char const *>(data);
+  while (size) {
+    ssize_t n = write(fd, p, size);
+    if (n < 0 && errno == EINTR)
+      continue;
+    if (n < 0)
+      return false;
+    p += n;
+    size -= n;
+  }
+  return true;
+}
+
+// Writing to a worker that died must fail with EPIPE rather than kill the
+// parent. SIGPIPE is only blocked for the calling thread while writing, the
+// signal disposition of the rest of the process is left alone.
+bool write_to_worker(int fd, void const *data, size_t size) {
+  sigset_t sigpipe, old_mask, pending;
+  sigemptyset(&sigpipe);
+  sigaddset(&sigpipe, SIGPIPE);
+  pthread_sigmask(SIG_BLOCK, &sigpipe, &old_mask);
+  sigpending(&pending);
+  bool was_pending = sigismember(&pending, SIGPIPE);
+
+  bool written = write_all(fd, data, size);
+  if (!written && errno == EPIPE && !was_pending) {
+    timespec zero{0, 0};
+    while (sigtimedwait(&sigpipe, nullptr, &zero) < 0 && errno == EINTR)
+      ;
+  }
+
+  pthread_sigmask(SIG_SETMASK, &old_mask, nullptr);
+  return written;
+}
+
+PoolResult error_result(std::string text) {
+  PoolResult result;
+  result.messages.emplace_back(MESSAGE_ERROR, std::move(text));
+  return result;
+}
+
+} // namespace
+
+ProcessPool::ProcessPool(size_t workers, std::vector<DefinitionGroup *> preload,
+                         std::optional<double> timeout,
+                         PEvaluationOptions eval_options,
+                         PrintOptions print_options,
+                         std::optional<int> precision)
+    : workers(workers), owner(getpid()), preload(std::move(preload)),
+      timeout(timeout), eval_options(std::move(eval_options)),
+      print_options(std::move(print_options)), precision(precision),
+      seconds_per_expression(CHUNK_TARGET_SECONDS) {
+  if (workers == 0)
+    throw std::invalid_argument("ProcessPool needs at least one worker");
+  for (auto &worker : this->workers)
+    spawn(worker);
+}
+
+ProcessPool::~ProcessPool() { close(); }
+
+void ProcessPool::spawn(Worker &worker) {
+  int to_worker[2], from_worker[2];
+  if (pipe(to_worker) < 0)
+    throw std::system_error(errno, std::generic_category(), "pipe");
+  if (pipe(from_worker) < 0) {
+    int error = errno;
+    ::close(to_worker[0]);
+    ::close(to_worker[1]);
+    throw std::system_error(error, std::generic_category(), "pipe");
+  }
+
+  pid_t pid = fork();
+  if (pid < 0) {
+    int error = errno;
+    for (int fd : {to_worker[0], to_worker[1], from_worker[0], from_worker[1]})
+      ::close(fd);
+    throw std::system_error(error, std::generic_category(), "fork");
+  }
+
+  if (pid == 0) {
+    // Siblings must see EOF once the parent closes its ends, so the child
+    // cannot keep copies of them around.
+    for (auto &other : workers) {
+      if (other.to_worker >= 0)
+        ::close(other.to_worker);
+      if (other.from_worker >= 0)
+        ::close(other.from_worker);
+    }
+    ::close(to_worker[1]);
+    ::close(from_worker[0]);
+    worker_main(to_worker[0], from_worker[1]);
+  }
+
+  ::close(to_worker[0]);
+  ::close(from_worker[1]);
+  worker.pid = pid;
+  worker.to_worker = to_worker[1];
+  worker.from_worker = from_worker[0];
+  worker.ready = false;
+  worker.buffer.clear();
+  worker.pending.clear();
+  worker.last_progress = Clock::now();
+}
+
+void ProcessPool::worker_main(int input, int output) {
+  // Interrupts are the parent's business, it will close the pipe.
+  signal(SIGINT, SIG_IGN);
+  signal(SIGPIPE, SIG_IGN);
+  if (precision)
+    CALCULATOR->setPrecision(*precision);
+
+  uint8_t status = 1;
+  try {
+    for (auto group : preload)
+      load_definition_group(*group);
+  } catch (std::exception const &) {
+    status = 0;
+  }
+  if (!write_all(output, &status, sizeof status) || !status)
+    _exit(EXIT_FAILURE);
+
+  int msecs = timeout ? static_cast<int>(*timeout * 1000) : -1;
+  std::vector<std::string> expressions;
+  std::string response;
+  while (true) {
+    uint32_t count;
+    if (!read_all(input, &count, sizeof count))
+      _exit(EXIT_SUCCESS);
+    expressions.resize(count);
+    for (auto &expression : expressions) {
+      uint32_t length;
+      if (!read_all(input, &length, sizeof length))
+        _exit(EXIT_FAILURE);
+      expression.resize(length);
+      if (!read_all(input, expression.data(), length))
+        _exit(EXIT_FAILURE);
+    }
+
+    for (auto const &expression : expressions) {
+      CALCULATOR->clearMessages();
+      std::string text = CALCULATOR->calculateAndPrint(
+          expression, msecs, eval_options, print_options);
+
+      response.clear();
+      put_string(response, text);
+      size_t count_position = response.size();
+      uint32_t message_count = 0;
+      put_u32(response, message_count);
+      while (CalculatorMessage *message = CALCULATOR->message()) {
+        response.push_back(static_cast<char>(message->type()));
+        put_string(response, message->message());
+        ++message_count;
+        CALCULATOR->nextMessage();
+      }
+      std::memcpy(response.data() + count_position, &message_count,
+                  sizeof message_count);
+
+      if (!write_all(output, response.data(), response.size()))
+        _exit(EXIT_FAILURE);
+    }
+  }
+}
+
+void ProcessPool::terminate(Worker &worker) {
+  if (worker.to_worker >= 0)
+    ::close(worker.to_worker);
+  if (worker.from_worker >= 0)
+    ::close(worker.from_worker);
+  worker.to_worker = worker.from_worker = -1;
+  if (worker.pid > 0) {
+    kill(worker.pid, SIGKILL);
+    while (waitpid(worker.pid, nullptr, 0) < 0 && errno == EINTR)
+      ;
+  }
+  worker.pid = -1;
+  worker.ready = false;
+  worker.buffer.clear();
+  worker.pending.clear();
+}
+
+void ProcessPool::close() {
+  if (is_closed)
+    return;
+  is_closed = true;
+
+  if (getpid() != owner) {
+    for (auto &worker : workers) {
+      for (int fd : {worker.to_worker, worker.from_worker})
+        if (fd >= 0)
+          ::close(fd);
+      worker = Worker();
+    }
+    return;
+  }
+
+  // Idle workers exit on their own once they see EOF.
+  for (auto &worker : workers) {
+    if (worker.to_worker >= 0)
+      ::close(worker.to_worker);
+    worker.to_worker = -1;
+  }
+  auto deadline = Clock::now() + std::chrono::seconds(1);
+  for (auto &worker : workers) {
+    while (worker.pid > 0 && worker.pending.empty() &&
+           Clock::now() < deadline) {
+      pid_t result = waitpid(worker.pid, nullptr, WNOHANG);
+      if (result == worker.pid || (result < 0 && errno != EINTR))
+        worker.pid = -1;
+      else
+        std::this_thread::sleep_for(std::chrono::milliseconds(1));
+    }
+    terminate(worker);
+  }
+}
+
+size_t ProcessPool::chunk_size(size_t remaining) const {
+  size_t size = CHUNK_TARGET_SECONDS / std::max(seconds_per_expression, 1e-9);
+  // Leave some work for every other worker too.
+  size_t fair_share = (remaining + workers.size() - 1) / workers.size();
+  return std::clamp(std::min(size, fair_share), size_t(1), MAX_CHUNK_SIZE);
+}
+
+std::vector<PoolResult>
+ProcessPool::map(std::vector<std::string> const &expressions) {
+  if (is_closed)
+    throw std::runtime_error("ProcessPool is closed");
+  if (getpid() != owner)
+    throw std::runtime_error("ProcessPool cannot be used from a forked child");
+
+  std::vector<PoolResult> results(expressions.size());
+  size_t next = 0, done = 0;
+  // Expressions taken back from workers that died.
+  std::deque<size_t> retry;
+
+  auto fail_worker = [&](Worker &worker, char const *reason) {
+    if (!worker.ready) {
+      terminate(worker);
+      throw std::runtime_error("qalculate pool worker failed to start");
+    }
+    // The expression the worker was busy with is the one to blame.
+    if (!worker.pending.empty()) {
+      results[worker.pending.front()] = error_result(reason);
+      ++done;
+      worker.pending.pop_front();
+    }
+    retry.insert(retry.begin(), worker.pending.begin(), worker.pending.end());
+    terminate(worker);
+    spawn(worker);
+  };
+
+  try {
+    for (auto &worker : workers)
+      if (worker.pid < 0)
+        spawn(worker);
+
+    std::vector<pollfd> fds;
+    std::vector<Worker *> polled;
+    std::string request;
+    char chunk[64 * 1024];
+
+    while (done < expressions.size()) {
+      for (auto &worker : workers) {
+        if (!worker.ready || !worker.pending.empty())
+          continue;
+        size_t remaining = retry.size() + expressions.size() - next;
+        if (remaining == 0)
+          break;
+
+        size_t count = chunk_size(remaining);
+        request.clear();
+        put_u32(request, 0);
+        uint32_t sent = 0;
+        for (; sent < count; ++sent) {
+          size_t index;
+          if (!retry.empty()) {
+            index = retry.front();
+            retry.pop_front();
+          } else if (next < expressions.size())
+            index = next++;
+          else
+            break;
+          worker.pending.push_back(index);
+          put_string(request, expressions[index]);
+        }
+        std::memcpy(request.data(), &sent, sizeof sent);
+
+        worker.last_progress = Clock::now();
+        // The worker is blocked reading, so this cannot deadlock.
+        if (!write_to_worker(worker.to_worker, request.data(), request.size()))
+          fail_worker(worker, "qalculate pool worker exited unexpectedly");
+      }
+
+      fds.clear();
+      polled.clear();
+      for (auto &worker : workers) {
+        fds.push_back(pollfd{worker.from_worker, POLLIN, 0});
+        polled.push_back(&worker);
+      }
+
+      int ready;
+      {
+        py::gil_scoped_release _gil;
+        ready = poll(fds.data(), fds.size(), POLL_INTERVAL_MS);
+      }
+      if (ready < 0 && errno != EINTR)
+        throw std::system_error(errno, std::generic_category(), "poll");
+
+      auto now = Clock::now();
+      for (size_t i = 0; ready > 0 && i < fds.size(); ++i) {
+        if (!fds[i].revents)
+          continue;
+        Worker &worker = *polled[i];
+
+        ssize_t n = read(worker.from_worker, chunk, sizeof chunk);
+        if (n < 0 && errno == EINTR)
+          continue;
+        if (n <= 0) {
+          fail_worker(worker, "qalculate pool worker exited unexpectedly");
+          continue;
+        }
+        worker.buffer.append(chunk, n);
+
+        if (!worker.ready) {
+          if (!worker.buffer.front())
+            fail_worker(worker, "");
+          worker.ready = true;
+          worker.buffer.erase(0, 1);
+        }
+
+        PoolResult result;
+        size_t taken = 0;
+        while (!worker.pending.empty() && take_result(worker.buffer, result)) {
+          results[worker.pending.front()] = std::move(result);
+          worker.pending.pop_front();
+          ++done;
+          ++taken;
+        }
+
+        // Results that arrive together share the time since the last ones.
+        if (taken) {
+          double elapsed =
+              std::chrono::duration<double>(now - worker.last_progress)
+                  .count() /
+              taken;
+          seconds_per_expression =
+              0.8 * seconds_per_expression + 0.2 * elapsed;
+          worker.last_progress = now;
+        }
+      }
+
+      if (timeout) {
+        auto limit = std::chrono::duration<double>(*timeout + HANG_GRACE_SECONDS);
+        for (auto &worker : workers)
+          if (!worker.pending.empty() && now - worker.last_progress > limit)
+            fail_worker(worker, "calculation timed out, qalculate pool "
+                                "worker was restarted");
+      }
+
+      if (PyErr_CheckSignals() != 0)
+        throw py::error_already_set();
+    }
+  } catch (...) {
+    // Results still in flight would be mistaken for the next batch's.
+    for (auto &worker : workers)
+      if (!worker.pending.empty() || !worker.ready)
+        terminate(worker);
+    throw;
+  }
+
+  return results;
+}
+
+void add_pool(py::module_ &m) {
+  auto pool = m.def_submodule(
+      "pool", "Evaluate expressions in parallel worker processes");
+  py::module_::import("sys").attr("modules")["qalculate.pool"] = pool;
+
+  py::class_<ProcessPool>(pool, "ProcessPool")
+      .def(py::init([](std::optional<size_t> workers,
+                       std::vector<std::string> const &preload,
+                       std::optional<double> timeout,
+                       PEvaluationOptions const &eval_options,
+                       PrintOptions const &print_options) {
+             std::vector<DefinitionGroup *> groups;
+             for (auto const &name : preload) {
+               DefinitionGroup *group = find_definition_group(name);
+               if (!group)
+                 throw py::value_error("unknown definition group \"" + name +
+                                       "\"");
+               groups.push_back(group);
+             }
+             // These point into definition_groups, so sorting restores the
+             // order they have to be loaded in.
+             std::sort(groups.begin(), groups.end());
+             groups.erase(std::unique(groups.begin(), groups.end()),
+                          groups.end());
+             if (timeout && *timeout <= 0)
+               throw py::value_error("timeout must be positive");
+             size_t count = workers.value_or(
+                 std::max(std::thread::hardware_concurrency(), 1u));
+             return std::make_unique<ProcessPool>(
+                 count, std::move(groups), timeout, eval_options,
+                 print_options);
+           }),
+           py::arg("workers") = std::optional<size_t>(),
+           py::arg("preload") = std::vector<std::string>{},
+           py::arg("timeout") = std::optional<double>(10.0),
+           py::arg("eval_options") = &global_evaluation_options,
+           py::arg("print_options") = &global_print_options)
+      .def(
+          "calculate_and_print",
+          [](ProcessPool &self, std::vector<std::string> const &expressions,
+             bool messages) -> py::object {
+            auto results = self.map(expressions);
+            py::list output;
+            for (auto &result : results) {
+              if (!messages) {
+                output.append(std::move(result.text));
+                continue;
+              }
+              std::vector<CalculatorMessage> converted;
+              for (auto &[type, text] : result.messages)
+                converted.emplace_back(text, type);
+              output.append(py::make_tuple(std::move(result.text),
+                                           std::move(converted)));
+            }
+            return output;
+          },
+          py::arg("expressions"), py::kw_only{}, py::arg("messages") = false)
+      .def_property_readonly("workers", &ProcessPool::size)
+      .def_property_readonly("closed", &ProcessPool::closed)
+      .def("close", &ProcessPool::close)
+      .def("__enter__", [](py::object self) { return self; })
+      .def("__exit__", [](ProcessPool &self, py::args) { self.close(); });
+}
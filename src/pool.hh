@@ -0,0 +1,79 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <chrono>
+#include <deque>
+#include <libqalculate/Calculator.h>
+#include <optional>
+#include <string>
+#include <sys/types.h>
+#include <utility>
+#include <vector>
+
+#include "definitions.hh"
+#include "wrappers.hh"
+
+struct PoolResult {
+  std::string text;
+  std::vector<std::pair<MessageType, std::string>> messages;
+};
+
+// Forked worker processes that evaluate expressions with
+// Calculator::calculateAndPrint. Every worker loads the preloaded definitions
+// once and then serves batches of expressions sent over a pair of pipes.
+class ProcessPool {
+public:
+  using Clock = std::chrono::steady_clock;
+
+  struct Worker {
+    pid_t pid = -1;
+    // Parent ends of the pipes.
+    int to_worker = -1;
+    int from_worker = -1;
+    // Set once the worker has finished loading definitions.
+    bool ready = false;
+    std::string buffer;
+    // Indices of expressions sent to the worker that have no result yet.
+    std::deque<size_t> pending;
+    Clock::time_point last_progress;
+  };
+
+  // Workers use the given precision instead of the one inherited from this
+  // process.
+  ProcessPool(size_t workers, std::vector<DefinitionGroup *> preload,
+              std::optional<double> timeout, PEvaluationOptions eval_options,
+              PrintOptions print_options,
+              std::optional<int> precision = std::nullopt);
+  ~ProcessPool();
+
+  ProcessPool(ProcessPool const &) = delete;
+  ProcessPool &operator=(ProcessPool const &) = delete;
+
+  std::vector<PoolResult> map(std::vector<std::string> const &expressions);
+  void close();
+
+  size_t size() const { return workers.size(); }
+  bool closed() const { return is_closed; }
+
+private:
+  std::vector<Worker> workers;
+  // Copies inherited by a forked child must leave the workers alone.
+  pid_t owner;
+  std::vector<DefinitionGroup *> preload;
+  std::optional<double> timeout;
+  PEvaluationOptions eval_options;
+  PrintOptions print_options;
+  std::optional<int> precision;
+  // Moving average of the time a single expression takes, used to size
+  // chunks so that every round trip takes roughly the same time.
+  double seconds_per_expression;
+  bool is_closed = false;
+
+  void spawn(Worker &worker);
+  void terminate(Worker &worker);
+  [[noreturn]] void worker_main(int input, int output);
+  size_t chunk_size(size_t remaining) const;
+};
+
+void add_pool(py::module_ &m);
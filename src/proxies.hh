@@ -6,21 +6,106 @@
 #include <concepts>
 #include <libqalculate/MathStructure.h>
 #include <libqalculate/qalculate.h>
+#include <limits>
+#include <optional>
 #include <pybind11/cast.h>
 #include <pybind11/complex.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/pytypes.h>
+#include <pybind11/stl.h>
 #include <string_view>
 #include <type_traits>
+#include <unordered_map>
 
+#include "matrix.hh"
 #include "number.hh"
+#include "options.hh"
 #include "ref.hh"
 
 // FIXME: split up generated.hh into separate files
 void MathStructure_repr(MathStructure const *mstruct, std::string &output);
+char const *enum_name(ComparisonType value);
+// Also used as the repr of the items themselves, defined in expression_item.cc
+void expression_item_repr(ExpressionItem const *item, std::string &output);
 
 inline PrintOptions repr_print_options;
 
+struct ReprLimits {
+  size_t max_depth = std::numeric_limits<size_t>::max();
+  size_t max_width = std::numeric_limits<size_t>::max();
+};
+
+// Limits used by __repr__, changed with set_repr_limits.
+inline ReprLimits repr_limits;
+
+// Output is handed over to the file in write_repr once it grows past this.
+constexpr size_t REPR_FLUSH_THRESHOLD = 64 * 1024;
+
+struct ReprState {
+  ReprLimits limits;
+  size_t depth = 0;
+  py::handle file;
+};
+
+inline thread_local ReprState repr_state;
+
+// Installs the limits (and optionally the output file) for a single repr
+// call tree, restoring the previous state afterwards.
+class ReprScope {
+  ReprState _saved;
+
+public:
+  ReprScope(ReprLimits limits = repr_limits, py::handle file = {})
+      : _saved(repr_state) {
+    repr_state = ReprState{limits, 0, file};
+  }
+  ~ReprScope() { repr_state = _saved; }
+
+  ReprScope(ReprScope const &) = delete;
+  ReprScope &operator=(ReprScope const &) = delete;
+};
+
+class ReprDepthGuard {
+  bool _entered;
+
+public:
+  ReprDepthGuard(std::string &output)
+      : _entered(repr_state.depth < repr_state.limits.max_depth) {
+    if (_entered)
+      ++repr_state.depth;
+    else
+      output += "...";
+  }
+  ~ReprDepthGuard() {
+    if (_entered)
+      --repr_state.depth;
+  }
+
+  ReprDepthGuard(ReprDepthGuard const &) = delete;
+  ReprDepthGuard &operator=(ReprDepthGuard const &) = delete;
+
+  explicit operator bool() const { return _entered; }
+};
+
+inline void repr_maybe_flush(std::string &output) {
+  if (repr_state.file && output.size() >= REPR_FLUSH_THRESHOLD) {
+    repr_state.file.attr("write")(py::str(output));
+    output.clear();
+  }
+}
+
+inline void repr_children(MathStructure const &mstruct, std::string &output) {
+  for (size_t i = 0; i < mstruct.size(); ++i) {
+    if (i != 0)
+      output += ", ";
+    if (i >= repr_state.limits.max_width) {
+      output += "...";
+      break;
+    }
+    MathStructure_repr(&mstruct[i], output);
+  }
+}
+
 template <typename... Extra>
 constexpr bool has_any_arg_extra = (std::is_base_of_v<py::arg, Extra> || ...);
 
@@ -112,7 +197,97 @@ inline py::list mstruct_getslice(MathStructure &self, py::slice slice) {
   return result;
 }
 
+// Hash consistent with MathStructure::equals(other, false, true), structures
+// that compare equal always hash the same (but not necessarily vice versa).
+inline size_t mstruct_hash(MathStructure const &mstruct) {
+  size_t hash = std::hash<int>{}(mstruct.type());
+  auto combine = [&hash](size_t value) {
+    hash ^= value + 0x9e3779b97f4a7c15 + (hash << 6) + (hash >> 2);
+  };
+
+  switch (mstruct.type()) {
+  case STRUCT_NUMBER:
+    // Equal numbers have equal values regardless of their representation,
+    // so the nearest double is a safe (if coarse) key.
+    combine(std::hash<double>{}(mstruct.number().floatValue()));
+    break;
+  case STRUCT_VARIABLE:
+    combine(std::hash<void const *>{}(mstruct.variable()));
+    break;
+  case STRUCT_UNIT:
+    combine(std::hash<void const *>{}(mstruct.unit()));
+    break;
+  case STRUCT_FUNCTION:
+    combine(std::hash<void const *>{}(mstruct.function()));
+    break;
+  case STRUCT_SYMBOLIC:
+    combine(std::hash<std::string>{}(mstruct.symbol()));
+    break;
+  case STRUCT_COMPARISON:
+    combine(std::hash<int>{}(mstruct.comparisonType()));
+    break;
+  default:
+    break;
+  }
+
+  // Children are summed so that the hash does not depend on their order,
+  // equals() matches the terms of some operations in any order.
+  size_t children = 0;
+  for (size_t i = 0; i < mstruct.size(); ++i)
+    children += mstruct_hash(mstruct[i]);
+  combine(mstruct.size());
+  combine(children);
+
+  return hash;
+}
+
+// Lazily built hash index over the children of a sequence, enabled
+// per object through MathStructure.Sequence.indexed.
+struct MathStructureChildIndex {
+  std::unordered_multimap<size_t, size_t> buckets;
+  bool built = false;
+
+  void build(MathStructure const &self) {
+    buckets.clear();
+    buckets.reserve(self.size());
+    for (size_t i = 0; i < self.size(); ++i)
+      buckets.emplace(mstruct_hash(self[i]), i);
+    built = true;
+  }
+
+  template <typename F>
+  void for_each_match(MathStructure const &self, MathStructure const &other,
+                      F &&callback) {
+    if (!built)
+      build(self);
+    auto [begin, end] = buckets.equal_range(mstruct_hash(other));
+    for (auto it = begin; it != end; ++it)
+      if (self[it->second].equals(other, false, true))
+        if (!callback(it->second))
+          return;
+  }
+};
+
+inline std::unordered_map<MathStructure const *, MathStructureChildIndex>
+    mstruct_child_indices;
+
+inline MathStructureChildIndex *mstruct_child_index(MathStructure const &self) {
+  if (mstruct_child_indices.empty())
+    return nullptr;
+  auto it = mstruct_child_indices.find(&self);
+  return it == mstruct_child_indices.end() ? nullptr : &it->second;
+}
+
 inline bool mstruct_contains(MathStructure &self, MathStructure const &other) {
+  if (auto *index = mstruct_child_index(self)) {
+    bool found = false;
+    index->for_each_match(self, other, [&found](size_t) {
+      found = true;
+      return false;
+    });
+    return found;
+  }
+
   for (size_t i = 0; i < self.size(); ++i)
     if (self[i].equals(other, false, true))
       return true;
@@ -121,6 +296,14 @@ inline bool mstruct_contains(MathStructure &self, MathStructure const &other) {
 
 inline size_t mstruct_count(MathStructure &self, MathStructure const &other) {
   size_t result = 0;
+  if (auto *index = mstruct_child_index(self)) {
+    index->for_each_match(self, other, [&result](size_t) {
+      result += 1;
+      return true;
+    });
+    return result;
+  }
+
   for (size_t i = 0; i < self.size(); ++i)
     if (self[i].equals(other, false, true))
       result += 1;
@@ -128,23 +311,43 @@ inline size_t mstruct_count(MathStructure &self, MathStructure const &other) {
 }
 
 inline ssize_t mstruct_index(MathStructure &self, MathStructure const &other) {
-  for (size_t i = 0; i < self.size(); ++i)
-    if (self[i].equals(other, false, true))
-      return i;
+  if (auto *index = mstruct_child_index(self)) {
+    std::optional<size_t> first;
+    index->for_each_match(self, other, [&first](size_t i) {
+      if (!first || i < *first)
+        first = i;
+      return true;
+    });
+    if (first)
+      return *first;
+  } else {
+    for (size_t i = 0; i < self.size(); ++i)
+      if (self[i].equals(other, false, true))
+        return i;
+  }
 
   std::string error_msg;
-  MathStructure_repr(&other, error_msg);
+  {
+    ReprScope scope;
+    MathStructure_repr(&other, error_msg);
+  }
   error_msg += " is not a child of this MathStructure";
   throw py::value_error(error_msg);
 }
 
 class MathStructureSequence : public MathStructureProxy {
+  void invalidate_index() {
+    if (auto *index = mstruct_child_index(*this))
+      index->built = false;
+  }
+
 public:
   void erase(size_t idx) {
     idx += 1;
     if (idx > this->size() || idx == 0)
       throw py::index_error{};
     this->delChild(idx);
+    invalidate_index();
   }
 
   void set_item(size_t idx, MathStructure *value) {
@@ -153,11 +356,38 @@ public:
       throw py::index_error{};
     value->ref();
     setChild_nocopy(value, idx);
+    invalidate_index();
   }
 
   void append(MathStructure *other) {
     other->ref();
     this->addChild_nocopy(other);
+    if (auto *index = mstruct_child_index(*this); index && index->built)
+      index->buckets.emplace(mstruct_hash(*other), this->size() - 1);
+  }
+
+  static bool is_indexed(MathStructureSequence const &self) {
+    return mstruct_child_index(self) != nullptr;
+  }
+
+  // The index lives as long as the Python object it was enabled on.
+  // Children mutated in place (e.g. through Number.value) are not noticed,
+  // toggle the property to rebuild it in that case.
+  static void set_indexed(py::object self, bool value) {
+    auto *ptr = self.cast<MathStructureSequence *>();
+    if (!value) {
+      mstruct_child_indices.erase(ptr);
+      return;
+    }
+
+    if (!mstruct_child_indices.try_emplace(ptr).second)
+      return;
+
+    py::cpp_function cleanup([ptr](py::handle weakref) {
+      mstruct_child_indices.erase(ptr);
+      weakref.dec_ref();
+    });
+    (void)py::weakref(self, cleanup).release();
   }
 };
 
@@ -172,6 +402,8 @@ init_math_structure_sequence(py::module_ &,
                              qalc_class_<MathStructure> &mstruct) {
   qalc_class_<MathStructureSequence, MathStructure>(mstruct, "Sequence")
       .def("append", &MathStructureSequence::append)
+      .def_property("indexed", &MathStructureSequence::is_indexed,
+                    &MathStructureSequence::set_indexed)
       .def("__setitem__", &MathStructureSequence::set_item)
       .def("__delitem__", &MathStructureSequence::erase);
 
@@ -186,11 +418,32 @@ init_math_structure_sequence(py::module_ &,
       .def(
           "__repr__",
           [](MathStructure const *self) {
+            ReprScope scope;
             std::string output;
             MathStructure_repr(self, output);
             return output;
           },
-          py::is_operator{});
+          py::is_operator{})
+
+      .def(
+          "write_repr",
+          [](MathStructure const *self, py::object file,
+             std::optional<size_t> max_depth,
+             std::optional<size_t> max_width) {
+            ReprScope scope(
+                ReprLimits{max_depth.value_or(repr_limits.max_depth),
+                           max_width.value_or(repr_limits.max_width)},
+                file);
+            std::string output;
+            output.reserve(REPR_FLUSH_THRESHOLD);
+            MathStructure_repr(self, output);
+            if (!output.empty())
+              file.attr("write")(py::str(output));
+          },
+          py::arg("file"), py::kw_only{},
+          py::arg("max_depth") = static_cast<std::optional<size_t>>(std::nullopt),
+          py::arg("max_width") =
+              static_cast<std::optional<size_t>>(std::nullopt));
 }
 
 template <typename Proxy>
@@ -277,11 +530,7 @@ public:
   void repr(std::string &output) const {
     output += Self::PYTHON_NAME;
     output += "([";
-    for (size_t i = 0; i < this->size(); ++i) {
-      if (i != 0)
-        output += ", ";
-      MathStructure_repr(&(*this)[i], output);
-    }
+    repr_children(*this, output);
     output += "])";
   }
 };
@@ -351,11 +600,14 @@ public:
   void repr(std::string &output) const {
     output += "MathStructure.Comparison(left=";
     MathStructure_repr(&(*this)[0], output);
-    output += ", type=";
-    output += ((py::object)py::cast(this->comparisonType()))
-                  .attr("__repr__")()
-                  .cast<std::string>();
-    output += ", right=";
+    output += ", type=<ComparisonType.";
+    if (char const *name = enum_name(this->comparisonType()))
+      output += name;
+    else
+      output += "???";
+    output += ": ";
+    output += std::to_string((int)this->comparisonType());
+    output += ">, right=";
     MathStructure_repr(&(*this)[1], output);
     output += ")";
   }
@@ -380,8 +632,7 @@ public:
 
   void repr(std ::string &output) const {
     output += "MathStructure.Variable(variable=";
-    output +=
-        py::cast(this->variable()).attr("__repr__")().cast<std::string_view>();
+    expression_item_repr(this->variable(), output);
     output += ")";
   }
 };
@@ -416,15 +667,9 @@ public:
 
   void repr(std::string &output) const {
     output += "MathStructure.Function(function=";
-    output += ((py::object)py::cast(this->function()))
-                  .attr("__repr__")()
-                  .cast<std::string>();
+    expression_item_repr(this->function(), output);
     output += ", args=[";
-    for (size_t i = 0; i < this->countChildren(); ++i) {
-      if (i != 0)
-        output += ", ";
-      output += py::cast(&(*this)[i]).attr("__repr__")().cast<std::string>();
-    }
+    repr_children(*this, output);
     output += "])";
   }
 };
@@ -448,8 +693,7 @@ public:
 
   void repr(std::string &output) const {
     output += "MathStructure.Unit(unit=";
-    output +=
-        py::cast(this->unit()).attr("__repr__")().cast<std::string_view>();
+    expression_item_repr(this->unit(), output);
     output += ")";
   }
 };
@@ -483,6 +727,16 @@ public:
 STUB_PROXY(Negate);
 STUB_PROXY(Inverse);
 
+#define DEF_ELEMENTWISE_OPERATION(name, operation)                              \
+  def(                                                                         \
+      name,                                                                    \
+      [](MathStructure const &self, MathStructure const &other,                \
+         PEvaluationOptions const &options) {                                  \
+        return elementwise(self, other, ElementwiseOperation::operation,       \
+                           options);                                           \
+      },                                                                       \
+      py::arg("other"), py::arg("options") = &global_evaluation_options)
+
 class MathStructureVectorProxy : public MathStructureSequence {
 public:
   MathStructureVectorProxy() { setType(STRUCT_VECTOR); }
@@ -527,21 +781,41 @@ public:
               return result;
             },
             py::arg("ascending") = true)
-        .def("flip", [](MathStructure &self) {
-          auto result = MathStructureRef::construct(self);
-          self.flipVector();
-          return result;
-        });
+        .def("flip",
+             [](MathStructure &self) {
+               auto result = MathStructureRef::construct(self);
+               result->flipVector();
+               return result;
+             })
+        .def("matmul", &matrix_multiply, py::arg("other"),
+             py::arg("options") = &global_evaluation_options)
+        .def(
+            "__matmul__",
+            [](MathStructureVectorProxy const &self,
+               MathStructureVectorProxy const &other) {
+              return matrix_multiply(self, other, global_evaluation_options);
+            },
+            py::is_operator{})
+        .def("transpose", &matrix_transpose)
+        .def("determinant", &matrix_determinant,
+             py::arg("options") = &global_evaluation_options)
+        .def("inverse", &matrix_inverse,
+             py::arg("options") = &global_evaluation_options)
+        .def("adjugate", &matrix_adjugate,
+             py::arg("options") = &global_evaluation_options)
+        .def("solve", &matrix_solve, py::arg("b"),
+             py::arg("options") = &global_evaluation_options)
+        .DEF_ELEMENTWISE_OPERATION("add", ADD)
+        .DEF_ELEMENTWISE_OPERATION("sub", SUBTRACT)
+        .DEF_ELEMENTWISE_OPERATION("mul", MULTIPLY)
+        .DEF_ELEMENTWISE_OPERATION("div", DIVIDE)
+        .DEF_ELEMENTWISE_OPERATION("pow", RAISE);
     py::implicitly_convertible<py::sequence, MathStructureVectorProxy>();
   }
 
   void repr(std::string &output) const {
     output += "MathStructure.Vector([";
-    for (size_t i = 0; i < size(); ++i) {
-      if (i)
-        output += ", ";
-      MathStructure_repr(&(*this)[i], output);
-    }
+    repr_children(*this, output);
     output += "])";
   }
 };
@@ -1,5 +1,6 @@
 #pragma once
 
+#include <libqalculate/Function.h>
 #include <libqalculate/MathStructure.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/pytypes.h>
@@ -8,6 +9,16 @@ namespace PYBIND11_NAMESPACE {
 template <> struct polymorphic_type_hook<MathStructure> {
   static void const *get(MathStructure const *src, std::type_info const *&type);
 };
+
+// Register the class of builtin functions on first use, see lazy.cc. Both
+// are needed, since items are also returned through ExpressionItem.
+template <> struct polymorphic_type_hook<ExpressionItem> {
+  static void const *get(ExpressionItem const *src,
+                         std::type_info const *&type);
+};
+template <> struct polymorphic_type_hook<MathFunction> {
+  static void const *get(MathFunction const *src, std::type_info const *&type);
+};
 } // namespace PYBIND11_NAMESPACE
 
 namespace py = pybind11;
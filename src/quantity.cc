@@ -0,0 +1,381 @@
+#include "quantity.hh"
+
+#include <memory>
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+#include <stdexcept>
+#include <type_traits>
+#include <unordered_map>
+#include <utility>
+
+#include "converter.hh"
+#include "definitions.hh"
+#include "messages.hh"
+
+namespace {
+
+std::vector<double> as_floats(QuantityArray::Values const &values) {
+  if (auto floats = std::get_if<std::vector<double>>(&values))
+    return *floats;
+  std::vector<double> result;
+  for (auto const &number : std::get<std::vector<Number>>(values))
+    result.push_back(number.floatValue());
+  return result;
+}
+
+// Broadcasts single values against arrays.
+size_t result_size(size_t a, size_t b) {
+  if (a == b || b == 1)
+    return a;
+  if (a == 1)
+    return b;
+  throw py::value_error("arrays of sizes " + std::to_string(a) + " and " +
+                        std::to_string(b) + " cannot be combined");
+}
+
+enum class Operation { ADD, SUBTRACT, MULTIPLY, DIVIDE };
+
+QuantityArray::Values combine(QuantityArray::Values const &a,
+                              QuantityArray::Values const &b,
+                              Operation operation) {
+  auto *exact_a = std::get_if<std::vector<Number>>(&a);
+  auto *exact_b = std::get_if<std::vector<Number>>(&b);
+  if (exact_a && exact_b) {
+    size_t size = result_size(exact_a->size(), exact_b->size());
+    std::vector<Number> result;
+    result.reserve(size);
+    for (size_t i = 0; i < size; ++i) {
+      Number value((*exact_a)[exact_a->size() == 1 ? 0 : i]);
+      Number const &other = (*exact_b)[exact_b->size() == 1 ? 0 : i];
+      bool ok = false;
+      switch (operation) {
+      case Operation::ADD:
+        ok = value.add(other);
+        break;
+      case Operation::SUBTRACT:
+        ok = value.subtract(other);
+        break;
+      case Operation::MULTIPLY:
+        ok = value.multiply(other);
+        break;
+      case Operation::DIVIDE:
+        ok = value.divide(other);
+        break;
+      }
+      if (!ok)
+        throw py::value_error("operation failed for element " +
+                              std::to_string(i));
+      result.push_back(std::move(value));
+    }
+    return result;
+  }
+
+  auto x = as_floats(a);
+  auto y = as_floats(b);
+  size_t size = result_size(x.size(), y.size());
+  std::vector<double> result(size);
+  py::gil_scoped_release _gil;
+  for (size_t i = 0; i < size; ++i) {
+    double value = x[x.size() == 1 ? 0 : i];
+    double other = y[y.size() == 1 ? 0 : i];
+    switch (operation) {
+    case Operation::ADD:
+      result[i] = value + other;
+      break;
+    case Operation::SUBTRACT:
+      result[i] = value - other;
+      break;
+    case Operation::MULTIPLY:
+      result[i] = value * other;
+      break;
+    case Operation::DIVIDE:
+      result[i] = value / other;
+      break;
+    }
+  }
+  return result;
+}
+
+QuantityArray::Values convert_values(QuantityArray::Values const &values,
+                                     UnitConverter const &converter) {
+  if (auto exact = std::get_if<std::vector<Number>>(&values)) {
+    std::vector<Number> result;
+    result.reserve(exact->size());
+    for (auto const &value : *exact)
+      result.push_back(converter.convert(value));
+    return result;
+  }
+  auto result = std::get<std::vector<double>>(values);
+  converter.convert_floats(result.data(), result.data(), result.size());
+  return result;
+}
+
+QuantityArray::Values values_from_python(py::handle values, bool exact) {
+  if (!exact && is_ndarray(values)) {
+    using Array =
+        py::array_t<double, py::array::c_style | py::array::forcecast>;
+    auto array = Array::ensure(values);
+    if (!array || array.ndim() != 1)
+      throw py::value_error("expected a one dimensional array of numbers");
+    return std::vector<double>(array.data(), array.data() + array.size());
+  }
+  if (exact) {
+    std::vector<Number> result;
+    for (auto value : values)
+      result.push_back(value.cast<Number>());
+    return result;
+  }
+  std::vector<double> result;
+  for (auto value : values)
+    result.push_back(value.cast<double>());
+  return result;
+}
+
+// Converters between the units of arrays, dropped once they reach their
+// limit and whenever the set of units or the precision changes.
+constexpr size_t MAX_CONVERTERS = 256;
+
+std::unordered_map<std::string, std::shared_ptr<UnitConverter const>>
+    converters;
+size_t converters_units = 0;
+int converters_precision = 0;
+
+std::shared_ptr<UnitConverter const>
+cached_converter(std::string const &from, ConversionTarget const &to,
+                 bool exact) {
+  if (converters_units != CALCULATOR->units.size() ||
+      converters_precision != CALCULATOR->getPrecision()) {
+    converters.clear();
+    converters_units = CALCULATOR->units.size();
+    converters_precision = CALCULATOR->getPrecision();
+  }
+  std::string key = from + '\0' + to.text() + (exact ? "\0e" : "\0f");
+  if (auto it = converters.find(key); it != converters.end())
+    return it->second;
+  auto converter = std::make_shared<UnitConverter const>(from, to, exact);
+  // Constructing it may have loaded more units.
+  if (converters_units != CALCULATOR->units.size())
+    return converter;
+  if (converters.size() >= MAX_CONVERTERS)
+    converters.clear();
+  converters.emplace(std::move(key), converter);
+  return converter;
+}
+
+MathStructure unit_from_python(py::handle unit) {
+  if (py::isinstance<py::str>(unit)) {
+    auto text = unit.cast<std::string>();
+    if (text.empty())
+      return MathStructure(1, 1, 0);
+    load_definitions_for_expression(text);
+    return CALCULATOR->parse(text);
+  }
+  return unit.cast<MathStructure>();
+}
+
+} // namespace
+
+QuantityArray::QuantityArray(Values values, MathStructure structure)
+    : values(std::move(values)) {
+  structure.eval(conversion_options());
+  Number coefficient(1, 1);
+  if (structure.isNumber()) {
+    coefficient = structure.number();
+    structure = MathStructure(1, 1, 0);
+  } else if (structure.isMultiplication()) {
+    for (size_t i = structure.size(); i > 0; --i) {
+      if (!structure[i - 1].isNumber())
+        continue;
+      coefficient.multiply(structure[i - 1].number());
+      structure.delChild(i);
+    }
+    if (structure.size() == 1)
+      structure.setToChild(1);
+  }
+  if (!coefficient.isOne())
+    this->values =
+        combine(this->values,
+                exact() ? Values(std::vector<Number>{coefficient})
+                        : Values(std::vector<double>{coefficient.floatValue()}),
+                Operation::MULTIPLY);
+
+  if (!structure.isOne()) {
+    PrintOptions options;
+    MathStructure formatted(structure);
+    formatted.format(options);
+    unit_text = formatted.print(options);
+  }
+  unit = MathStructureRef::adopt(structure);
+}
+
+size_t QuantityArray::size() const {
+  return std::visit([](auto const &values) { return values.size(); }, values);
+}
+
+QuantityArray QuantityArray::to(ConversionTarget const &target) const {
+  auto converter = cached_converter(unit_text, target, exact());
+  return QuantityArray(convert_values(values, *converter),
+                       target.unit_structure());
+}
+
+QuantityArray QuantityArray::add(QuantityArray const &other,
+                                 bool subtract) const {
+  auto operation = subtract ? Operation::SUBTRACT : Operation::ADD;
+  if (unit_text == other.unit_text)
+    return QuantityArray(combine(values, other.values, operation), *unit);
+  if (unit_text.empty() || other.unit_text.empty())
+    throw py::value_error("cannot combine \"" + unit_text + "\" and \"" +
+                          other.unit_text + "\"");
+  auto converter = cached_converter(other.unit_text,
+                                    ConversionTarget(unit_text), other.exact());
+  return QuantityArray(
+      combine(values, convert_values(other.values, *converter), operation),
+      *unit);
+}
+
+QuantityArray QuantityArray::multiply(QuantityArray const &other,
+                                      bool divide) const {
+  MathStructure structure(*unit);
+  if (divide)
+    structure.divide(*other.unit);
+  else
+    structure.multiply(*other.unit);
+  return QuantityArray(
+      combine(values, other.values,
+              divide ? Operation::DIVIDE : Operation::MULTIPLY),
+      std::move(structure));
+}
+
+QuantityArray QuantityArray::negate() const {
+  Values minus_one = exact() ? Values(std::vector<Number>{Number(-1, 1)})
+                             : Values(std::vector<double>{-1.0});
+  return QuantityArray(combine(values, minus_one, Operation::MULTIPLY), *unit);
+}
+
+void add_quantity_array(py::module_ &m) {
+  auto scalar = [](Number const &value) {
+    return QuantityArray(std::vector<Number>{value}, MathStructure(1, 1, 0));
+  };
+
+  py::class_<QuantityArray>(m, "QuantityArray")
+      .def(py::init([](py::object values, py::object unit, bool exact) {
+             MessageGuard messages;
+             return QuantityArray(values_from_python(values, exact),
+                                  unit_from_python(unit));
+           }),
+           py::arg("values"), py::arg("unit") = "", py::kw_only{},
+           py::arg("exact") = false)
+      .def_property_readonly(
+          "unit", [](QuantityArray const &self) { return self.unit; })
+      .def_property_readonly("exact", &QuantityArray::exact)
+      .def_property_readonly("values",
+                             [](QuantityArray const &self) -> py::object {
+                               return std::visit(
+                                   [](auto const &values) -> py::object {
+                                     return py::cast(values);
+                                   },
+                                   self.values);
+                             })
+      .def("__len__", &QuantityArray::size)
+      .def("__getitem__",
+           [](QuantityArray const &self, py::ssize_t index) {
+             py::ssize_t size = self.size();
+             if (index < 0)
+               index += size;
+             if (index < 0 || index >= size)
+               throw py::index_error();
+             MathStructure value = std::visit(
+                 [&](auto const &values) {
+                   if constexpr (std::is_same_v<std::decay_t<decltype(values)>,
+                                                std::vector<Number>>)
+                     return MathStructure(values[index]);
+                   else {
+                     Number number;
+                     number.setFloat(values[index]);
+                     return MathStructure(number);
+                   }
+                 },
+                 self.values);
+             if (!self.unit->isOne())
+               value.multiply(*self.unit);
+             return MathStructureRef::adopt(value);
+           })
+      .def(
+          "__array__",
+          [](QuantityArray const &self, py::object dtype, py::object) {
+            auto floats = as_floats(self.values);
+            py::array result =
+                py::array_t<double>(floats.size(), floats.data());
+            if (!dtype.is_none())
+              result = result.attr("astype")(dtype);
+            return result;
+          },
+          py::arg("dtype") = py::none(), py::arg("copy") = py::none())
+      .def(
+          "to",
+          [](QuantityArray const &self, Conversion const &target) {
+            MessageGuard messages;
+            if (auto text = std::get_if<std::string>(&target))
+              return self.to(ConversionTarget(*text));
+            return self.to(std::get<ConversionTarget>(target));
+          },
+          py::arg("target"))
+      .def(
+          "__add__",
+          [](QuantityArray const &self, QuantityArray const &other) {
+            MessageGuard messages;
+            return self.add(other, false);
+          },
+          py::is_operator())
+      .def(
+          "__sub__",
+          [](QuantityArray const &self, QuantityArray const &other) {
+            MessageGuard messages;
+            return self.add(other, true);
+          },
+          py::is_operator())
+      .def(
+          "__mul__",
+          [](QuantityArray const &self, QuantityArray const &other) {
+            MessageGuard messages;
+            return self.multiply(other, false);
+          },
+          py::is_operator())
+      .def(
+          "__mul__",
+          [scalar](QuantityArray const &self, Number const &other) {
+            return self.multiply(scalar(other), false);
+          },
+          py::is_operator())
+      .def(
+          "__rmul__",
+          [scalar](QuantityArray const &self, Number const &other) {
+            return scalar(other).multiply(self, false);
+          },
+          py::is_operator())
+      .def(
+          "__truediv__",
+          [](QuantityArray const &self, QuantityArray const &other) {
+            MessageGuard messages;
+            return self.multiply(other, true);
+          },
+          py::is_operator())
+      .def(
+          "__truediv__",
+          [scalar](QuantityArray const &self, Number const &other) {
+            return self.multiply(scalar(other), true);
+          },
+          py::is_operator())
+      .def(
+          "__rtruediv__",
+          [scalar](QuantityArray const &self, Number const &other) {
+            return scalar(other).multiply(self, true);
+          },
+          py::is_operator())
+      .def("__neg__", &QuantityArray::negate)
+      .def("__repr__", [](QuantityArray const &self) {
+        return "<QuantityArray of " + std::to_string(self.size()) + " " +
+               (self.exact() ? "exact " : "") + "values" +
+               (self.unit_text.empty() ? "" : " in " + self.unit_text) + ">";
+      });
+}
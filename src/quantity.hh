@@ -0,0 +1,39 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <libqalculate/qalculate.h>
+#include <string>
+#include <variant>
+#include <vector>
+
+#include "conversion.hh"
+#include "ref.hh"
+
+// A one dimensional array of floats or exact Numbers that share a single unit.
+// Operations combine the units once and then work on the plain values.
+class QuantityArray {
+public:
+  using Values = std::variant<std::vector<double>, std::vector<Number>>;
+
+  // Numeric factors of unit are moved into the values.
+  QuantityArray(Values values, MathStructure unit);
+
+  Values values;
+  // A product of units, or 1 for dimensionless values.
+  MathStructureRef unit;
+  // What unit prints as, empty when dimensionless.
+  std::string unit_text;
+
+  bool exact() const {
+    return std::holds_alternative<std::vector<Number>>(values);
+  }
+  size_t size() const;
+
+  QuantityArray to(ConversionTarget const &target) const;
+  QuantityArray add(QuantityArray const &other, bool subtract) const;
+  QuantityArray multiply(QuantityArray const &other, bool divide) const;
+  QuantityArray negate() const;
+};
+
+void add_quantity_array(py::module_ &m);
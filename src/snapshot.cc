@@ -0,0 +1,213 @@
+#include "snapshot.hh"
+
+#include <cstdint>
+#include <cstdlib>
+#include <fstream>
+#include <iterator>
+#include <libqalculate/qalculate.h>
+#include <stdexcept>
+#include <string>
+#include <unistd.h>
+#include <vector>
+
+#include "definitions.hh"
+
+// Layout, in native byte order:
+//   magic "QALCSNAP", u32 format version, u32 libqalculate version,
+//   u64 newest modification time among the global definition files,
+//   u64 number of global definition files, u32 mask of loaded groups,
+//   u32 section count, section count * (u32 group index, u64 length, bytes)
+// Sections hold the items of a group as written by libqalculate's save
+// functions and are stored in load order.
+
+namespace fs = std::filesystem;
+
+namespace {
+
+constexpr char MAGIC[8] = {'Q', 'A', 'L', 'C', 'S', 'N', 'A', 'P'};
+// Section masks follow the order of definition_groups.
+constexpr uint32_t FORMAT_VERSION = 2;
+constexpr uint32_t LIBRARY_VERSION = QALCULATE_MAJOR_VERSION * 10000 +
+                                     QALCULATE_MINOR_VERSION * 100 +
+                                     QALCULATE_MICRO_VERSION;
+constexpr size_t GROUP_COUNT = std::size(definition_groups);
+
+struct Header {
+  uint32_t library_version;
+  uint64_t newest;
+  uint64_t files;
+
+  bool operator==(Header const &other) const {
+    return library_version == other.library_version &&
+           newest == other.newest && files == other.files;
+  }
+};
+
+Header current_header() {
+  Header header{LIBRARY_VERSION, 0, 0};
+  std::error_code error;
+  fs::recursive_directory_iterator it(getGlobalDefinitionsDir(), error), end;
+  for (; !error && it != end; it.increment(error)) {
+    if (!it->is_regular_file(error))
+      continue;
+    auto time = it->last_write_time(error).time_since_epoch().count();
+    header.newest = std::max<uint64_t>(header.newest, time);
+    ++header.files;
+  }
+  return header;
+}
+
+class TempFile {
+public:
+  std::string path;
+
+  TempFile() {
+    path = (fs::temp_directory_path() / "qalculate-snapshot-XXXXXX").string();
+    int fd = mkstemp(path.data());
+    if (fd < 0)
+      throw std::system_error(errno, std::generic_category(), "mkstemp");
+    ::close(fd);
+  }
+  ~TempFile() { unlink(path.c_str()); }
+
+  TempFile(TempFile const &) = delete;
+  TempFile &operator=(TempFile const &) = delete;
+};
+
+template <typename T> void write_value(std::ostream &out, T value) {
+  out.write(reinterpret_cast<char const *>(&value), sizeof value);
+}
+
+template <typename T> T read_value(std::istream &in) {
+  T value;
+  if (!in.read(reinterpret_cast<char *>(&value), sizeof value))
+    throw std::runtime_error("qalculate snapshot is truncated");
+  return value;
+}
+
+[[noreturn]] void raise_os_error(fs::path const &path) {
+  PyErr_SetFromErrnoWithFilename(PyExc_OSError, path.c_str());
+  throw py::error_already_set();
+}
+
+// The section of a group also holds the items of a preceding group that has
+// no save function of its own.
+bool section_needed(size_t index) {
+  if (definition_groups[index].loaded)
+    return true;
+  return index > 0 && !definition_groups[index - 1].save &&
+         definition_groups[index - 1].loaded;
+}
+
+} // namespace
+
+void save_snapshot(fs::path const &path) {
+  uint32_t mask = 0;
+  for (size_t i = 0; i < GROUP_COUNT; ++i)
+    if (definition_groups[i].loaded)
+      mask |= 1 << i;
+  if (!mask)
+    throw std::runtime_error("no definitions have been loaded");
+
+  std::vector<std::pair<uint32_t, std::string>> sections;
+  for (size_t i = 0; i < GROUP_COUNT; ++i) {
+    auto &group = definition_groups[i];
+    if (!group.save || !section_needed(i))
+      continue;
+    TempFile file;
+    if ((*CALCULATOR.*group.save)(file.path.c_str(), true) < 0)
+      throw std::runtime_error(std::string("qalculate failed to save ") +
+                               group.name);
+    std::ifstream in(file.path, std::ios::binary);
+    sections.emplace_back(i, std::string(std::istreambuf_iterator<char>(in),
+                                         std::istreambuf_iterator<char>()));
+  }
+
+  // Written next to the destination and renamed over it so that concurrent
+  // readers never see a partial snapshot.
+  fs::path partial = path;
+  partial += ".partial";
+  {
+    std::ofstream out(partial, std::ios::binary | std::ios::trunc);
+    if (!out)
+      raise_os_error(partial);
+
+    Header header = current_header();
+    out.write(MAGIC, sizeof MAGIC);
+    write_value(out, FORMAT_VERSION);
+    write_value(out, header.library_version);
+    write_value(out, header.newest);
+    write_value(out, header.files);
+    write_value(out, mask);
+    write_value<uint32_t>(out, sections.size());
+    for (auto const &[index, data] : sections) {
+      write_value(out, index);
+      write_value<uint64_t>(out, data.size());
+      out.write(data.data(), data.size());
+    }
+    if (!out.flush())
+      raise_os_error(partial);
+  }
+  fs::rename(partial, path);
+}
+
+bool load_snapshot(fs::path const &path) {
+  std::ifstream in(path, std::ios::binary);
+  if (!in)
+    raise_os_error(path);
+
+  char magic[sizeof MAGIC];
+  if (!in.read(magic, sizeof magic) ||
+      !std::equal(std::begin(magic), std::end(magic), MAGIC) ||
+      read_value<uint32_t>(in) != FORMAT_VERSION)
+    throw py::value_error("not a qalculate snapshot: " + path.string());
+
+  Header header;
+  header.library_version = read_value<uint32_t>(in);
+  header.newest = read_value<uint64_t>(in);
+  header.files = read_value<uint64_t>(in);
+  auto mask = read_value<uint32_t>(in);
+
+  if (!(header == current_header())) {
+    for (size_t i = 0; i < GROUP_COUNT; ++i)
+      if (mask & (1 << i))
+        load_definition_group(definition_groups[i]);
+    return false;
+  }
+
+  // Section lengths are checked against what is left of the file before
+  // anything is allocated for them.
+  auto const start = in.tellg();
+  in.seekg(0, std::ios::end);
+  auto const end = in.tellg();
+  in.seekg(start);
+
+  auto count = read_value<uint32_t>(in);
+  std::string data;
+  for (uint32_t i = 0; i < count; ++i) {
+    auto index = read_value<uint32_t>(in);
+    auto length = read_value<uint64_t>(in);
+    if (index >= GROUP_COUNT)
+      throw py::value_error("not a qalculate snapshot: " + path.string());
+    if (length > static_cast<uint64_t>(end - in.tellg()))
+      throw std::runtime_error("qalculate snapshot is truncated");
+    data.resize(length);
+    if (!in.read(data.data(), length))
+      throw std::runtime_error("qalculate snapshot is truncated");
+
+    // Already loaded items would only be replaced by identical copies.
+    if (definition_groups[index].loaded)
+      continue;
+    TempFile file;
+    std::ofstream(file.path, std::ios::binary).write(data.data(), length);
+    if (!CALCULATOR->loadDefinitions(file.path.c_str(), false, true))
+      throw std::runtime_error(std::string("qalculate failed to load ") +
+                               definition_groups[index].name +
+                               " from snapshot");
+  }
+
+  for (size_t i = 0; i < GROUP_COUNT; ++i)
+    if (mask & (1 << i))
+      definition_groups[i].loaded = true;
+  return true;
+}
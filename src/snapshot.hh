@@ -0,0 +1,10 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <filesystem>
+
+void save_snapshot(std::filesystem::path const &path);
+// Returns false if the snapshot was stale and the definitions it lists were
+// loaded from libqalculate's data files instead.
+bool load_snapshot(std::filesystem::path const &path);
@@ -0,0 +1,433 @@
+#include "sparse.hh"
+
+#include <algorithm>
+#include <libqalculate/qalculate.h>
+#include <map>
+#include <pybind11/gil.h>
+#include <pybind11/numpy.h>
+#include <pybind11/stl.h>
+
+#include "context.hh"
+#include "matrix.hh"
+#include "options.hh"
+#include "proxies.hh"
+
+static MathStructure zero() { return MathStructure(0, 1, 0); }
+
+SparseMatrix::SparseMatrix(size_t rows, size_t columns)
+    : rows(rows), columns(columns), row_offsets(rows + 1, 0) {}
+
+SparseMatrix SparseMatrix::from_triplets(size_t rows, size_t columns,
+                                         std::vector<Triplet> triplets,
+                                         EvaluationOptions const &options) {
+  std::stable_sort(triplets.begin(), triplets.end(),
+                   [](Triplet const &a, Triplet const &b) {
+                     return a.row < b.row ||
+                            (a.row == b.row && a.column < b.column);
+                   });
+
+  SparseMatrix result(rows, columns);
+  result.column_indices.reserve(triplets.size());
+  result.values.reserve(triplets.size());
+
+  auto flush = [&result](size_t row, size_t column, MathStructureRef value) {
+    if (value->isZero())
+      return;
+    result.row_offsets[row + 1] += 1;
+    result.column_indices.push_back(column);
+    result.values.push_back(std::move(value));
+  };
+
+  for (size_t i = 0; i < triplets.size();) {
+    auto &first = triplets[i];
+    if (first.row >= rows || first.column >= columns)
+      throw py::index_error("(" + std::to_string(first.row) + ", " +
+                            std::to_string(first.column) +
+                            ") is out of bounds for a " + std::to_string(rows) +
+                            "x" + std::to_string(columns) + " matrix");
+
+    MathStructureRef value = first.value;
+    size_t j = i + 1;
+    for (; j < triplets.size() && triplets[j].row == first.row &&
+           triplets[j].column == first.column;
+         ++j)
+      value = MathStructureRef::construct(apply_scalar_operation(
+          *value, *triplets[j].value, ElementwiseOperation::ADD, options));
+
+    flush(first.row, first.column, std::move(value));
+    i = j;
+  }
+
+  for (size_t row = 0; row < rows; ++row)
+    result.row_offsets[row + 1] += result.row_offsets[row];
+
+  return result;
+}
+
+SparseMatrix SparseMatrix::from_dense(MathStructure const &matrix) {
+  if (!matrix.isVector())
+    throw py::type_error("expected a vector or a matrix");
+
+  bool is_matrix = matrix.isMatrix();
+  size_t rows = is_matrix ? matrix.rows() : 1;
+  size_t columns = is_matrix ? matrix.columns() : matrix.size();
+
+  SparseMatrix result(rows, columns);
+  for (size_t i = 0; i < rows; ++i) {
+    MathStructure const &row = is_matrix ? matrix[i] : matrix;
+    for (size_t j = 0; j < columns; ++j) {
+      if (row[j].isZero())
+        continue;
+      result.column_indices.push_back(j);
+      result.values.push_back(MathStructureRef::construct(row[j]));
+    }
+    result.row_offsets[i + 1] = result.values.size();
+  }
+  return result;
+}
+
+MathStructure const *SparseMatrix::find(size_t row, size_t column) const {
+  auto begin = column_indices.begin() + row_offsets[row];
+  auto end = column_indices.begin() + row_offsets[row + 1];
+  auto it = std::lower_bound(begin, end, column);
+  if (it == end || *it != column)
+    return nullptr;
+  return values[it - column_indices.begin()].get();
+}
+
+void SparseMatrix::set(size_t row, size_t column, MathStructureRef value) {
+  auto begin = column_indices.begin() + row_offsets[row];
+  auto end = column_indices.begin() + row_offsets[row + 1];
+  auto it = std::lower_bound(begin, end, column);
+  size_t position = it - column_indices.begin();
+  bool exists = it != end && *it == column;
+
+  if (value->isZero()) {
+    if (!exists)
+      return;
+    column_indices.erase(it);
+    values.erase(values.begin() + position);
+    for (size_t i = row + 1; i <= rows; ++i)
+      row_offsets[i] -= 1;
+  } else if (exists)
+    values[position] = std::move(value);
+  else {
+    column_indices.insert(it, column);
+    values.insert(values.begin() + position, std::move(value));
+    for (size_t i = row + 1; i <= rows; ++i)
+      row_offsets[i] += 1;
+  }
+}
+
+MathStructure SparseMatrix::to_dense() const {
+  MathStructure result;
+  result.clearVector();
+  for (size_t i = 0; i < rows; ++i) {
+    MathStructure row;
+    row.clearVector();
+    size_t k = row_offsets[i];
+    for (size_t j = 0; j < columns; ++j) {
+      if (k < row_offsets[i + 1] && column_indices[k] == j)
+        row.addChild(*values[k++]);
+      else
+        row.addChild(zero());
+    }
+    result.addChild(row);
+  }
+  return result;
+}
+
+SparseMatrix SparseMatrix::add(SparseMatrix const &other,
+                               EvaluationOptions const &options) const {
+  if (rows != other.rows || columns != other.columns)
+    throw py::value_error("cannot add sparse matrices of different shapes");
+
+  SparseMatrix result(rows, columns);
+  auto push = [&result](size_t column, MathStructureRef value) {
+    if (value->isZero())
+      return;
+    result.column_indices.push_back(column);
+    result.values.push_back(std::move(value));
+  };
+
+  for (size_t i = 0; i < rows; ++i) {
+    size_t a = row_offsets[i], a_end = row_offsets[i + 1];
+    size_t b = other.row_offsets[i], b_end = other.row_offsets[i + 1];
+    while (a < a_end || b < b_end) {
+      if (b == b_end ||
+          (a < a_end && column_indices[a] < other.column_indices[b])) {
+        push(column_indices[a], values[a]);
+        ++a;
+      } else if (a == a_end || other.column_indices[b] < column_indices[a]) {
+        push(other.column_indices[b], other.values[b]);
+        ++b;
+      } else {
+        push(column_indices[a],
+             MathStructureRef::construct(
+                 apply_scalar_operation(*values[a], *other.values[b],
+                                        ElementwiseOperation::ADD, options)));
+        ++a;
+        ++b;
+      }
+    }
+    result.row_offsets[i + 1] = result.values.size();
+  }
+  return result;
+}
+
+SparseMatrix SparseMatrix::multiply(SparseMatrix const &other,
+                                    EvaluationOptions const &options) const {
+  if (columns != other.rows)
+    throw py::value_error("sparse matrix dimensions do not match");
+
+  SparseMatrix result(rows, other.columns);
+  std::map<size_t, MathStructure> accumulator;
+  for (size_t i = 0; i < rows; ++i) {
+    accumulator.clear();
+    for (size_t a = row_offsets[i]; a < row_offsets[i + 1]; ++a) {
+      size_t k = column_indices[a];
+      for (size_t b = other.row_offsets[k]; b < other.row_offsets[k + 1];
+           ++b) {
+        MathStructure product =
+            apply_scalar_operation(*values[a], *other.values[b],
+                                   ElementwiseOperation::MULTIPLY, options);
+        auto [it, inserted] =
+            accumulator.try_emplace(other.column_indices[b], product);
+        if (!inserted)
+          it->second = apply_scalar_operation(
+              it->second, product, ElementwiseOperation::ADD, options);
+      }
+    }
+
+    for (auto &[column, value] : accumulator) {
+      if (value.isZero())
+        continue;
+      result.column_indices.push_back(column);
+      result.values.push_back(MathStructureRef::construct(value));
+    }
+    result.row_offsets[i + 1] = result.values.size();
+  }
+  return result;
+}
+
+MathStructure SparseMatrix::multiply_dense(MathStructure const &other,
+                                           EvaluationOptions const &options) const {
+  if (!other.isVector())
+    throw py::type_error("expected a vector or a matrix");
+
+  bool is_matrix = other.isMatrix();
+  size_t other_rows = is_matrix ? other.rows() : other.size();
+  size_t other_columns = is_matrix ? other.columns() : 1;
+  if (columns != other_rows)
+    throw py::value_error("matrix dimensions do not match");
+
+  auto element = [&](size_t i, size_t j) {
+    MathStructure sum = zero();
+    for (size_t a = row_offsets[i]; a < row_offsets[i + 1]; ++a) {
+      size_t k = column_indices[a];
+      MathStructure const &rhs = is_matrix ? other[k][j] : other[k];
+      sum = apply_scalar_operation(
+          sum,
+          apply_scalar_operation(*values[a], rhs,
+                                 ElementwiseOperation::MULTIPLY, options),
+          ElementwiseOperation::ADD, options);
+    }
+    return sum;
+  };
+
+  MathStructure result;
+  result.clearVector();
+  for (size_t i = 0; i < rows; ++i) {
+    if (!is_matrix) {
+      result.addChild(element(i, 0));
+      continue;
+    }
+    MathStructure row;
+    row.clearVector();
+    for (size_t j = 0; j < other_columns; ++j)
+      row.addChild(element(i, j));
+    result.addChild(row);
+  }
+  return result;
+}
+
+namespace {
+
+// numpy arrays are converted with tolist() so that their scalars are
+// plain Python numbers.
+py::list to_list(py::handle values) {
+  if (py::hasattr(values, "tolist"))
+    return values.attr("tolist")();
+  return py::list(py::reinterpret_borrow<py::object>(values));
+}
+
+std::pair<size_t, size_t> check_index(SparseMatrix const &self,
+                                      std::tuple<size_t, size_t> index) {
+  auto [row, column] = index;
+  if (row >= self.rows || column >= self.columns)
+    throw py::index_error();
+  return {row, column};
+}
+
+SparseMatrix from_coo(std::tuple<size_t, size_t> shape, py::handle row,
+                      py::handle col, py::handle data,
+                      PEvaluationOptions const &options) {
+  auto rows = to_list(row), columns = to_list(col), values = to_list(data);
+  if (rows.size() != columns.size() || rows.size() != values.size())
+    throw py::value_error("row, col and data must have the same length");
+
+  std::vector<SparseMatrix::Triplet> triplets;
+  triplets.reserve(values.size());
+  for (size_t i = 0; i < values.size(); ++i)
+    triplets.push_back({rows[i].cast<size_t>(), columns[i].cast<size_t>(),
+                        values[i].cast<MathStructureRef>()});
+
+  CalculatorGilRelease _gil;
+  return SparseMatrix::from_triplets(std::get<0>(shape), std::get<1>(shape),
+                                     std::move(triplets), options);
+}
+
+} // namespace
+
+void add_sparse_matrix(py::handle scope) {
+  py::class_<SparseMatrix>(scope, "SparseMatrix")
+      .def(py::init<size_t, size_t>(), py::arg("rows"), py::arg("columns"))
+      .def_static("from_coo", &from_coo, py::arg("shape"), py::arg("row"),
+                  py::arg("col"), py::arg("data"),
+                  py::arg("options") = &global_evaluation_options)
+      .def_static(
+          "from_scipy",
+          [](py::object matrix, PEvaluationOptions const &options) {
+            auto coo = matrix.attr("tocoo")();
+            return from_coo(coo.attr("shape").cast<std::tuple<size_t, size_t>>(),
+                            coo.attr("row"), coo.attr("col"), coo.attr("data"),
+                            options);
+          },
+          py::arg("matrix"), py::arg("options") = &global_evaluation_options)
+      .def_static("from_dense", &SparseMatrix::from_dense, py::arg("matrix"))
+
+      .def_property_readonly("shape",
+                             [](SparseMatrix const &self) {
+                               return std::make_tuple(self.rows, self.columns);
+                             })
+      .def_property_readonly("nnz", &SparseMatrix::nnz)
+
+      .def("__getitem__",
+           [](SparseMatrix const &self, std::tuple<size_t, size_t> index) {
+             auto [row, column] = check_index(self, index);
+             if (auto *value = self.find(row, column))
+               return MathStructureRef::construct(*value);
+             return MathStructureRef::construct(zero());
+           })
+      .def("__setitem__",
+           [](SparseMatrix &self, std::tuple<size_t, size_t> index,
+              MathStructureRef value) {
+             auto [row, column] = check_index(self, index);
+             self.set(row, column, std::move(value));
+           })
+
+      .def("to_coo",
+           [](SparseMatrix const &self) {
+             py::list rows, columns, values;
+             for (size_t i = 0; i < self.rows; ++i)
+               for (size_t k = self.row_offsets[i]; k < self.row_offsets[i + 1];
+                    ++k) {
+                 rows.append(i);
+                 columns.append(self.column_indices[k]);
+                 values.append(self.values[k]);
+               }
+             return py::make_tuple(rows, columns, values);
+           })
+      .def("to_dense",
+           [](SparseMatrix const &self) {
+             MathStructure result;
+             {
+               CalculatorGilRelease _gil;
+               result = self.to_dense();
+             }
+             return MathStructureRef::construct(result);
+           })
+      .def("to_numpy",
+           [](SparseMatrix const &self) {
+             py::array_t<double> result(std::vector<ssize_t>{
+                 (ssize_t)self.rows, (ssize_t)self.columns});
+             auto view = result.mutable_unchecked<2>();
+             for (size_t i = 0; i < self.rows; ++i) {
+               for (size_t j = 0; j < self.columns; ++j)
+                 view(i, j) = 0;
+               for (size_t k = self.row_offsets[i]; k < self.row_offsets[i + 1];
+                    ++k) {
+                 auto &value = *self.values[k];
+                 if (!value.isNumber() || !value.number().isReal())
+                   throw py::value_error(
+                       "only real numbers can be converted to a numpy array");
+                 view(i, self.column_indices[k]) = value.number().floatValue();
+               }
+             }
+             return result;
+           })
+
+      .def(
+          "add",
+          [](SparseMatrix const &self, SparseMatrix const &other,
+             PEvaluationOptions const &options) {
+            CalculatorGilRelease _gil;
+            return self.add(other, options);
+          },
+          py::arg("other"), py::arg("options") = &global_evaluation_options)
+      .def(
+          "__add__",
+          [](SparseMatrix const &self, SparseMatrix const &other) {
+            CalculatorGilRelease _gil;
+            return self.add(other, global_evaluation_options);
+          },
+          py::is_operator{})
+      .def(
+          "matmul",
+          [](SparseMatrix const &self, SparseMatrix const &other,
+             PEvaluationOptions const &options) {
+            CalculatorGilRelease _gil;
+            return self.multiply(other, options);
+          },
+          py::arg("other"), py::arg("options") = &global_evaluation_options)
+      .def(
+          "matmul",
+          [](SparseMatrix const &self, MathStructureVectorProxy const &other,
+             PEvaluationOptions const &options) {
+            MathStructure result;
+            {
+              CalculatorGilRelease _gil;
+              result = self.multiply_dense(other, options);
+            }
+            return MathStructureRef::construct(result);
+          },
+          py::arg("other"), py::arg("options") = &global_evaluation_options)
+      .def(
+          "__matmul__",
+          [](SparseMatrix const &self, SparseMatrix const &other) {
+            CalculatorGilRelease _gil;
+            return self.multiply(other, global_evaluation_options);
+          },
+          py::is_operator{})
+      .def(
+          "__matmul__",
+          [](SparseMatrix const &self, MathStructureVectorProxy const &other) {
+            MathStructure result;
+            {
+              CalculatorGilRelease _gil;
+              result = self.multiply_dense(other, global_evaluation_options);
+            }
+            return MathStructureRef::construct(result);
+          },
+          py::is_operator{})
+
+      .def(
+          "__repr__",
+          [](SparseMatrix const &self) {
+            return "MathStructure.SparseMatrix(shape=(" +
+                   std::to_string(self.rows) + ", " +
+                   std::to_string(self.columns) +
+                   "), nnz=" + std::to_string(self.nnz()) + ")";
+          },
+          py::is_operator{});
+}
@@ -0,0 +1,50 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <libqalculate/MathStructure.h>
+#include <vector>
+
+#include "ref.hh"
+
+// Compressed sparse row matrix of MathStructures. Missing entries are zero.
+class SparseMatrix {
+public:
+  size_t rows;
+  size_t columns;
+  // Entries of row i are at [row_offsets[i], row_offsets[i + 1]), sorted by
+  // column.
+  std::vector<size_t> row_offsets;
+  std::vector<size_t> column_indices;
+  std::vector<MathStructureRef> values;
+
+  SparseMatrix(size_t rows, size_t columns);
+
+  struct Triplet {
+    size_t row;
+    size_t column;
+    MathStructureRef value;
+  };
+
+  // Duplicate entries are summed, zeros are dropped.
+  static SparseMatrix from_triplets(size_t rows, size_t columns,
+                                    std::vector<Triplet> triplets,
+                                    EvaluationOptions const &options);
+  static SparseMatrix from_dense(MathStructure const &matrix);
+
+  size_t nnz() const { return values.size(); }
+
+  MathStructure const *find(size_t row, size_t column) const;
+  void set(size_t row, size_t column, MathStructureRef value);
+
+  MathStructure to_dense() const;
+
+  SparseMatrix add(SparseMatrix const &other,
+                   EvaluationOptions const &options) const;
+  SparseMatrix multiply(SparseMatrix const &other,
+                        EvaluationOptions const &options) const;
+  MathStructure multiply_dense(MathStructure const &other,
+                               EvaluationOptions const &options) const;
+};
+
+void add_sparse_matrix(py::handle scope);
@@ -0,0 +1,230 @@
+#include "stats.hh"
+
+#include <algorithm>
+#include <cmath>
+#include <exception>
+#include <libqalculate/qalculate.h>
+#include <limits>
+#include <map>
+
+#include <pybind11/stl.h>
+
+namespace {
+
+// A map so that references stay valid as entries are added.
+std::map<std::string, CallStats> &all_stats() {
+  static std::map<std::string, CallStats> stats;
+  return stats;
+}
+
+size_t bucket_of(double seconds) {
+  size_t bucket = 0;
+  while (bucket + 1 < CallStats::BUCKETS &&
+         seconds >= CallStats::bucket_bound(bucket))
+    ++bucket;
+  return bucket;
+}
+
+// Inputs longer than this are cut off before being passed to the hook.
+constexpr size_t MAX_INPUT_LENGTH = 256;
+
+struct SlowCallHook {
+  double threshold;
+  // At most this many calls per second, the rest are counted as suppressed.
+  size_t limit;
+  // Owned, but never released so that it is not touched after finalization.
+  PyObject *callback = nullptr;
+  std::chrono::steady_clock::time_point window_start;
+  size_t calls_in_window = 0;
+  uint64_t suppressed = 0;
+} slow_call_hook;
+
+// Set on the thread that is running the hook. Other threads may still call
+// it meanwhile, since the GIL is released while calculating.
+thread_local bool slow_call_hook_running = false;
+
+std::string describe_input(std::variant<std::monostate, std::string_view,
+                                        MathStructure const *> const &input) {
+  std::string text;
+  if (auto *expression = std::get_if<std::string_view>(&input))
+    text = *expression;
+  else if (auto *structure = std::get_if<MathStructure const *>(&input))
+    text = (*structure)->print(PrintOptions());
+  if (text.size() > MAX_INPUT_LENGTH) {
+    text.resize(MAX_INPUT_LENGTH);
+    text += "...";
+  }
+  return text;
+}
+
+void set_slow_call_hook(std::optional<double> threshold_ms, py::object callback,
+                        size_t limit) {
+  if (threshold_ms && *threshold_ms < 0)
+    throw py::value_error("threshold_ms must not be negative");
+  if (!callback.is_none() && !PyCallable_Check(callback.ptr()))
+    throw py::type_error("callback must be callable");
+
+  Py_XDECREF(slow_call_hook.callback);
+  slow_call_hook.callback = nullptr;
+  slow_call_hook_enabled = threshold_ms.has_value() && !callback.is_none();
+  if (!slow_call_hook_enabled)
+    return;
+  slow_call_hook.threshold = *threshold_ms / 1000;
+  slow_call_hook.limit = limit;
+  slow_call_hook.callback = callback.release().ptr();
+  slow_call_hook.calls_in_window = 0;
+  slow_call_hook.suppressed = 0;
+}
+
+// Whether the hook may be called now, counts the call as suppressed if not.
+bool take_hook_slot() {
+  auto now = std::chrono::steady_clock::now();
+  if (now - slow_call_hook.window_start >= std::chrono::seconds(1)) {
+    slow_call_hook.window_start = now;
+    slow_call_hook.calls_in_window = 0;
+  }
+  if (slow_call_hook.calls_in_window >= slow_call_hook.limit) {
+    ++slow_call_hook.suppressed;
+    return false;
+  }
+  ++slow_call_hook.calls_in_window;
+  return true;
+}
+
+} // namespace
+
+double CallStats::bucket_bound(size_t bucket) {
+  if (bucket + 1 >= BUCKETS)
+    return std::numeric_limits<double>::infinity();
+  return std::ldexp(1e-6, bucket);
+}
+
+CallStats &call_stats(std::string const &name) {
+  auto &stats = all_stats()[name];
+  stats.name = name;
+  return stats;
+}
+
+thread_local StatsTimer *StatsTimer::current = nullptr;
+
+StatsTimer::StatsTimer(CallStats &stats, Input input)
+    : input(input), exceptions(std::uncaught_exceptions()) {
+  // The hook is not called for calls made from within the hook.
+  bool hook = slow_call_hook_enabled && !slow_call_hook_running;
+  if (!(stats_enabled || hook) || current)
+    return;
+  this->stats = &stats;
+  record_stats = stats_enabled;
+  keep_details = hook;
+  current = this;
+  start = Clock::now();
+}
+
+StatsTimer::~StatsTimer() {
+  if (!stats)
+    return;
+  double elapsed = std::chrono::duration<double>(Clock::now() - start).count();
+  current = nullptr;
+  bool failed = std::uncaught_exceptions() > exceptions;
+
+  if (record_stats) {
+    ++stats->calls;
+    if (failed)
+      ++stats->errors;
+    else if (CALCULATOR->aborted())
+      ++stats->aborts;
+    stats->messages += messages;
+    stats->total_time += elapsed;
+    stats->max_time = std::max(stats->max_time, elapsed);
+    stats->gil_released_time += gil_released_time;
+    ++stats->histogram[bucket_of(elapsed)];
+  }
+
+  // The hook is called with the GIL held, after the call has finished. Calls
+  // that raised are left alone, the exception tells what happened already.
+  if (!keep_details || failed || !slow_call_hook_enabled ||
+      elapsed < slow_call_hook.threshold || !take_hook_slot())
+    return;
+
+  slow_call_hook_running = true;
+  // Nothing may escape a destructor, errors are reported as unraisable.
+  try {
+    SlowCall call{stats->name,
+                  std::nullopt,
+                  std::move(options),
+                  elapsed,
+                  std::move(message_details),
+                  slow_call_hook.suppressed};
+    if (!std::holds_alternative<std::monostate>(input))
+      call.input = describe_input(input);
+    slow_call_hook.suppressed = 0;
+
+    // Keep the callback alive even if the hook replaces itself.
+    auto callback = py::reinterpret_borrow<py::object>(slow_call_hook.callback);
+    callback(std::move(call));
+  } catch (py::error_already_set &error) {
+    error.discard_as_unraisable("qalculate slow call hook");
+  } catch (...) {
+    try {
+      throw;
+    } catch (std::exception const &error) {
+      PyErr_SetString(PyExc_RuntimeError, error.what());
+    } catch (...) {
+      PyErr_SetString(PyExc_RuntimeError, "unknown C++ exception");
+    }
+    PyObject *context = PyUnicode_FromString("qalculate slow call hook");
+    PyErr_WriteUnraisable(context);
+    Py_XDECREF(context);
+  }
+  slow_call_hook_running = false;
+}
+
+void add_stats(py::module_ &m) {
+  py::class_<CallStats>(m, "CallStats")
+      .def_readonly("calls", &CallStats::calls)
+      .def_readonly("errors", &CallStats::errors)
+      .def_readonly("aborts", &CallStats::aborts)
+      .def_readonly("messages", &CallStats::messages)
+      .def_readonly("total_time", &CallStats::total_time)
+      .def_readonly("max_time", &CallStats::max_time)
+      .def_readonly("gil_released_time", &CallStats::gil_released_time)
+      .def_property_readonly("histogram",
+                             [](CallStats const &self) {
+                               std::map<double, uint64_t> histogram;
+                               for (size_t i = 0; i < CallStats::BUCKETS; ++i)
+                                 histogram[CallStats::bucket_bound(i)] =
+                                     self.histogram[i];
+                               return histogram;
+                             })
+      .def("__repr__", [](CallStats const &self) {
+        return "<CallStats " + std::to_string(self.calls) + " calls, " +
+               std::to_string(self.total_time) + "s>";
+      });
+
+  m.def("stats", []() { return all_stats(); });
+  m.def("reset_stats", []() {
+    for (auto &[name, stats] : all_stats()) {
+      stats = CallStats();
+      stats.name = name;
+    }
+  });
+  m.def("get_stats_enabled", []() { return stats_enabled; });
+  m.def(
+      "set_stats_enabled", [](bool enabled) { stats_enabled = enabled; },
+      py::arg("enabled"));
+
+  py::class_<SlowCall>(m, "SlowCall")
+      .def_readonly("function", &SlowCall::function)
+      .def_readonly("input", &SlowCall::input)
+      .def_readonly("options", &SlowCall::options)
+      .def_readonly("duration", &SlowCall::duration)
+      .def_readonly("messages", &SlowCall::messages)
+      .def_readonly("suppressed", &SlowCall::suppressed)
+      .def("__repr__", [](SlowCall const &self) {
+        return "<SlowCall " + self.function + " " +
+               std::to_string(self.duration * 1000) + "ms>";
+      });
+
+  m.def("set_slow_call_hook", &set_slow_call_hook, py::arg("threshold_ms"),
+        py::arg("callback"), py::kw_only{}, py::arg("limit") = 10);
+}
@@ -0,0 +1,114 @@
+#pragma once
+
+#include "pybind.hh"
+
+#include <array>
+#include <chrono>
+#include <cstdint>
+#include <optional>
+#include <string>
+#include <string_view>
+#include <variant>
+#include <vector>
+
+#include "wrappers.hh"
+
+// Counters for the entry points that call into libqalculate, reported by
+// qalculate.stats(). They are only updated with the GIL held, the time spent
+// with the GIL released and the messages raised are collected by the
+// innermost call active on the thread and added once it returns.
+
+inline bool stats_enabled = true;
+// Set while a hook is installed with qalculate.set_slow_call_hook().
+inline bool slow_call_hook_enabled = false;
+
+struct CallStats {
+  // Latencies are counted in power of two sized buckets, starting below one
+  // microsecond. The last bucket takes everything above the others.
+  static constexpr size_t BUCKETS = 25;
+
+  std::string name;
+  uint64_t calls = 0;
+  // Calls that raised an exception and calls that returned aborted.
+  uint64_t errors = 0;
+  uint64_t aborts = 0;
+  uint64_t messages = 0;
+  double total_time = 0;
+  double max_time = 0;
+  double gil_released_time = 0;
+  std::array<uint64_t, BUCKETS> histogram{};
+
+  static double bucket_bound(size_t bucket);
+};
+
+// The counters for an entry point, created on first use and kept for the
+// lifetime of the module.
+CallStats &call_stats(std::string const &name);
+
+using CallOptions = std::variant<std::monostate, PEvaluationOptions,
+                                 ParseOptions, PrintOptions>;
+
+// What the slow call hook is called with.
+struct SlowCall {
+  std::string function;
+  std::optional<std::string> input;
+  CallOptions options;
+  double duration;
+  std::vector<CalculatorMessage> messages;
+  // Slow calls the hook was not called for since the last time it was,
+  // because of the rate limit.
+  uint64_t suppressed;
+};
+
+// Put at the top of an entry point. Calls made from within another recorded
+// call are counted as part of the outer one only.
+class StatsTimer {
+  using Clock = std::chrono::steady_clock;
+  // Structures are only printed if the call turns out to be slow.
+  using Input =
+      std::variant<std::monostate, std::string_view, MathStructure const *>;
+
+  CallStats *stats = nullptr;
+  Input input;
+  Clock::time_point start;
+  int exceptions;
+  bool record_stats = false;
+  double gil_released_time = 0;
+  uint64_t messages = 0;
+
+  // Only kept while a slow call hook is installed.
+  bool keep_details = false;
+  CallOptions options;
+  std::vector<CalculatorMessage> message_details;
+
+  static thread_local StatsTimer *current;
+
+public:
+  explicit StatsTimer(CallStats &stats, Input input = {});
+  ~StatsTimer();
+
+  StatsTimer(StatsTimer const &) = delete;
+  StatsTimer &operator=(StatsTimer const &) = delete;
+
+  // The options in effect, for the slow call hook.
+  template <typename Options> void set_options(Options const &options) {
+    if (keep_details)
+      this->options = options;
+  }
+
+  // Credit the call being recorded on this thread, if any.
+  static void add_gil_released_time(double seconds) {
+    if (current)
+      current->gil_released_time += seconds;
+  }
+  static void add_message(CalculatorMessage const &message) {
+    if (!current)
+      return;
+    ++current->messages;
+    if (current->keep_details)
+      current->message_details.push_back(message);
+  }
+  static bool recording() { return current != nullptr; }
+};
+
+void add_stats(py::module_ &m);
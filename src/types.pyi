@@ -1,4 +1,8 @@
-from collections.abc import Sequence
+import asyncio
+from collections.abc import Callable, Sequence
+import concurrent.futures
+import os
+import typing
 from typing import ClassVar, overload
 
 class Number:
@@ -17,16 +21,35 @@ class Number:
 class ExpressionItem:
     @staticmethod
     def get(name: str) -> ExpressionItem: ...
+    @staticmethod
+    def get_many(names: Sequence[str]) -> list[ExpressionItem | None]: ...
+    def __repr__(self) -> str: ...
 
 class MathFunction(ExpressionItem):
     @staticmethod
     def get(name: str) -> MathFunction: ...
+    @staticmethod
+    def get_many(names: Sequence[str]) -> list[MathFunction | None]: ...
+    @staticmethod
+    def loaded() -> typing.Iterator[MathFunction]: ...
     def calculate(self, *args: "MathStructure") -> MathStructure:
         pass
 
 class Variable(ExpressionItem):
     @staticmethod
     def get(name: str) -> Variable: ...
+    @staticmethod
+    def get_many(names: Sequence[str]) -> list[Variable | None]: ...
+    @staticmethod
+    def loaded() -> typing.Iterator[Variable]: ...
+
+class Unit(ExpressionItem):
+    @staticmethod
+    def get(name: str) -> Unit: ...
+    @staticmethod
+    def get_many(names: Sequence[str]) -> list[Unit | None]: ...
+    @staticmethod
+    def loaded() -> typing.Iterator[Unit]: ...
 
 class UnknownVariable(Variable):
     @property
@@ -54,7 +77,7 @@ class MathStructure(Sequence[MathStructure]):
         self, other: MathStructure, options: EvaluationOptions = ...
     ) -> ComparisonResult: ...
     def calculate(
-        self, options: EvaluationOptions = ..., to: str = ""
+        self, options: EvaluationOptions = ..., to: str | ConversionTarget = ""
     ) -> MathStructure: ...
     def print(self, options: PrintOptions = ...) -> str: ...
     def __eq__(self, __value: object) -> bool: ...
@@ -72,7 +95,12 @@ class MathStructure(Sequence[MathStructure]):
         def __init__(self, *args: MathStructure) -> None: ...
 
         def append(self, item: "MathStructure") -> None: ...
+        def __setitem__(self, idx: int, value: "MathStructure") -> None: ...
         def __delitem__(self, idx: int) -> None: ...
+        @property
+        def indexed(self) -> bool: ...
+        @indexed.setter
+        def indexed(self, value: bool) -> None: ...
 
     def __len__(self) -> int: ...
     @overload
@@ -80,6 +108,13 @@ class MathStructure(Sequence[MathStructure]):
     @overload
     def __getitem__(self, slice: slice) -> "MathStructure": ...
     def __repr__(self) -> str: ...
+    def write_repr(
+        self,
+        file: typing.TextIO,
+        *,
+        max_depth: int | None = None,
+        max_width: int | None = None,
+    ) -> None: ...
 
     class Multiplication(Sequence):
         pass
@@ -168,37 +203,202 @@ class MathStructure(Sequence[MathStructure]):
         def __init__(self) -> None: ...
         @overload
         def __init__(self, values: Sequence[MathStructure]) -> None: ...
+        @property
+        def rows(self) -> int: ...
+        @property
+        def columns(self) -> int: ...
+        def flatten(self) -> MathStructure.Vector: ...
+        def rank(self, ascending: bool = True) -> MathStructure.Vector: ...
+        def sort(self, ascending: bool = True) -> MathStructure.Vector: ...
+        def flip(self) -> MathStructure.Vector: ...
+        def matmul(
+            self, other: MathStructure.Vector, options: EvaluationOptions = ...
+        ) -> MathStructure: ...
+        def __matmul__(self, other: MathStructure.Vector) -> MathStructure: ...
+        def transpose(self) -> MathStructure.Vector: ...
+        def determinant(self, options: EvaluationOptions = ...) -> MathStructure: ...
+        def inverse(self, options: EvaluationOptions = ...) -> MathStructure.Vector: ...
+        def adjugate(self, options: EvaluationOptions = ...) -> MathStructure.Vector: ...
+        def solve(
+            self, b: MathStructure.Vector, options: EvaluationOptions = ...
+        ) -> MathStructure.Vector: ...
+        def add(
+            self, other: MathStructure, options: EvaluationOptions = ...
+        ) -> MathStructure.Vector: ...
+        def sub(
+            self, other: MathStructure, options: EvaluationOptions = ...
+        ) -> MathStructure.Vector: ...
+        def mul(
+            self, other: MathStructure, options: EvaluationOptions = ...
+        ) -> MathStructure.Vector: ...
+        def div(
+            self, other: MathStructure, options: EvaluationOptions = ...
+        ) -> MathStructure.Vector: ...
+        def pow(
+            self, other: MathStructure, options: EvaluationOptions = ...
+        ) -> MathStructure.Vector: ...
 
     class Division(MathStructure):
         pass
 
+    class SparseMatrix:
+        def __init__(self, rows: int, columns: int) -> None: ...
+        @staticmethod
+        def from_coo(
+            shape: tuple[int, int],
+            row: typing.Iterable[int],
+            col: typing.Iterable[int],
+            data: typing.Iterable[MathStructure],
+            options: EvaluationOptions = ...,
+        ) -> MathStructure.SparseMatrix: ...
+        @staticmethod
+        def from_scipy(
+            matrix: typing.Any, options: EvaluationOptions = ...
+        ) -> MathStructure.SparseMatrix: ...
+        @staticmethod
+        def from_dense(matrix: MathStructure.Vector) -> MathStructure.SparseMatrix: ...
+        @property
+        def shape(self) -> tuple[int, int]: ...
+        @property
+        def nnz(self) -> int: ...
+        def __getitem__(self, index: tuple[int, int]) -> MathStructure: ...
+        def __setitem__(self, index: tuple[int, int], value: MathStructure) -> None: ...
+        def to_coo(self) -> tuple[list[int], list[int], list[MathStructure]]: ...
+        def to_dense(self) -> MathStructure.Vector: ...
+        def to_numpy(self) -> typing.Any: ...
+        def add(
+            self, other: MathStructure.SparseMatrix, options: EvaluationOptions = ...
+        ) -> MathStructure.SparseMatrix: ...
+        def __add__(
+            self, other: MathStructure.SparseMatrix
+        ) -> MathStructure.SparseMatrix: ...
+        @overload
+        def matmul(
+            self, other: MathStructure.SparseMatrix, options: EvaluationOptions = ...
+        ) -> MathStructure.SparseMatrix: ...
+        @overload
+        def matmul(
+            self, other: MathStructure.Vector, options: EvaluationOptions = ...
+        ) -> MathStructure.Vector: ...
+        @overload
+        def __matmul__(
+            self, other: MathStructure.SparseMatrix
+        ) -> MathStructure.SparseMatrix: ...
+        @overload
+        def __matmul__(self, other: MathStructure.Vector) -> MathStructure.Vector: ...
+        def __repr__(self) -> str: ...
+
 def calculate(
-    expression: MathStructure | str, options: EvaluationOptions = ..., to: str = ""
+    expression: MathStructure | str, options: EvaluationOptions = ..., to: str | ConversionTarget = ""
 ) -> MathStructure: ...
 def calculate_and_print(
     expression: str,
     eval_options: EvaluationOptions = ...,
     print_options: PrintOptions = ...,
 ) -> str: ...
+def calculate_ex(
+    expression: str,
+    eval_options: EvaluationOptions = ...,
+    print_options: PrintOptions = ...,
+    to: str | ConversionTarget = "",
+) -> CalculationResult: ...
+def calculate_batch(
+    expressions: Sequence[str],
+    eval_options: EvaluationOptions = ...,
+    print_options: PrintOptions = ...,
+) -> list[CalculationResult]: ...
 def get_global_evaluation_options() -> EvaluationOptions: ...
 def get_global_parse_options() -> ParseOptions: ...
 def get_global_print_options() -> PrintOptions: ...
 def get_global_sort_options() -> SortOptions: ...
 def get_message_print_options() -> PrintOptions: ...
+def get_lazy_loading() -> bool: ...
 def get_precision() -> int: ...
+def get_repr_limits() -> tuple[int | None, int | None]: ...
 def load_global_currencies() -> None: ...
 def load_global_dataSets() -> None: ...
 def load_global_functions() -> None: ...
 def load_global_prefixes() -> None: ...
 def load_global_units() -> None: ...
 def load_global_variables() -> None: ...
+def load_snapshot(path: str | os.PathLike[str]) -> bool: ...
+def main(argv: Sequence[str] | None = None) -> int: ...
+def options(*, precision: int = ..., **overrides: typing.Any) -> OptionsContext: ...
 def parse(value: str, /, options: ParseOptions = ...) -> MathStructure: ...
+def save_snapshot(path: str | os.PathLike[str]) -> None: ...
 def set_global_evaluation_options(options: EvaluationOptions) -> None: ...
 def set_global_parse_options(options: ParseOptions) -> None: ...
 def set_global_print_options(options: PrintOptions) -> None: ...
 def set_global_sort_options(options: SortOptions) -> None: ...
+def set_lazy_loading(enabled: bool) -> None: ...
 def set_message_print_options(options: PrintOptions) -> None: ...
 def set_precision(precision: int) -> None: ...
+def target(to: str) -> ConversionTarget: ...
+def complete(
+    prefix: str,
+    *,
+    kinds: Sequence[typing.Literal["unit", "variable", "function", "prefix"]]
+    | None = None,
+    limit: int = 10,
+) -> list[Completion]: ...
+def suggest(
+    name: str,
+    *,
+    max_distance: int = 2,
+    kinds: Sequence[typing.Literal["unit", "variable", "function", "prefix"]]
+    | None = None,
+    limit: int = 10,
+) -> list[Completion]: ...
+def converter(
+    from_unit: str, to_unit: str, *, exact: bool = False
+) -> UnitConverter: ...
+def set_repr_limits(
+    max_depth: int | None = None, max_width: int | None = None
+) -> None: ...
+
+class SortOptions:
+    def freeze(self) -> FrozenSortOptions: ...
+
+class FrozenSortOptions(SortOptions):
+    def freeze(self) -> FrozenSortOptions: ...
+    def replace(self, **changes: typing.Any) -> FrozenSortOptions: ...
+    def __hash__(self) -> int: ...
+    def __eq__(self, other: object) -> bool: ...
+
+class PrintOptions:
+    def freeze(self) -> FrozenPrintOptions: ...
+
+class FrozenPrintOptions(PrintOptions):
+    def freeze(self) -> FrozenPrintOptions: ...
+    def replace(self, **changes: typing.Any) -> FrozenPrintOptions: ...
+    def __hash__(self) -> int: ...
+    def __eq__(self, other: object) -> bool: ...
+    @property
+    def sort_options(self) -> FrozenSortOptions: ...  # type: ignore[override]
+
+class ParseOptions:
+    def freeze(self) -> FrozenParseOptions: ...
+
+class FrozenParseOptions(ParseOptions):
+    def freeze(self) -> FrozenParseOptions: ...
+    def replace(self, **changes: typing.Any) -> FrozenParseOptions: ...
+    def __hash__(self) -> int: ...
+    def __eq__(self, other: object) -> bool: ...
+
+class EvaluationOptions:
+    def freeze(self) -> FrozenEvaluationOptions: ...
+
+class FrozenEvaluationOptions(EvaluationOptions):
+    def freeze(self) -> FrozenEvaluationOptions: ...
+    def replace(self, **changes: typing.Any) -> FrozenEvaluationOptions: ...
+    def __hash__(self) -> int: ...
+    def __eq__(self, other: object) -> bool: ...
+    @property
+    def parse_options(self) -> FrozenParseOptions: ...  # type: ignore[override]
+
+class OptionsContext:
+    def __enter__(self) -> OptionsContext: ...
+    def __exit__(self, *args: typing.Any) -> None: ...
 
 class Message:
     @property
@@ -207,3 +407,157 @@ class Message:
     def type(self) -> MessageType: ...
 
 def take_messages() -> list[Message]: ...
+def get_message_queue_limit() -> int | None: ...
+def set_message_queue_limit(limit: int | None) -> None: ...
+def get_messages_enabled() -> bool: ...
+def set_messages_enabled(enabled: bool) -> None: ...
+def get_dropped_messages(*, reset: bool = False) -> dict[MessageType, int]: ...
+
+class CallStats:
+    @property
+    def calls(self) -> int: ...
+    @property
+    def errors(self) -> int: ...
+    @property
+    def aborts(self) -> int: ...
+    @property
+    def messages(self) -> int: ...
+    @property
+    def total_time(self) -> float: ...
+    @property
+    def max_time(self) -> float: ...
+    @property
+    def gil_released_time(self) -> float: ...
+    @property
+    def histogram(self) -> dict[float, int]: ...
+
+def stats() -> dict[str, CallStats]: ...
+def reset_stats() -> None: ...
+def get_stats_enabled() -> bool: ...
+def set_stats_enabled(enabled: bool) -> None: ...
+
+class SlowCall:
+    @property
+    def function(self) -> str: ...
+    @property
+    def input(self) -> str | None: ...
+    @property
+    def options(self) -> EvaluationOptions | ParseOptions | PrintOptions | None: ...
+    @property
+    def duration(self) -> float: ...
+    @property
+    def messages(self) -> list[Message]: ...
+    @property
+    def suppressed(self) -> int: ...
+
+def set_slow_call_hook(
+    threshold_ms: float | None,
+    callback: Callable[[SlowCall], object] | None,
+    *,
+    limit: int = 10,
+) -> None: ...
+
+class CalculationResult:
+    @property
+    def result(self) -> MathStructure: ...
+    @property
+    def text(self) -> str: ...
+    @property
+    def messages(self) -> list[Message]: ...
+    @property
+    def parse_time(self) -> float: ...
+    @property
+    def eval_time(self) -> float: ...
+    @property
+    def print_time(self) -> float: ...
+
+class Batcher:
+    def __init__(
+        self,
+        max_batch_size: int = 64,
+        window: float = 0.001,
+        eval_options: EvaluationOptions = ...,
+        print_options: PrintOptions = ...,
+        executor: concurrent.futures.Executor | None = None,
+    ) -> None: ...
+    def submit(self, expression: str) -> asyncio.Future[CalculationResult]: ...
+    def flush(self) -> None: ...
+    @property
+    def max_batch_size(self) -> int: ...
+    @property
+    def window(self) -> float: ...
+    @property
+    def pending(self) -> int: ...
+    @property
+    def queue_depth_histogram(self) -> dict[int, int]: ...
+    @property
+    def batch_size_histogram(self) -> dict[int, int]: ...
+
+class ConversionTarget:
+    def __init__(self, to: str) -> None: ...
+    @property
+    def text(self) -> str: ...
+    @property
+    def resolved(self) -> bool: ...
+    def convert(
+        self, value: MathStructure, options: EvaluationOptions = ...
+    ) -> MathStructure: ...
+
+class UnitConverter:
+    def __init__(self, from_unit: str, to_unit: str, *, exact: bool = False) -> None: ...
+    @property
+    def from_unit(self) -> str: ...
+    @property
+    def to_unit(self) -> str: ...
+    @property
+    def exact(self) -> bool: ...
+    @property
+    def linear(self) -> bool: ...
+    @property
+    def factor(self) -> Number | None: ...
+    @property
+    def offset(self) -> Number | None: ...
+    @overload
+    def __call__(self, values: Number) -> Number: ...
+    @overload
+    def __call__(self, values: float) -> float | Number: ...
+    @overload
+    def __call__(self, values: typing.Iterable[float | Number]) -> typing.Any: ...
+
+class QuantityArray:
+    def __init__(
+        self,
+        values: typing.Iterable[float | Number],
+        unit: str | MathStructure = "",
+        *,
+        exact: bool = False,
+    ) -> None: ...
+    @property
+    def unit(self) -> MathStructure: ...
+    @property
+    def exact(self) -> bool: ...
+    @property
+    def values(self) -> list[float] | list[Number]: ...
+    def __len__(self) -> int: ...
+    def __getitem__(self, index: int) -> MathStructure: ...
+    def __array__(
+        self, dtype: typing.Any = None, copy: bool | None = None
+    ) -> typing.Any: ...
+    def to(self, target: str | ConversionTarget) -> QuantityArray: ...
+    def __add__(self, other: QuantityArray) -> QuantityArray: ...
+    def __sub__(self, other: QuantityArray) -> QuantityArray: ...
+    def __mul__(self, other: QuantityArray | Number | float) -> QuantityArray: ...
+    def __rmul__(self, other: Number | float) -> QuantityArray: ...
+    def __truediv__(self, other: QuantityArray | Number | float) -> QuantityArray: ...
+    def __rtruediv__(self, other: Number | float) -> QuantityArray: ...
+    def __neg__(self) -> QuantityArray: ...
+
+class Completion:
+    @property
+    def name(self) -> str: ...
+    @property
+    def kind(self) -> typing.Literal["unit", "variable", "function", "prefix"]: ...
+    @property
+    def item(self) -> ExpressionItem | None: ...
+    @property
+    def distance(self) -> int: ...
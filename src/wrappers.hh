@@ -6,7 +6,7 @@
 
 #include "ref.hh"
 
-class PEvaluationOptions final : public EvaluationOptions {
+class PEvaluationOptions : public EvaluationOptions {
 public:
   ~PEvaluationOptions() {
     if (isolate_var)
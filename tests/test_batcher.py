@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from qalculate import (
+    ApproximationMode,
+    Batcher,
+    CalculationResult,
+    EvaluationOptions,
+    calculate_and_print,
+    calculate_batch,
+    options,
+)
+
+
+def test_calculate_batch() -> None:
+    expressions = ["1 + 1", "2 * 3", "1/"]
+    results = calculate_batch(expressions)
+    assert [result.text for result in results[:2]] == ["2", "6"]
+    assert results[2].messages
+
+
+def test_batcher_coalesces() -> None:
+    batcher = Batcher(max_batch_size=4, window=0.05)
+    expressions = [f"{i} + 1" for i in range(10)]
+
+    async def run() -> list[str]:
+        results = await asyncio.gather(*map(batcher.submit, expressions))
+        return [result.text for result in results]
+
+    assert asyncio.run(run()) == [calculate_and_print(e) for e in expressions]
+    assert batcher.pending == 0
+    sizes = batcher.batch_size_histogram
+    assert sum(bound * count for bound, count in sizes.items()) >= len(expressions)
+    assert sizes.get(4, 0) >= 1
+    assert sum(batcher.queue_depth_histogram.values()) == len(expressions)
+
+
+def test_batcher_window() -> None:
+    batcher = Batcher(max_batch_size=1000, window=0.01)
+
+    async def run() -> str:
+        return (await batcher.submit("3 * 3")).text
+
+    assert asyncio.run(run()) == "9"
+    assert batcher.batch_size_histogram == {1: 1}
+
+
+def test_batcher_options_context() -> None:
+    batcher = Batcher(window=0.05)
+    approximate = EvaluationOptions(approximation=ApproximationMode.APPROXIMATE)
+
+    async def submit_approximate() -> CalculationResult:
+        with options(approximation=ApproximationMode.APPROXIMATE):
+            return await batcher.submit("sqrt(2)")
+
+    async def run() -> list[str]:
+        results = await asyncio.gather(
+            batcher.submit("sqrt(2)"), submit_approximate(), batcher.submit("sqrt(2)")
+        )
+        return [result.text for result in results]
+
+    exact = calculate_and_print("sqrt(2)")
+    assert exact != calculate_and_print("sqrt(2)", approximate)
+    assert asyncio.run(run()) == [
+        exact,
+        calculate_and_print("sqrt(2)", approximate),
+        exact,
+    ]
+    # Expressions submitted under different options are not batched together.
+    assert batcher.batch_size_histogram == {1: 1, 2: 1}
+
+
+def test_batcher_explicit_options_win() -> None:
+    exact = EvaluationOptions(approximation=ApproximationMode.EXACT)
+    batcher = Batcher(eval_options=exact)
+
+    async def run() -> str:
+        with options(approximation=ApproximationMode.APPROXIMATE):
+            return (await batcher.submit("sqrt(2)")).text
+
+    assert asyncio.run(run()) == calculate_and_print("sqrt(2)", exact)
+
+
+def test_batcher_arguments() -> None:
+    with pytest.raises(ValueError):
+        Batcher(max_batch_size=0)
+    with pytest.raises(ValueError):
+        Batcher(window=-1)
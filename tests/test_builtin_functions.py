@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import qalculate
+from qalculate import MathFunction, load_global_functions
+
+load_global_functions()
+
+
+def test_instance_has_builtin_class() -> None:
+    # Looked up before the class is accessed through the module.
+    function = MathFunction.get("sin")
+    assert isinstance(function, qalculate.SinFunction)
+    assert issubclass(qalculate.SinFunction, MathFunction)
+
+
+def test_listed_in_dir() -> None:
+    assert "CosFunction" in dir(qalculate)
+
+
+def test_unknown_attribute() -> None:
+    with pytest.raises(AttributeError):
+        qalculate.NotAFunction
+
+
+def test_instance_through_expression_item() -> None:
+    # In a fresh interpreter, so that SinFunction cannot have been registered
+    # by another test.
+    source = """
+import qalculate
+qalculate.load_global_functions()
+item = qalculate.ExpressionItem.get("sin")
+assert isinstance(item, qalculate.MathFunction), type(item)
+assert isinstance(item, qalculate.SinFunction), type(item)
+"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", source], env=env, check=True)
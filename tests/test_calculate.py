@@ -0,0 +1,103 @@
+import threading
+
+from qalculate import (
+    MathStructure as S,
+    calculate_and_print,
+    calculate_ex,
+    get_dropped_messages,
+    get_message_queue_limit,
+    get_messages_enabled,
+    set_message_queue_limit,
+    set_messages_enabled,
+    take_messages,
+)
+
+
+def test_calculate_ex() -> None:
+    result = calculate_ex("2 + 3")
+    assert result.result == S.Number(5)
+    assert result.text == calculate_and_print("2 + 3")
+    for time in (result.parse_time, result.eval_time, result.print_time):
+        assert time >= 0
+
+
+def test_calculate_ex_messages_are_per_call() -> None:
+    take_messages()
+    result = calculate_ex("1/")
+    assert result.messages
+    assert take_messages() == []
+
+
+def test_calculate_ex_messages_in_threads() -> None:
+    # One thread only raises messages, the other never does.
+    failures: list[str] = []
+
+    def run(expression: str, expect_messages: bool) -> None:
+        for _ in range(200):
+            result = calculate_ex(expression)
+            if bool(result.messages) != expect_messages:
+                failures.append(f"{expression}: {result.messages}")
+
+    threads = [
+        threading.Thread(target=run, args=("1/", True)),
+        threading.Thread(target=run, args=("factorial(300) mod 7", False)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert failures == []
+
+
+def test_calculate_ex_messages_with_messages_disabled() -> None:
+    # Disabled messages use the same temporary message stack as calculate_ex.
+    failures: list[str] = []
+    stop = threading.Event()
+
+    def disabled() -> None:
+        while not stop.is_set():
+            calculate_and_print("1/")
+
+    set_messages_enabled(False)
+    thread = threading.Thread(target=disabled)
+    thread.start()
+    try:
+        for _ in range(200):
+            for expression, expect_messages in [("1/", True), ("1 + 1", False)]:
+                result = calculate_ex(expression)
+                if bool(result.messages) != expect_messages:
+                    failures.append(f"{expression}: {result.messages}")
+    finally:
+        stop.set()
+        thread.join()
+        set_messages_enabled(True)
+    assert failures == []
+
+
+def test_message_queue_limit() -> None:
+    take_messages()
+    get_dropped_messages(reset=True)
+    set_message_queue_limit(2)
+    try:
+        assert get_message_queue_limit() == 2
+        for _ in range(5):
+            calculate_and_print("1/")
+        assert len(take_messages()) <= 2
+        assert sum(get_dropped_messages().values()) > 0
+    finally:
+        set_message_queue_limit(None)
+    assert get_message_queue_limit() is None
+
+
+def test_messages_disabled() -> None:
+    take_messages()
+    get_dropped_messages(reset=True)
+    set_messages_enabled(False)
+    try:
+        assert not get_messages_enabled()
+        calculate_and_print("1/")
+        assert take_messages() == []
+        assert sum(get_dropped_messages(reset=True).values()) > 0
+        assert get_dropped_messages() == {}
+    finally:
+        set_messages_enabled(True)
@@ -0,0 +1,87 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from qalculate import calculate_and_print, get_precision, main
+
+EXPRESSIONS = ["1 + 1", "", "2 ^ 10", "sqrt(16)"]
+
+
+@pytest.fixture
+def input_file(tmp_path: Path) -> Path:
+    path = tmp_path / "input.txt"
+    path.write_text("\n".join(EXPRESSIONS) + "\n")
+    return path
+
+
+@pytest.mark.parametrize("workers", ["0", "2"])
+def test_batch_text(input_file: Path, tmp_path: Path, workers: str) -> None:
+    output = tmp_path / "output.txt"
+    assert (
+        main(["--batch", "-q", "-j", workers, "-o", str(output), str(input_file)]) == 0
+    )
+    expected = [calculate_and_print(e) for e in EXPRESSIONS if e]
+    assert output.read_text().splitlines() == expected
+
+
+def test_batch_jsonl(input_file: Path, tmp_path: Path) -> None:
+    output = tmp_path / "output.jsonl"
+    assert (
+        main(["-bq", "-j", "2", "-f", "jsonl", "-o", str(output), str(input_file)]) == 0
+    )
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [record["line"] for record in records] == [1, 3, 4]
+    assert records[1]["expression"] == "2 ^ 10"
+    assert records[1]["result"] == calculate_and_print("2 ^ 10")
+
+
+def test_batch_csv_errors(tmp_path: Path) -> None:
+    path = tmp_path / "input.txt"
+    path.write_text("1 + 1\n1/\n")
+    output = tmp_path / "output.csv"
+    assert main(["-bq", "-j", "0", "-f", "csv", "-o", str(output), str(path)]) == 1
+    with output.open(newline="") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["line"] for row in rows] == ["1", "2"]
+    assert rows[0]["error"] == ""
+    assert rows[1]["error"] != ""
+
+
+def test_summary(
+    input_file: Path, tmp_path: Path, capfd: pytest.CaptureFixture[str]
+) -> None:
+    main(["--batch", "-j", "0", "-o", str(tmp_path / "output.txt"), str(input_file)])
+    assert "3 expressions" in capfd.readouterr().err
+
+
+def test_expressions(capfd: pytest.CaptureFixture[str]) -> None:
+    assert main(["1 + 1"]) == 0
+    assert capfd.readouterr().out == calculate_and_print("1 + 1") + "\n"
+
+
+def test_precision(capfd: pytest.CaptureFixture[str]) -> None:
+    previous = get_precision()
+    assert main(["-p", "30", "1/3.0"]) == 0
+    assert len(capfd.readouterr().out) > 25
+    assert get_precision() == previous
+
+
+def test_lazy_loading() -> None:
+    source = """
+        import qalculate
+        qalculate.set_lazy_loading(True)
+        assert qalculate.main(["1 + 1"]) == 0
+        assert "mi" not in {unit.name for unit in qalculate.Unit.loaded()}
+        """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", textwrap.dedent(source)], env=env, check=True)
+
+
+def test_missing_file(tmp_path: Path) -> None:
+    assert main(["--batch", str(tmp_path / "missing.txt")]) == 2
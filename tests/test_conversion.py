@@ -0,0 +1,80 @@
+import pytest
+
+from qalculate import (
+    ConversionTarget,
+    Number,
+    calculate,
+    calculate_ex,
+    converter,
+    load_global_prefixes,
+    load_global_units,
+    target,
+)
+
+load_global_prefixes()
+load_global_units()
+
+
+def test_target_matches_string() -> None:
+    speed = target("km/h")
+    assert speed.resolved
+    assert speed.text == "km/h"
+    for expression in ["10 m/s", "3 mi/h", "1 c"]:
+        assert calculate(expression, to=speed) == calculate(expression, to="km/h")
+
+
+def test_target_accepted_everywhere() -> None:
+    meters = target("m")
+    assert calculate("5 ft", to=meters) == calculate("5 ft", to="m")
+    assert calculate_ex("5 ft", to=meters).text == calculate_ex("5 ft", to="m").text
+    value = calculate("5 ft")
+    assert meters.convert(value) == calculate("5 ft", to="m")
+
+
+def test_unresolved_target() -> None:
+    hexadecimal = ConversionTarget("hex")
+    assert not hexadecimal.resolved
+    assert calculate("255", to=hexadecimal) == calculate("255", to="hex")
+
+
+def test_optimal_target() -> None:
+    optimal = target("optimal")
+    first = calculate("1 kg * 1 m^2 / s^2", to=optimal)
+    second = calculate("3 kg * 1 m^2 / s^2", to=optimal)
+    assert first.print() == "1 J"
+    assert second.print() == "3 J"
+
+
+def test_converter_linear() -> None:
+    miles = converter("mi", "km")
+    assert miles.linear
+    assert miles.factor == Number(1609344) / Number(1000000)
+    assert miles.offset == Number(0)
+    assert miles(1) == pytest.approx(1.609344)
+    assert miles([1, 2.5]) == pytest.approx([1.609344, 4.02336])
+
+
+def test_converter_affine() -> None:
+    celsius = converter("°C", "°F")
+    assert celsius.linear
+    assert celsius(100) == pytest.approx(212)
+    assert celsius(-40.0) == pytest.approx(-40)
+
+
+def test_converter_exact() -> None:
+    feet = converter("ft", "m", exact=True)
+    assert feet(10) == Number(3048) / Number(1000)
+    assert feet([1, 2]) == [Number(3048) / Number(10000), Number(6096) / Number(10000)]
+
+
+def test_converter_numpy() -> None:
+    np = pytest.importorskip("numpy")
+    meters = converter("m", "cm")
+    result = meters(np.array([[1.0, 2.0], [3.0, 4.0]]))
+    assert result.shape == (2, 2)
+    assert result.tolist() == pytest.approx([[100, 200], [300, 400]])
+
+
+def test_converter_errors() -> None:
+    with pytest.raises(ValueError):
+        converter("m", "s")
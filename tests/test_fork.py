@@ -0,0 +1,52 @@
+from qalculate import calculate, calculate_and_print, take_messages, MathStructure as S
+import os
+import threading
+import pytest
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+
+
+def run_in_child(function) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if function() else 1)
+        except BaseException:
+            os._exit(2)
+    _, status = os.waitpid(pid, 0)
+    return os.waitstatus_to_exitcode(status)
+
+
+def test_calculate_in_child() -> None:
+    # Fork after the calculator has already done some work.
+    calculate_and_print("1 + 1")
+    assert run_in_child(lambda: calculate("2 * 3") == S.Number(6)) == 0
+    assert calculate("2 * 3") == S.Number(6)
+
+
+def test_messages_not_inherited() -> None:
+    take_messages()
+    calculate_and_print("1/")
+    assert run_in_child(lambda: take_messages() == []) == 0
+
+
+def test_fork_during_calculation() -> None:
+    expected = calculate_and_print("factorial(3000) mod 1000003")
+    results: list[str] = []
+
+    def work() -> None:
+        for _ in range(20):
+            results.append(calculate_and_print("factorial(3000) mod 1000003"))
+
+    def child() -> bool:
+        return calculate("2 * 3") == S.Number(6)
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    # os.fork() rather than subprocess, which may not run the fork handlers.
+    exit_codes = {run_in_child(child)}
+    while thread.is_alive():
+        exit_codes.add(run_in_child(child))
+    thread.join()
+    assert exit_codes == {0}
+    assert results == [expected] * 20
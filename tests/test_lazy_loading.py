@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+
+# Definitions loaded by other tests cannot be unloaded, so every check runs
+# in a fresh interpreter.
+def run(source: str) -> None:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(source)], env=env, check=True
+    )
+
+
+def test_get() -> None:
+    run(
+        """
+        import qalculate
+        qalculate.set_lazy_loading(True)
+        assert qalculate.get_lazy_loading()
+        assert qalculate.Unit.get("meter").name == "m"
+        """
+    )
+
+
+def test_parse() -> None:
+    run(
+        """
+        import qalculate
+        from qalculate import MathStructure as S
+        qalculate.set_lazy_loading(True)
+        # Only defined in units.xml, unlike builtins such as "pi".
+        names = lambda: {unit.name for unit in qalculate.Unit.loaded()}
+        assert "mi" not in names()
+        assert qalculate.parse("mi") == S.Unit(qalculate.Unit.get("mi"))
+        assert "mi" in names()
+        assert isinstance(qalculate.parse("10km"), S.Multiplication)
+        """
+    )
+
+
+def test_variable_with_units() -> None:
+    run(
+        """
+        import qalculate
+        qalculate.set_lazy_loading(True)
+        # Its definition refers to units, which have to be loaded first.
+        text = qalculate.calculate_and_print("speed_of_light")
+        assert text.startswith("299792458") and "m/s" in text, text
+        """
+    )
+
+
+def test_disabled() -> None:
+    run(
+        """
+        import qalculate
+        try:
+            qalculate.Unit.get("meter")
+        except KeyError:
+            pass
+        else:
+            raise AssertionError("units were loaded")
+        """
+    )
@@ -1,3 +1,4 @@
+import io
 from typing import Callable
 import pytest
 from qalculate import (
@@ -118,3 +119,63 @@ def test_slicing(slice: slice) -> None:
     ints = [*range(100)]
     structures = S(ints)
     assert ints[slice] == list(map(int, structures[slice]))
+
+
+def test_repr_limits() -> None:
+    structure = S([*range(10)])
+    assert repr(structure).count("MathStructure.Number") == 10
+
+    out = io.StringIO()
+    structure.write_repr(out, max_width=3)
+    assert out.getvalue() == (
+        "MathStructure.Vector([MathStructure.Number(0), "
+        "MathStructure.Number(1), MathStructure.Number(2), ...])"
+    )
+
+    out = io.StringIO()
+    S([[1], [2]]).write_repr(out, max_depth=1)
+    assert out.getvalue() == "MathStructure.Vector([..., ...])"
+
+
+def test_write_repr_matches_repr() -> None:
+    structure = S([[*range(2000)] for _ in range(20)])
+    out = io.StringIO()
+    structure.write_repr(out)
+    assert out.getvalue() == repr(structure)
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_sequence_membership(indexed: bool) -> None:
+    structure = S([*range(50), 7, 7.5])
+    structure.indexed = indexed
+    assert structure.indexed == indexed
+
+    assert 7 in structure
+    assert 7.5 in structure
+    assert 100 not in structure
+    assert structure.count(7) == 2
+    assert structure.index(7) == 7
+
+    structure.append(100)
+    assert 100 in structure
+    assert structure.index(100) == 52
+
+    del structure[7]
+    assert structure.count(7) == 1
+    assert structure.index(7) == 50
+
+    structure[0] = 7
+    assert structure.index(7) == 0
+    with pytest.raises(ValueError):
+        structure.index(1000)
+
+
+def test_flip_leaves_indexed_vector_alone() -> None:
+    structure = S([1, 2, 3])
+    structure.indexed = True
+    assert structure.index(1) == 0
+
+    flipped = structure.flip()
+    assert [int(x) for x in flipped] == [3, 2, 1]
+    assert [int(x) for x in structure] == [1, 2, 3]
+    assert structure.index(1) == 0
@@ -0,0 +1,114 @@
+import pytest
+from qalculate import (
+    ApproximationMode,
+    EvaluationOptions,
+    MathStructure as S,
+    calculate,
+    get_precision,
+    set_precision,
+)
+
+
+def as_ints(matrix: S) -> list[list[int]]:
+    return [[int(x) for x in row] for row in matrix]
+
+
+def as_floats(matrix: S) -> list[list[float]]:
+    return [[float(x) for x in row] for row in matrix]
+
+
+def test_exact_matmul() -> None:
+    a = S([[1, 2], [3, 4]])
+    b = S([[5, 6], [7, 8]])
+    assert as_ints(a @ b) == [[19, 22], [43, 50]]
+    assert as_ints(a.matmul(b)) == [[19, 22], [43, 50]]
+    assert [int(x) for x in a @ S([1, 1])] == [3, 7]
+
+
+def test_matmul_dimension_mismatch() -> None:
+    with pytest.raises(ValueError):
+        S([[1, 2, 3]]) @ S([[1, 2, 3]])
+
+
+def test_float_matmul() -> None:
+    a = S([[1.5, 2.0], [3.0, 4.0]])
+    b = S([[2.0, 0.0], [0.0, 2.0]])
+    assert as_floats(a @ b) == [[3.0, 4.0], [6.0, 8.0]]
+
+
+def test_transpose() -> None:
+    assert as_ints(S([[1, 2, 3], [4, 5, 6]]).transpose()) == [[1, 4], [2, 5], [3, 6]]
+
+
+@pytest.mark.parametrize(
+    "matrix", [S([[1, 2], [3, 4]]), S([[1.0, 2], [3, 4]]), S([[1.0, 2.0], [3.0, 4.0]])]
+)
+def test_determinant(matrix: S) -> None:
+    assert float(matrix.determinant().calculate()) == pytest.approx(-2)
+
+
+def test_high_precision_skips_doubles() -> None:
+    previous = get_precision()
+    set_precision(50)
+    try:
+        inverse = S([[3.0, 0.0], [0.0, 1.0]]).inverse()
+        digits = inverse[0][0].print()
+    finally:
+        set_precision(previous)
+    # A double would only give about 16 significant digits.
+    assert digits.count("3") > 40
+
+
+def test_vector_dot_product() -> None:
+    assert S([1, 2, 3]) @ S([4, 5, 6]) == S.Number(32)
+    assert float(S([1.0, 2.0]) @ S([3.0, 4.0])) == 11.0
+
+
+def test_inverse() -> None:
+    inverse = S([[2, 0], [0, 4]]).inverse()
+    assert S([[2, 0], [0, 4]]) @ inverse == S([[1, 0], [0, 1]])
+    assert as_floats(S([[2.0, 0.0], [0.0, 4.0]]).inverse()) == [[0.5, 0], [0, 0.25]]
+
+
+def test_singular() -> None:
+    with pytest.raises(ValueError):
+        S([[1.0, 2.0], [2.0, 4.0]]).inverse()
+    with pytest.raises(ValueError):
+        S([[1.0, 2.0], [2.0, 4.0]]).solve(S([1.0, 1.0]))
+
+
+def test_adjugate() -> None:
+    assert as_ints(S([[1, 2], [3, 4]]).adjugate()) == [[4, -2], [-3, 1]]
+
+
+def test_solve() -> None:
+    assert [int(x) for x in S([[2, 0], [0, 4]]).solve(S([4, 8]))] == [2, 2]
+    assert [float(x) for x in S([[2.0, 0.0], [0.0, 4.0]]).solve(S([4.0, 8.0]))] == [
+        2.0,
+        2.0,
+    ]
+
+
+def test_elementwise() -> None:
+    a = S([1, 2, 3])
+    assert [int(x) for x in a.add(S([10, 20, 30]))] == [11, 22, 33]
+    assert [int(x) for x in a.sub(1)] == [0, 1, 2]
+    assert [int(x) for x in a.mul(S([2]))] == [2, 4, 6]
+    assert [int(x) for x in a.pow(2)] == [1, 4, 9]
+    assert a.div(2) == S([S.Number(1) / 2, 1, S.Number(3) / 2]).calculate()
+
+
+def test_elementwise_broadcasting() -> None:
+    matrix = S([[1, 2], [3, 4]])
+    assert as_ints(matrix.add(S([10, 20]))) == [[11, 22], [13, 24]]
+    assert as_ints(matrix.mul(matrix)) == [[1, 4], [9, 16]]
+    with pytest.raises(ValueError):
+        matrix.add(S([1, 2, 3]))
+
+
+def test_elementwise_exact() -> None:
+    exact = EvaluationOptions(approximation=ApproximationMode.EXACT)
+    root = S([2]).pow(S.Number(1) / 2, exact)
+    # Number arithmetic would approximate the square root.
+    assert not isinstance(root[0], S.Number)
+    assert root[0] == calculate("2^(1/2)", exact)
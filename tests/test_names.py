@@ -0,0 +1,58 @@
+import pytest
+
+from qalculate import (
+    Unit,
+    Variable,
+    complete,
+    load_global_prefixes,
+    load_global_units,
+    load_global_variables,
+    suggest,
+)
+
+load_global_prefixes()
+load_global_units()
+load_global_variables()
+
+
+def test_complete() -> None:
+    completions = complete("met", limit=50)
+    assert completions
+    assert all(c.name.lower().startswith("met") for c in completions)
+    assert any(c.item is Unit.get("meter") for c in completions)
+
+
+def test_complete_kinds() -> None:
+    completions = complete("p", kinds=["variable"], limit=1000)
+    assert {c.kind for c in completions} == {"variable"}
+    assert any(c.item is Variable.get("pi") for c in completions)
+
+    prefixes = complete("kil", kinds=["prefix"])
+    assert [c.name for c in prefixes] == ["kilo"]
+    assert prefixes[0].item is None
+
+
+def test_complete_limit() -> None:
+    assert len(complete("", limit=5)) == 5
+
+
+def test_suggest() -> None:
+    suggestions = suggest("metre", max_distance=0)
+    assert [s.name for s in suggestions] == ["metre"]
+
+    suggestions = suggest("meetr", kinds=["unit"])
+    assert suggestions
+    assert suggestions[0].distance > 0
+    assert any(s.item is Unit.get("meter") for s in suggestions)
+    assert all(s.distance <= 2 for s in suggestions)
+
+
+@pytest.mark.parametrize("typo,name", [("secnod", "second"), ("mteer", "meter")])
+def test_suggest_transposition(typo: str, name: str) -> None:
+    suggestions = suggest(typo, max_distance=1, kinds=["unit"])
+    assert any(s.name == name and s.distance == 1 for s in suggestions)
+
+
+def test_unknown_kind() -> None:
+    with pytest.raises(ValueError):
+        complete("m", kinds=["planet"])
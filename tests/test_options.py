@@ -0,0 +1,143 @@
+import asyncio
+import threading
+from unittest import mock
+from qalculate import (
+    ApproximationMode,
+    EvaluationOptions,
+    FrozenEvaluationOptions,
+    PrintOptions,
+    calculate,
+    calculate_and_print,
+    get_precision,
+    options,
+    parse,
+    MathStructure as S,
+)
+import pytest
+
+
+def test_freeze() -> None:
+    options = EvaluationOptions(approximation=ApproximationMode.EXACT)
+    frozen = options.freeze()
+    assert isinstance(frozen, FrozenEvaluationOptions)
+    assert frozen.approximation == ApproximationMode.EXACT
+    assert frozen.freeze() is frozen
+    with pytest.raises(AttributeError):
+        frozen.approximation = ApproximationMode.APPROXIMATE  # type: ignore
+
+
+def test_nested_options_frozen() -> None:
+    frozen = EvaluationOptions().freeze()
+    with pytest.raises(AttributeError):
+        frozen.parse_options.base = 2  # type: ignore
+
+
+def test_hash_and_equality() -> None:
+    a = PrintOptions(base=16).freeze()
+    b = PrintOptions(base=16).freeze()
+    c = PrintOptions(base=2).freeze()
+    assert a == b and hash(a) == hash(b)
+    assert a != c
+    assert len({a, b, c}) == 2
+
+
+def test_frozen_not_equal_to_mutable() -> None:
+    options = PrintOptions(base=16)
+    assert options.freeze() != options
+    assert options != options.freeze()
+    assert options.freeze() != 16
+    assert options.freeze() == mock.ANY
+
+
+def test_replace() -> None:
+    frozen = PrintOptions(base=16).freeze()
+    changed = frozen.replace(base=8)
+    assert changed.base == 8
+    assert frozen.base == 16
+    assert changed == PrintOptions(base=8).freeze()
+
+
+def test_frozen_accepted_by_entry_points() -> None:
+    options = EvaluationOptions(approximation=ApproximationMode.EXACT).freeze()
+    assert calculate("1 + 1", options) == S.Number(2)
+
+
+approximate = EvaluationOptions(approximation=ApproximationMode.APPROXIMATE)
+
+
+def test_options_context() -> None:
+    before = calculate_and_print("1/3")
+    with options(approximation=ApproximationMode.EXACT):
+        assert calculate_and_print("1/3") == calculate_and_print(
+            "1/3", EvaluationOptions(approximation=ApproximationMode.EXACT)
+        )
+        with options(precision=50):
+            assert len(calculate_and_print("1/3", approximate, PrintOptions())) > 40
+            # Outer overrides stay in effect.
+            assert calculate_and_print("1/3") == calculate_and_print(
+                "1/3", EvaluationOptions(approximation=ApproximationMode.EXACT)
+            )
+    assert calculate_and_print("1/3") == before
+    assert get_precision() != 50
+
+
+def test_options_context_explicit_options_win() -> None:
+    explicit = EvaluationOptions(approximation=ApproximationMode.APPROXIMATE)
+    with options(approximation=ApproximationMode.EXACT):
+        assert calculate_and_print("1/3", explicit) == calculate_and_print(
+            "1/3", EvaluationOptions(approximation=ApproximationMode.APPROXIMATE)
+        )
+
+
+def test_options_context_unknown() -> None:
+    with pytest.raises(TypeError):
+        options(not_an_option=1)
+
+
+def test_options_context_per_task() -> None:
+    async def run(precision: int) -> int:
+        with options(precision=precision):
+            await asyncio.sleep(0)
+            return len(calculate_and_print("1/3", approximate, PrintOptions()))
+
+    async def main() -> list[int]:
+        return await asyncio.gather(run(10), run(40))
+
+    short, long = asyncio.run(main())
+    assert short < long
+
+
+def test_options_context_ambiguous() -> None:
+    # base is both a print and a parse option.
+    with pytest.raises(TypeError):
+        options(base=16)
+
+
+def test_precision_override_calculate() -> None:
+    with options(precision=50):
+        result = calculate("1/3", approximate)
+        assert len(result.print(PrintOptions())) > 40
+        structure = calculate(parse("1/3"), approximate)
+        assert len(structure.print(PrintOptions())) > 40
+    assert get_precision() != 50
+
+
+def test_precision_override_not_seen_by_other_threads() -> None:
+    expected = calculate_and_print("1/3", approximate, PrintOptions())
+    stop = threading.Event()
+    seen: set[str] = set()
+
+    def plain() -> None:
+        while not stop.is_set():
+            seen.add(calculate_and_print("1/3", approximate, PrintOptions()))
+
+    thread = threading.Thread(target=plain)
+    thread.start()
+    try:
+        for _ in range(200):
+            with options(precision=50):
+                calculate_and_print("1/3", approximate, PrintOptions())
+    finally:
+        stop.set()
+        thread.join()
+    assert seen == {expected}
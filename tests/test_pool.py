@@ -0,0 +1,67 @@
+from qalculate import calculate_and_print
+from qalculate.pool import ProcessPool
+import pytest
+
+
+@pytest.fixture(scope="module")
+def pool():
+    with ProcessPool(workers=2) as pool:
+        yield pool
+
+
+def test_results_in_order(pool: ProcessPool) -> None:
+    expressions = [f"{i} * 3 + 1" for i in range(200)]
+    assert pool.calculate_and_print(expressions) == [
+        calculate_and_print(expression) for expression in expressions
+    ]
+
+
+def test_empty_batch(pool: ProcessPool) -> None:
+    assert pool.calculate_and_print([]) == []
+
+
+def test_messages(pool: ProcessPool) -> None:
+    [(_, messages)] = pool.calculate_and_print(["1/"], messages=True)
+    assert messages
+
+
+def test_closed() -> None:
+    pool = ProcessPool(workers=1)
+    pool.close()
+    assert pool.closed
+    with pytest.raises(RuntimeError):
+        pool.calculate_and_print(["1"])
+
+
+def test_unknown_preload() -> None:
+    with pytest.raises(ValueError):
+        ProcessPool(workers=1, preload=["nonsense"])
+
+
+def test_adaptive_chunks(pool: ProcessPool) -> None:
+    # More expressions than fit in a single chunk, sent again once the pool
+    # has measured how long they take.
+    expressions = [f"{i} + 1" for i in range(3000)]
+    expected = [str(i + 1) for i in range(3000)]
+    assert pool.calculate_and_print(expressions) == expected
+    assert pool.calculate_and_print(expressions) == expected
+
+
+def test_timeout_recovers() -> None:
+    never_finishes = "sum(sin(x), 1, 10^15)"
+    with ProcessPool(workers=1, timeout=0.2) as pool:
+        # Warm up so that the batch below goes out as a single chunk and the
+        # expressions after the slow one have to be sent again.
+        pool.calculate_and_print([f"{i}" for i in range(200)])
+        expressions = [f"{i} * 2" for i in range(20)]
+        expressions[5] = never_finishes
+        results = pool.calculate_and_print(expressions, messages=True)
+
+        text, messages = results.pop(5)
+        assert "timed out" in text or any(
+            "timed out" in message.text for message in messages
+        )
+        assert [text for text, _ in results] == [
+            str(i * 2) for i in range(20) if i != 5
+        ]
+        assert pool.calculate_and_print(["1 + 1"]) == ["2"]
@@ -0,0 +1,80 @@
+import pytest
+
+from qalculate import (
+    Number,
+    QuantityArray,
+    calculate,
+    load_global_prefixes,
+    load_global_units,
+    parse,
+    target,
+)
+
+load_global_prefixes()
+load_global_units()
+
+
+def test_construction() -> None:
+    distances = QuantityArray([1, 2.5, 4], "m")
+    assert len(distances) == 3
+    assert distances.values == [1, 2.5, 4]
+    assert distances.unit == parse("m")
+    assert distances[-1] == calculate("4 m")
+
+
+def test_coefficient_moves_into_values() -> None:
+    distances = QuantityArray([1, 2], "10 m")
+    assert distances.values == [10, 20]
+    assert distances.unit == parse("m")
+
+
+def test_to() -> None:
+    distances = QuantityArray([1, 2], "km").to("m")
+    assert distances.values == pytest.approx([1000, 2000])
+    assert distances.unit == parse("m")
+
+
+def test_to_target() -> None:
+    speed = target("km/h")
+    for _ in range(2):
+        speeds = QuantityArray([1, 2], "m/s").to(speed)
+        assert speeds.values == pytest.approx([3.6, 7.2])
+        assert speeds.unit == QuantityArray([1], "km/h").unit
+
+
+def test_arithmetic() -> None:
+    distances = QuantityArray([10, 20], "m")
+    times = QuantityArray([2, 4], "s")
+    speeds = distances / times
+    assert speeds.values == pytest.approx([5, 5])
+    assert speeds[0] == calculate("5 m/s")
+
+    total = distances + QuantityArray([1, 2], "km")
+    assert total.values == pytest.approx([1010, 2020])
+    assert total.unit == parse("m")
+
+    assert (2 * distances).values == pytest.approx([20, 40])
+    assert (-distances).values == pytest.approx([-10, -20])
+    assert (distances * distances).unit == calculate("m^2")
+
+
+def test_exact() -> None:
+    lengths = QuantityArray([1, 3], "ft", exact=True).to("m")
+    assert lengths.exact
+    assert lengths.values == [
+        Number(3048) / Number(10000),
+        Number(9144) / Number(10000),
+    ]
+
+
+def test_incompatible() -> None:
+    with pytest.raises(ValueError):
+        QuantityArray([1], "m") + QuantityArray([1], "s")
+    with pytest.raises(ValueError):
+        QuantityArray([1, 2], "m") * QuantityArray([1, 2, 3], "m")
+
+
+def test_numpy() -> None:
+    np = pytest.importorskip("numpy")
+    distances = QuantityArray(np.arange(3.0), "m")
+    assert np.asarray(distances.to("cm")).tolist() == pytest.approx([0, 100, 200])
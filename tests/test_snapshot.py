@@ -0,0 +1,64 @@
+from pathlib import Path
+from qalculate import load_global_units, load_snapshot, save_snapshot
+import os
+import pytest
+import subprocess
+import sys
+import textwrap
+
+load_global_units()
+
+
+# Groups that are already loaded are skipped by load_snapshot, so it has to be
+# tested in a fresh interpreter.
+def run(source: str, *args: str) -> None:
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(source), *args], env=env, check=True
+    )
+
+
+def test_roundtrip(tmp_path: Path) -> None:
+    path = tmp_path / "definitions.snapshot"
+    save_snapshot(path)
+    assert path.stat().st_size > 0
+    run(
+        """
+        import sys
+        import qalculate
+        assert qalculate.load_snapshot(sys.argv[1])
+        assert qalculate.Unit.get("meter").name == "m"
+        """,
+        str(path),
+    )
+
+
+def test_truncated(tmp_path: Path) -> None:
+    path = tmp_path / "definitions.snapshot"
+    save_snapshot(path)
+    path.write_bytes(path.read_bytes()[:-100])
+    run(
+        """
+        import sys
+        import qalculate
+        try:
+            qalculate.load_snapshot(sys.argv[1])
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("truncated snapshot was loaded")
+        """,
+        str(path),
+    )
+
+
+def test_not_a_snapshot(tmp_path: Path) -> None:
+    path = tmp_path / "definitions.snapshot"
+    path.write_bytes(b"<?xml version=\"1.0\"?>")
+    with pytest.raises(ValueError):
+        load_snapshot(path)
+
+
+def test_missing(tmp_path: Path) -> None:
+    with pytest.raises(FileNotFoundError):
+        load_snapshot(tmp_path / "missing.snapshot")
@@ -0,0 +1,55 @@
+import pytest
+from qalculate import MathStructure as S
+
+SparseMatrix = S.SparseMatrix
+
+
+def as_ints(matrix: S) -> list[list[int]]:
+    return [[int(x) for x in row] for row in matrix]
+
+
+def test_coo_round_trip() -> None:
+    matrix = SparseMatrix.from_coo((3, 4), [0, 2, 2, 0], [1, 3, 0, 1], [5, 6, 7, 1])
+    assert matrix.shape == (3, 4)
+    # duplicate entries are summed
+    assert matrix.nnz == 3
+    assert int(matrix[0, 1]) == 6
+    assert int(matrix[1, 1]) == 0
+
+    rows, cols, values = matrix.to_coo()
+    assert rows == [0, 2, 2]
+    assert cols == [1, 0, 3]
+    assert [int(x) for x in values] == [6, 7, 6]
+
+
+def test_element_access() -> None:
+    matrix = SparseMatrix(2, 2)
+    matrix[1, 0] = 3
+    matrix[0, 1] = 2
+    assert matrix.nnz == 2
+    matrix[0, 1] = 0
+    assert matrix.nnz == 1
+    assert as_ints(matrix.to_dense()) == [[0, 0], [3, 0]]
+    with pytest.raises(IndexError):
+        matrix[2, 0]
+
+
+def test_dense_round_trip() -> None:
+    dense = S([[0, 1], [2, 0]])
+    matrix = SparseMatrix.from_dense(dense)
+    assert matrix.nnz == 2
+    assert matrix.to_dense() == dense
+
+
+def test_arithmetic() -> None:
+    a = SparseMatrix.from_dense(S([[1, 0], [0, 2]]))
+    b = SparseMatrix.from_dense(S([[0, 3], [4, 0]]))
+    assert as_ints((a + b).to_dense()) == [[1, 3], [4, 2]]
+    assert as_ints((a @ b).to_dense()) == [[0, 3], [8, 0]]
+    assert [int(x) for x in a @ S([5, 6])] == [5, 12]
+    assert (a + SparseMatrix.from_dense(S([[-1, 0], [0, -2]]))).nnz == 0
+
+
+def test_implicit_densify() -> None:
+    matrix = SparseMatrix.from_dense(S([[0, 1], [2, 0]]))
+    assert S(matrix) == S([[0, 1], [2, 0]])
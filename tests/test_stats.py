@@ -0,0 +1,134 @@
+import math
+
+import pytest
+
+from qalculate import (
+    EvaluationOptions,
+    MathFunction,
+    MathStructure,
+    ParseOptions,
+    SlowCall,
+    calculate,
+    calculate_and_print,
+    calculate_batch,
+    calculate_ex,
+    get_stats_enabled,
+    parse,
+    reset_stats,
+    set_slow_call_hook,
+    set_stats_enabled,
+    stats,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats():
+    reset_stats()
+    yield
+    set_stats_enabled(True)
+
+
+def test_counts_calls() -> None:
+    parse("1 + 1")
+    calculate("2 * 3")
+    calculate_and_print("5 m/s to km/h")
+    calculate(MathStructure.Number(2)).print()
+
+    recorded = stats()
+    assert recorded["parse"].calls == 1
+    assert recorded["calculate"].calls == 2
+    assert recorded["calculate_and_print"].calls == 1
+    assert recorded["print"].calls == 1
+    for name in ("parse", "calculate", "calculate_and_print", "print"):
+        entry = recorded[name]
+        assert entry.total_time >= entry.max_time > 0
+        assert sum(entry.histogram.values()) == entry.calls
+    assert math.isinf(max(recorded["parse"].histogram))
+
+
+def test_gil_released_time() -> None:
+    calculate_and_print("factorial(500)")
+    entry = stats()["calculate_and_print"]
+    assert 0 < entry.gil_released_time <= entry.total_time
+
+
+def test_messages() -> None:
+    calculate_and_print("1/")
+    assert stats()["calculate_and_print"].messages >= 1
+
+
+def test_calculate_ex() -> None:
+    calculate_ex("1/")
+    calculate_batch(["1 + 1", "2 + 2"])
+    recorded = stats()
+    assert recorded["calculate_ex"].calls == 1
+    assert recorded["calculate_ex"].messages >= 1
+    assert recorded["calculate_batch"].calls == 1
+
+
+def test_function_calculate() -> None:
+    MathFunction.get("sin").calculate(MathStructure.Number(0))
+    assert stats()["MathFunction.calculate"].calls == 1
+
+
+def test_disabled_and_reset() -> None:
+    set_stats_enabled(False)
+    assert not get_stats_enabled()
+    calculate("1 + 1")
+    assert stats()["calculate"].calls == 0
+
+    set_stats_enabled(True)
+    calculate("1 + 1")
+    assert stats()["calculate"].calls == 1
+    reset_stats()
+    assert stats()["calculate"].calls == 0
+    assert "load_global_units" in stats()
+
+
+@pytest.fixture
+def slow_calls():
+    calls: list[SlowCall] = []
+    set_slow_call_hook(0, calls.append)
+    yield calls
+    set_slow_call_hook(None, None)
+
+
+def test_slow_call_hook(slow_calls: list[SlowCall]) -> None:
+    calculate("1/")
+    parse("2 * x")
+
+    assert [call.function for call in slow_calls] == ["calculate", "parse"]
+    assert slow_calls[0].input == "1/"
+    assert slow_calls[0].messages
+    assert isinstance(slow_calls[0].options, EvaluationOptions)
+    assert isinstance(slow_calls[1].options, ParseOptions)
+    assert all(call.duration >= 0 for call in slow_calls)
+
+    calculate(MathStructure.Number(2)).print()
+    assert slow_calls[-1].function == "print"
+    assert slow_calls[-1].input == "2"
+
+
+def test_slow_call_hook_threshold(slow_calls: list[SlowCall]) -> None:
+    set_slow_call_hook(60_000, slow_calls.append)
+    calculate("1 + 1")
+    assert not slow_calls
+
+
+def test_slow_call_hook_rate_limit() -> None:
+    calls: list[SlowCall] = []
+    set_slow_call_hook(0, calls.append, limit=2)
+    try:
+        for _ in range(5):
+            calculate("1 + 1")
+    finally:
+        set_slow_call_hook(None, None)
+    # The window may roll over in between, but not more than once.
+    assert 2 <= len(calls) <= 4
+
+
+def test_slow_call_hook_errors() -> None:
+    with pytest.raises(TypeError):
+        set_slow_call_hook(0, 1)  # type: ignore
+    with pytest.raises(ValueError):
+        set_slow_call_hook(-1, print)
@@ -27,3 +27,26 @@ def test_unit_statics_same_instances() -> None:
     assert Unit.DEGREE is parse_one("deg").unit
     assert Unit.RADIAN is parse_one("rad").unit
     assert Unit.GRADIAN is parse_one("gradian").unit
+
+
+def test_unit_get_many() -> None:
+    meter, missing, second = Unit.get_many(["m", "not a unit", "s"])
+    assert meter is Unit.get("meter")
+    assert missing is None
+    assert second is Unit.get("second")
+
+
+def test_unit_get_is_stable() -> None:
+    assert Unit.get("m") is Unit.get("m")
+
+
+def test_loaded_units() -> None:
+    units = list(Unit.loaded())
+    assert Unit.get("meter") in units
+    assert all(isinstance(unit, Unit) for unit in units)
+
+
+def test_unit_structure_repr() -> None:
+    unit = Unit.get("meter")
+    assert repr(unit) == "<Unit 'm'>"
+    assert repr(S.Unit(unit)) == f"MathStructure.Unit(unit={unit!r})"
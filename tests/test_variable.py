@@ -1,6 +1,7 @@
 import pytest
 from qalculate import (
     MathStructure,
+    calculate,
     parse,
     Variable,
     load_global_variables,
@@ -23,3 +24,25 @@ def test_builtin_variables(string: str, var_name: str) -> None:
     parsed = parse(string)
     assert isinstance(parsed, MathStructure.Variable)
     assert parsed.variable is Variable.get(var_name)
+
+
+def test_variable_get_many() -> None:
+    pi, missing = Variable.get_many(["pi", "not a variable"])
+    assert pi is Variable.get("pi")
+    assert missing is None
+
+
+def test_loaded_variables() -> None:
+    assert Variable.get("pi") in list(Variable.loaded())
+
+
+def test_variable_redefinition() -> None:
+    calculate('save(5, "cache_test_variable")')
+    first = Variable.get("cache_test_variable")
+    assert MathStructure.Variable(first).calculate() == MathStructure.Number(5)
+
+    # Defining another variable in between changes the loaded lists.
+    calculate('save(1, "cache_test_other")')
+    calculate('save(7, "cache_test_variable")')
+    second = Variable.get("cache_test_variable")
+    assert MathStructure.Variable(second).calculate() == MathStructure.Number(7)